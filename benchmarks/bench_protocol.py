@@ -0,0 +1,73 @@
+"""Benchmarks for building, parsing and encrypting the messages."""
+
+import json
+
+import pytest
+from construct import GreedyBytes
+
+from miio import protocol
+from miio.protocol import EncryptionAdapter, Message, MessageCodec, Utils
+
+from .common import TOKEN, create_message
+
+pytest.importorskip("pytest_benchmark")
+
+CODECS = {"construct": Message, "codec": MessageCodec}
+
+QUIRKS = {
+    "valid": b'{"id":1,"result":["ok"]}',
+    "double-comma": b'{"id":1,,"result":["ok"],"otu_stat":0}',
+    "trailing-null": b'{"id":1,"result":["ok"]}\x00k',
+    "empty-result": b'{"id":1,"result":,"exe_time":0}',
+    "leading-zero": b'{"id":1,"result":[{"value":00}]}',
+}
+
+
+@pytest.fixture(params=list(CODECS))
+def codec(request):
+    return CODECS[request.param]
+
+
+def test_build(benchmark, codec, payload):
+    msg = create_message(payload)
+    benchmark(codec.build, msg, token=TOKEN)
+
+
+def test_parse(benchmark, codec, payload):
+    data = MessageCodec.build(create_message(payload), token=TOKEN)
+    benchmark(codec.parse, data, token=TOKEN)
+
+
+def test_encrypt(benchmark, payload):
+    plaintext = json.dumps(payload).encode()
+    benchmark(Utils.encrypt, plaintext, TOKEN)
+
+
+def test_decrypt(benchmark, payload):
+    ciphertext = Utils.encrypt(json.dumps(payload).encode(), TOKEN)
+    benchmark(Utils.decrypt, ciphertext, TOKEN)
+
+
+@pytest.mark.parametrize("quirk", list(QUIRKS))
+def test_decode_quirks(benchmark, mocker, quirk):
+    """Decode payloads needing the quirk workarounds.
+
+    The quirk hint is cleared before every round to measure the worst case.
+    """
+    hints = mocker.patch.dict(protocol._QUIRK_HINTS, clear=True)
+    adapter = EncryptionAdapter(GreedyBytes)
+    ciphertext = Utils.encrypt(QUIRKS[quirk], TOKEN)
+    context = {"_": {"token": TOKEN}}
+
+    benchmark.pedantic(
+        adapter._decode,
+        args=(ciphertext, context, None),
+        setup=hints.clear,
+        rounds=1000,
+    )
+
+
+@pytest.mark.parametrize("quirk", list(QUIRKS))
+def test_decode_quirks_tolerant(benchmark, quirk):
+    ciphertext = Utils.encrypt(QUIRKS[quirk], TOKEN)
+    benchmark(protocol.decode_payload, ciphertext, TOKEN, tolerant=True)
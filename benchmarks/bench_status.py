@@ -0,0 +1,101 @@
+"""Benchmarks for creating device instances and their status containers."""
+
+import importlib
+import inspect
+import json
+import pkgutil
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+import miio.integrations
+from miio import DeviceFactory
+from miio.integrations.genericmiot.status import GenericMiotStatus
+from miio.miot_models import DeviceModel
+from miio.tests.dummies import DummyDevice
+
+pytest.importorskip("pytest_benchmark")
+
+MIOT_FIXTURES = Path(miio.__file__).parent / "tests" / "fixtures" / "miot"
+
+
+def _dummy_devices() -> dict[str, type[DummyDevice]]:
+    """Return the dummy devices defined in the integration tests."""
+    dummies = {}
+    for module_info in pkgutil.walk_packages(
+        miio.integrations.__path__, f"{miio.integrations.__name__}."
+    ):
+        if not module_info.name.rsplit(".", 1)[-1].startswith("test_"):
+            continue
+
+        module = importlib.import_module(module_info.name)
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, DummyDevice) and cls.__module__ == module.__name__:
+                dummies[name] = cls
+
+    return dummies
+
+
+DUMMY_DEVICES = _dummy_devices()
+
+
+@pytest.mark.parametrize(
+    "model",
+    ["zhimi.fan.za4", "roborock.vacuum.unknown", "unknown.model.v1"],
+    ids=["exact", "wildcard", "fallback"],
+)
+def test_class_for_model(benchmark, model):
+    benchmark(DeviceFactory.class_for_model, model)
+
+
+@pytest.mark.parametrize("name", sorted(DUMMY_DEVICES))
+def test_integration_status(benchmark, name):
+    """Create the status container from the state of the test dummy."""
+    try:
+        dev = DUMMY_DEVICES[name]()
+        dev.status()
+    except Exception as ex:
+        pytest.skip(f"Dummy cannot be created without test fixtures: {ex!r}")
+
+    benchmark(dev.status)
+
+
+def _create_spec(services: int) -> DeviceModel:
+    """Return a spec with the given number of services using the property fixtures."""
+    properties = [
+        json.loads(file.read_text()) for file in sorted(MIOT_FIXTURES.glob("*.json"))
+    ]
+    spec = {
+        "type": "urn:miot-spec-v2:device:benchmark:0000A000:dummy:1",
+        "description": "Benchmark device",
+        "services": [
+            {
+                "iid": siid,
+                "type": f"urn:miot-spec-v2:service:service-{siid}:00007801:dummy:1",
+                "description": f"Service {siid}",
+                "properties": [
+                    {**prop, "iid": piid}
+                    for piid, prop in enumerate(properties * 10, start=1)
+                ],
+            }
+            for siid in range(1, services + 1)
+        ],
+    }
+    return DeviceModel.parse_obj(spec)
+
+
+@pytest.mark.parametrize("services", [1, 10, 50])
+def test_genericmiot_status(benchmark, services):
+    model = _create_spec(services)
+    response = [
+        {"did": prop.name, "siid": serv.siid, "piid": prop.piid, "code": 0, "value": 1}
+        for serv in model.services
+        for prop in serv.properties
+    ]
+    dev = Mock(_miot_model=model)
+
+    def _status():
+        return GenericMiotStatus(response, dev).property_dict()
+
+    benchmark(_status)
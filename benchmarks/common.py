@@ -0,0 +1,26 @@
+"""Helpers for creating the benchmark inputs."""
+
+from datetime import UTC, datetime
+
+TOKEN = bytes.fromhex("00112233445566778899aabbccddeeff")
+TS = datetime(2024, 3, 13, 12, 0, 0, tzinfo=UTC)
+
+#: Number of property results in the payloads, the large one is about 10 kB
+PAYLOAD_SIZES = {"small": 1, "medium": 20, "large": 200}
+
+
+def create_payload(size: int) -> dict:
+    """Return a get_prop like response with the given number of results."""
+    return {
+        "id": 1,
+        "result": [
+            {"did": f"prop-{i}", "siid": 2, "piid": i, "code": 0, "value": i}
+            for i in range(size)
+        ],
+    }
+
+
+def create_message(payload) -> dict:
+    """Return the message container used for building."""
+    header = {"length": 0, "unknown": 0, "device_id": b"\x01\x02\x03\x04", "ts": TS}
+    return {"data": {"value": payload}, "header": {"value": header}, "checksum": 0}
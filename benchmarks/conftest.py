@@ -0,0 +1,9 @@
+import pytest
+
+from .common import PAYLOAD_SIZES, create_payload
+
+
+@pytest.fixture(params=list(PAYLOAD_SIZES))
+def payload(request):
+    """Return payloads of different sizes."""
+    return create_payload(PAYLOAD_SIZES[request.param])
@@ -15,6 +15,8 @@ from miio.exceptions import (
     DeviceException,
     UnsupportedFeatureException,
     DeviceInfoUnavailableException,
+    DeviceUnavailableException,
+    RequestCancelledException,
 )
 from miio.miot_device import MiotDevice
 from miio.deviceinfo import DeviceInfo
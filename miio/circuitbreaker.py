@@ -0,0 +1,119 @@
+"""Circuit breaker for failing fast on unreachable devices.
+
+Without a circuit breaker, every request to an unplugged device waits for the full
+timeout for each retry, and re-handshakes between the retries. With many devices
+polled in a loop, a single dead device stalls every polling cycle.
+
+The breaker opens after a number of consecutive failed requests, after which the
+requests fail immediately with :class:`~miio.exceptions.DeviceUnavailableException`.
+Once the reset timeout has passed, the breaker becomes half-open and the next request
+probes the device using a hello packet before sending the actual request. A
+successful probe closes the breaker, a failed one opens it again.
+"""
+
+import logging
+import threading
+from enum import Enum
+from time import monotonic
+
+from .exceptions import DeviceUnavailableException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    """State of the circuit breaker."""
+
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half-open"
+
+
+class CircuitBreaker:
+    """Track consecutive failures of a device and fail fast when it is offline.
+
+    ::
+
+        dev = Device(ip, token, circuit_breaker=CircuitBreaker(reset_timeout=60))
+    """
+
+    def __init__(self, failure_threshold: int = 2, reset_timeout: float = 30) -> None:
+        """Create a circuit breaker.
+
+        :param failure_threshold: Consecutive failed requests to open the breaker
+        :param reset_timeout: Seconds to fail fast before probing the device again
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        """Return the current state."""
+        if self._opened_at is None:
+            return CircuitState.Closed
+        if monotonic() - self._opened_at >= self.reset_timeout:
+            return CircuitState.HalfOpen
+
+        return CircuitState.Open
+
+    @property
+    def failures(self) -> int:
+        """Return the number of consecutive failures."""
+        return self._failures
+
+    def before_request(self) -> bool:
+        """Check if a request is allowed.
+
+        Only a single caller is let through to probe the device while half-open.
+
+        :return: True if the device needs to be probed before sending the request.
+        :raises DeviceUnavailableException: if the breaker is open.
+        """
+        with self._lock:
+            state = self.state
+            if state == CircuitState.Closed:
+                return False
+            if state == CircuitState.HalfOpen and not self._probing:
+                self._probing = True
+                return True
+
+            retry_in = max(self._opened_at + self.reset_timeout - monotonic(), 0)  # type: ignore[operator]
+
+        raise DeviceUnavailableException(
+            f"Device is unavailable after {self._failures} failed requests, "
+            f"retrying in {retry_in:.0f}s"
+        )
+
+    def record_success(self) -> None:
+        """Close the breaker after the device has responded."""
+        with self._lock:
+            if self._opened_at is not None:
+                _LOGGER.info("Device is available again, closing the circuit")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def cancel_probe(self) -> None:
+        """Let the next caller probe the device after an unfinished probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        """Count a failed request and open the breaker if needed."""
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    _LOGGER.warning(
+                        "Device failed %s consecutive requests, opening the circuit",
+                        self._failures,
+                    )
+                self._opened_at = monotonic()
+
+    def __repr__(self) -> str:
+        return f"<CircuitBreaker state={self.state.value} failures={self._failures}>"
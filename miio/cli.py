@@ -10,7 +10,7 @@ from miio.click_common import (
     GlobalContextObject,
     json_output,
 )
-from miio.miioprotocol import MiIOProtocol
+from miio.miioprotocol import SWEEP_RATE, MiIOProtocol
 
 from .cloud import cloud
 from .devicefactory import factory
@@ -62,12 +62,22 @@ for device_class in DeviceGroupMeta._device_classes:
 @click.command()
 @click.option("--mdns/--no-mdns", default=True, is_flag=True)
 @click.option("--handshake/--no-handshake", default=True, is_flag=True)
-@click.option("--network", default=None)
+@click.option(
+    "--network",
+    default=None,
+    help="Address to send the handshake to, or a network (e.g., 10.0.0.0/22) to sweep",
+)
 @click.option("--timeout", type=int, default=5)
-def discover(mdns, handshake, network, timeout):
+@click.option(
+    "--rate",
+    type=int,
+    default=SWEEP_RATE,
+    help="Maximum packets per second when sweeping a network",
+)
+def discover(mdns, handshake, network, timeout, rate):
     """Discover devices using both handshake and mdns methods."""
     if handshake:
-        MiIOProtocol.discover(addr=network, timeout=timeout)
+        MiIOProtocol.discover(addr=network, timeout=timeout, rate=rate)
     if mdns:
         Discovery.discover_mdns(timeout=timeout)
 
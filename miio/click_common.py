@@ -14,7 +14,7 @@ from typing import Any, ClassVar
 
 import click
 
-from .device_cache import read_cache, write_cache
+from .device_cache import StateStore
 from .exceptions import DeviceError
 
 try:
@@ -268,17 +268,18 @@ class DeviceGroup(click.MultiCommand):
         if gco:
             kwargs["debug"] = gco.debug
 
-        ip = kwargs.get("ip")
-        if ip:
-            cached = read_cache(ip)
-            kwargs.setdefault("start_id", cached["seq"])
-
         ctx.obj = self.device_class(*args, **kwargs)
 
+        ip = kwargs.get("ip")
         if ip:
+            store = StateStore(id_block_size=10)
+            store.migrate_json_cache(ip)
+            # an explicitly given start id is used as is, but still persisted
+            ctx.obj.use_state_store(store, reserve_ids="start_id" not in kwargs)
 
             def _save_cache() -> None:
-                write_cache(ip, {"seq": ctx.obj.raw_id})
+                ctx.obj.save_state()
+                store.close()
 
             ctx.call_on_close(_save_cache)
 
@@ -1,23 +1,43 @@
+import asyncio
 import logging
+from collections.abc import Callable
+from concurrent.futures import Future
 from enum import Enum
-from typing import Any, final
+from functools import partial
+from typing import Any, TypeVar, final
 
 import click
 
+from .circuitbreaker import CircuitBreaker
 from .click_common import DeviceGroupMeta, LiteralParamType, command
 from .descriptorcollection import DescriptorCollection
 from .descriptors import AccessFlags, ActionDescriptor, Descriptor, PropertyDescriptor
+from .device_cache import StateStore, handshake_from_state
 from .deviceinfo import DeviceInfo
 from .devicestatus import DeviceStatus
 from .exceptions import (
     DeviceError,
+    DeviceException,
     DeviceInfoUnavailableException,
+    DeviceUnavailableException,
     PayloadDecodeException,
+    RequestCancelledException,
 )
-from .miioprotocol import MiIOProtocol
+from .executor import SerialExecutor
+from .metrics import DeviceMetrics, MetricsRegistry
+from .miioprotocol import AsyncMiIOProtocol, ReplayProtocol, _is_unanswered
+from .recording import Recorder, Replay
+from .response_cache import MISSING, ResponseCache
+from .scheduler import RequestScheduler
+from .transport import SharedTransport
 
 _LOGGER = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+#: Errors aborting the whole get_properties call instead of a single slice
+_ABORT_ERRORS = (RequestCancelledException, DeviceUnavailableException)
+
 
 class UpdateState(Enum):
     Downloading = "downloading"
@@ -36,8 +56,22 @@ class Device(metaclass=DeviceGroupMeta):
 
     retry_count = 3
     timeout = 5
+    #: How many requests can be sent without waiting for the responses,
+    #: integrations can raise this for devices known to handle concurrent requests.
+    max_in_flight = 1
+    #: Derive the response timeout from the measured round-trip times, using
+    #: :attr:`timeout` as the upper limit.
+    adaptive_timeout = False
+    #: Fix malformed responses in a single pass instead of trying the known quirks
+    #: one by one, useful for devices sending large malformed payloads.
+    tolerant_decoding = False
     _mappings: dict[str, Any] = {}
     _supported_models: list[str] = []
+    _executor: SerialExecutor | None = None
+    _scheduler: RequestScheduler | None = None
+    _response_cache: ResponseCache | None = None
+    _state_store: StateStore | None = None
+    _reserves_ids: bool = False
 
     def __init_subclass__(cls, **kwargs):
         """Overridden to register all integrations to the factory."""
@@ -58,6 +92,15 @@ class Device(metaclass=DeviceGroupMeta):
         *,
         model: str | None = None,
         handshake_timeout: int | None = None,
+        transport: SharedTransport | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        executor: SerialExecutor | None = None,
+        scheduler: RequestScheduler | None = None,
+        response_cache: ResponseCache | None = None,
+        metrics: MetricsRegistry | None = None,
+        port: int = 54321,
+        recorder: Recorder | None = None,
+        replay: Replay | None = None,
     ) -> None:
         self.ip = ip
         self.token: str | None = token
@@ -68,15 +111,37 @@ class Device(metaclass=DeviceGroupMeta):
         self._descriptors: DescriptorCollection = DescriptorCollection(device=self)
         timeout = timeout if timeout is not None else self.timeout
         self._debug = debug
-        self._protocol = MiIOProtocol(
-            ip,
-            token,
-            start_id,
-            debug,
-            lazy_discover,
-            timeout,
-            handshake_timeout=handshake_timeout,
-        )
+        self._executor = executor
+        self._scheduler = scheduler
+        self._response_cache = response_cache
+        if replay is not None:
+            self._protocol: AsyncMiIOProtocol = ReplayProtocol(
+                replay,
+                ip,
+                token,
+                timeout=timeout,
+                max_in_flight=self.max_in_flight,
+                metrics=metrics,
+                port=port,
+            )
+        else:
+            self._protocol = AsyncMiIOProtocol(
+                ip,
+                token,
+                start_id,
+                debug,
+                lazy_discover,
+                timeout,
+                handshake_timeout=handshake_timeout,
+                transport=transport,
+                max_in_flight=self.max_in_flight,
+                adaptive_timeout=self.adaptive_timeout,
+                tolerant_decoding=self.tolerant_decoding,
+                metrics=metrics,
+                port=port,
+                circuit_breaker=circuit_breaker,
+                recorder=recorder,
+            )
 
     def send(
         self,
@@ -101,15 +166,152 @@ class Device(metaclass=DeviceGroupMeta):
         :param dict extra_parameters: Extra top-level parameters
         :param str model: Force model to avoid autodetection
         """
+        cache = self._response_cache
+        if cache is not None:
+            cached = cache.get(command, parameters, extra_parameters)
+            if cached is not MISSING:
+                return cached
+
+        if self._executor is not None and not self._executor.in_worker(self):
+            return self.submit(
+                self.send,
+                command,
+                parameters,
+                retry_count,
+                extra_parameters=extra_parameters,
+            ).result()
+
         retry_count = retry_count if retry_count is not None else self.retry_count
-        return self._protocol.send(
-            command, parameters, retry_count, extra_parameters=extra_parameters
-        )
+        try:
+            if self._scheduler is not None:
+                result = self._scheduler.run(
+                    self._protocol.send,
+                    command,
+                    parameters,
+                    retry_count,
+                    extra_parameters=extra_parameters,
+                )
+            else:
+                result = self._protocol.send(
+                    command, parameters, retry_count, extra_parameters=extra_parameters
+                )
+        finally:
+            if cache is not None and not cache.is_cacheable(command):
+                cache.invalidate()
+
+        if cache is not None:
+            cache.put(command, parameters, extra_parameters, result)
+
+        return result
+
+    def submit(self, fn: Callable[..., T], /, *args, **kwargs) -> "Future[T]":
+        """Schedule `fn(*args, **kwargs)` on the request queue of this device.
+
+        The calls submitted for a device are executed one at a time, which allows
+        sharing the device between threads. This requires passing an executor
+        when creating the device, see :class:`miio.executor.SerialExecutor`.
+
+        Example::
+
+            future = dev.submit(dev.get_properties, ["power", "mode"])
+
+        :raises ValueError: if the device has no executor.
+        """
+        if self._executor is None:
+            raise ValueError("No executor configured for the device")
+
+        return self._executor.submit(self, fn, *args, **kwargs)
 
     def send_handshake(self):
         """Send initial handshake to the device."""
         return self._protocol.send_handshake()
 
+    async def async_send(
+        self,
+        command: str,
+        parameters: Any | None = None,
+        retry_count: int | None = None,
+        *,
+        extra_parameters=None,
+    ) -> Any:
+        """Send a command to the device using asyncio.
+
+        See :func:`send` for the parameters.
+        """
+        cache = self._response_cache
+        if cache is not None:
+            cached = cache.get(command, parameters, extra_parameters)
+            if cached is not MISSING:
+                return cached
+
+        retry_count = retry_count if retry_count is not None else self.retry_count
+        try:
+            if self._scheduler is not None:
+                result = await self._scheduler.async_run(
+                    self._protocol.async_send,
+                    command,
+                    parameters,
+                    retry_count,
+                    extra_parameters=extra_parameters,
+                )
+            else:
+                result = await self._protocol.async_send(
+                    command, parameters, retry_count, extra_parameters=extra_parameters
+                )
+        finally:
+            if cache is not None and not cache.is_cacheable(command):
+                cache.invalidate()
+
+        if cache is not None:
+            cache.put(command, parameters, extra_parameters, result)
+
+        return result
+
+    async def async_send_handshake(self):
+        """Send initial handshake to the device using asyncio."""
+        return await self._protocol.async_send_handshake()
+
+    def use_state_store(self, store: StateStore, *, reserve_ids: bool = True) -> None:
+        """Keep the connection state of the device in the given store.
+
+        The stored handshake is restored, and the sequence ids are taken from the
+        blocks reserved in the store, so several processes can talk to the device
+        without reusing each other's ids. Use :func:`save_state` to write the state
+        back to the store.
+
+        :param store: Store shared with the other processes
+        :param reserve_ids: Reserve the sequence ids from the store, disable to keep
+            using the ids starting from `start_id`
+        :raises ValueError: if the device has no IP address.
+        """
+        if self.ip is None:
+            raise ValueError("Device has no IP address to store the state for")
+
+        self._state_store = store
+        self._reserves_ids = reserve_ids
+        if reserve_ids:
+            self._protocol.use_id_blocks(partial(store.reserve_ids, self.ip))
+
+        handshake = handshake_from_state(store.load(self.ip))
+        if handshake is not None:
+            self._protocol.restore_handshake(handshake)
+
+    def save_state(self) -> None:
+        """Write the connection state to the store given to :func:`use_state_store`.
+
+        The handshake is written on the next :meth:`StateStore.flush`. The sequence
+        id is written right away unless the ids are reserved from the store.
+
+        :raises ValueError: if the device has no state store.
+        """
+        store = self._state_store
+        if store is None or self.ip is None:
+            raise ValueError("No state store configured for the device")
+
+        if not self._reserves_ids:
+            store.save_seq(self.ip, self.raw_id)
+        store.save_handshake(self.ip, self._protocol.handshake_state)
+
     @command(
         click.argument("command", type=str, required=True),
         click.argument("parameters", type=LiteralParamType(), required=False),
@@ -139,19 +341,38 @@ class Device(metaclass=DeviceGroupMeta):
 
         return self._fetch_info()
 
+    async def async_info(self, *, skip_cache=False) -> DeviceInfo:
+        """Get (and cache) miIO protocol information from the device using asyncio.
+
+        See :func:`info`.
+        """
+        if self._info is not None and not skip_cache:
+            return self._info
+
+        try:
+            return self._store_info(await self.async_send("miIO.info"))
+        except PayloadDecodeException as ex:
+            raise DeviceInfoUnavailableException(
+                "Unable to request miIO.info from the device"
+            ) from ex
+
     def _fetch_info(self) -> DeviceInfo:
         """Perform miIO.info query on the device and cache the result."""
         try:
-            devinfo = DeviceInfo(self.send("miIO.info"))
-            self._info = devinfo
-            _LOGGER.debug("Detected model %s", devinfo.model)
-
-            return devinfo
+            return self._store_info(self.send("miIO.info"))
         except PayloadDecodeException as ex:
             raise DeviceInfoUnavailableException(
                 "Unable to request miIO.info from the device"
             ) from ex
 
+    def _store_info(self, response) -> DeviceInfo:
+        """Cache the device info from miIO.info response."""
+        devinfo = DeviceInfo(response)
+        self._info = devinfo
+        _LOGGER.debug("Detected model %s", devinfo.model)
+
+        return devinfo
+
     def _initialize_descriptors(self) -> None:
         """Initialize the device descriptors.
 
@@ -188,6 +409,16 @@ class Device(metaclass=DeviceGroupMeta):
         """Return the last used protocol sequence id."""
         return self._protocol.raw_id
 
+    @property
+    def circuit_breaker(self) -> CircuitBreaker | None:
+        """Return the circuit breaker tracking the availability, if enabled."""
+        return self._protocol.circuit_breaker
+
+    @property
+    def metrics(self) -> DeviceMetrics | None:
+        """Return the protocol metrics for the device, if collected."""
+        return self._protocol.metrics
+
     @property
     def supported_models(self) -> list[str]:
         """Return a list of supported models."""
@@ -237,20 +468,231 @@ class Device(metaclass=DeviceGroupMeta):
         properties can be queried at once.
 
         If `max_properties` is None, all properties are requested at once.
+        For devices allowing multiple requests in flight (see :attr:`max_in_flight`),
+        the slices are sent without waiting for the previous responses, unless the
+        scheduler limits the request rate.
+
+        The values of the slices that could not be fetched are replaced with
+        placeholders (see :func:`_property_placeholder`) to avoid losing the whole
+        status due to a single failed request. The error is raised if no slice was
+        received, or right away if the device does not respond to the first slice.
+        Once the device stops responding, the remaining slices are not sent but
+        replaced with placeholders. Cancelled requests (see
+        :class:`miio.scheduler.RequestScheduler`) and requests to an unavailable
+        device (see :class:`miio.circuitbreaker.CircuitBreaker`) are always raised.
 
         :param list properties: List of properties to query from the device.
         :param int max_properties: Number of properties that can be requested at once.
         :return: List of property values.
         """
-        _props = properties.copy()
-        values = []
-        while _props:
-            values.extend(self.send(property_getter, _props[:max_properties]))
-            if max_properties is None:
-                break
+        slices = self._property_slices(properties, max_properties)
+        if self._can_pipeline(slices):
+            responses = self._send_many([(property_getter, props) for props in slices])
+        else:
+            responses = []
+            for props in slices:
+                # avoid waiting for each slice to time out if the device is gone
+                if responses and _is_unanswered(responses[-1]):
+                    responses.append(responses[-1])
+                    continue
+                try:
+                    responses.append(self.send(property_getter, props))
+                except _ABORT_ERRORS:
+                    raise
+                except DeviceException as ex:
+                    if not responses and _is_unanswered(ex):
+                        raise
+                    responses.append(ex)
+
+        values = self._merge_slices(slices, responses)
+        self._check_properties_count(properties, values)
+
+        return values
+
+    async def async_get_properties(
+        self, properties, *, property_getter="get_prop", max_properties=None
+    ):
+        """Request properties in slices based on given max_properties using asyncio.
+
+        See :func:`get_properties`.
+        """
+        slices = self._property_slices(properties, max_properties)
+        if self._can_pipeline(slices):
+            responses = await self._async_send_many(
+                [(property_getter, props) for props in slices]
+            )
+        else:
+            responses = []
+            for props in slices:
+                if responses and _is_unanswered(responses[-1]):
+                    responses.append(responses[-1])
+                    continue
+                try:
+                    responses.append(await self.async_send(property_getter, props))
+                except _ABORT_ERRORS:
+                    raise
+                except DeviceException as ex:
+                    if not responses and _is_unanswered(ex):
+                        raise
+                    responses.append(ex)
+
+        values = self._merge_slices(slices, responses)
+        self._check_properties_count(properties, values)
+
+        return values
+
+    def _can_pipeline(self, slices: list[list]) -> bool:
+        """Return True if the slices can be sent without waiting for the responses.
+
+        Pipelining would exceed the rate limit of the scheduler, so the slices are
+        sent one by one in that case.
+        """
+        if self.max_in_flight <= 1 or len(slices) <= 1:
+            return False
+
+        return self._scheduler is None or self._scheduler.rate is None
+
+    def _send_many(self, requests: list[tuple[str, Any]]) -> list:
+        """Send the requests pipelined, returning the errors in place of results.
+
+        This goes through the same response cache, executor and scheduler as
+        :func:`send`. The batch is sent during a single turn of the scheduler, so
+        requests with a higher priority wait until all of its slices are answered.
+        """
+        responses = self._cached_responses(requests)
+        missing = [idx for idx, res in enumerate(responses) if res is MISSING]
+        if not missing:
+            return responses
+
+        if self._executor is not None and not self._executor.in_worker(self):
+            return self.submit(self._send_many, requests).result()
+
+        batch = [requests[idx] for idx in missing]
+        try:
+            if self._scheduler is not None:
+                results = self._scheduler.run(
+                    self._protocol.send_many,
+                    batch,
+                    self.retry_count,
+                    return_exceptions=True,
+                )
+            else:
+                results = self._protocol.send_many(
+                    batch, self.retry_count, return_exceptions=True
+                )
+        finally:
+            self._invalidate_cache(batch)
+
+        return self._fill_responses(responses, missing, batch, results)
+
+    async def _async_send_many(self, requests: list[tuple[str, Any]]) -> list:
+        """Send the requests concurrently using asyncio, see :func:`_send_many`."""
+        responses = self._cached_responses(requests)
+        missing = [idx for idx, res in enumerate(responses) if res is MISSING]
+        if not missing:
+            return responses
+
+        batch = [requests[idx] for idx in missing]
+        try:
+            if self._scheduler is not None:
+                results = await self._scheduler.async_run(
+                    self._protocol.async_send_many,
+                    batch,
+                    self.retry_count,
+                    return_exceptions=True,
+                )
+            else:
+                results = await self._protocol.async_send_many(
+                    batch, self.retry_count, return_exceptions=True
+                )
+        finally:
+            self._invalidate_cache(batch)
+
+        return self._fill_responses(responses, missing, batch, results)
+
+    def _cached_responses(self, requests: list[tuple[str, Any]]) -> list:
+        """Return the cached responses for the requests, MISSING for the others."""
+        cache = self._response_cache
+        if cache is None:
+            return [MISSING] * len(requests)
+
+        return [cache.get(method, params) for method, params in requests]
+
+    def _invalidate_cache(self, requests: list[tuple[str, Any]]) -> None:
+        """Clear the response cache if any of the requests may change the state."""
+        cache = self._response_cache
+        if cache is not None and not all(cache.is_cacheable(m) for m, _ in requests):
+            cache.invalidate()
+
+    def _fill_responses(
+        self,
+        responses: list,
+        missing: list[int],
+        requests: list[tuple[str, Any]],
+        results: list,
+    ) -> list:
+        """Fill in the received results and add them to the response cache."""
+        cache = self._response_cache
+        for idx, (method, params), result in zip(
+            missing, requests, results, strict=True
+        ):
+            responses[idx] = result
+            if cache is not None and not isinstance(result, BaseException):
+                cache.put(method, params, None, result)
+
+        return responses
+
+    @staticmethod
+    def _property_slices(properties, max_properties) -> list[list]:
+        """Split the properties to slices of at most max_properties."""
+        if max_properties is None:
+            return [list(properties)]
+
+        return [
+            properties[idx : idx + max_properties]
+            for idx in range(0, len(properties), max_properties)
+        ]
+
+    def _merge_slices(self, slices: list[list], responses: list) -> list:
+        """Return the values of the slices in the order of the properties.
+
+        :raises DeviceException: if none of the slices was received.
+        """
+        errors = [res for res in responses if isinstance(res, BaseException)]
+        if errors and len(errors) == len(responses):
+            raise errors[0]
+
+        for error in errors:
+            if isinstance(error, _ABORT_ERRORS):
+                raise error
+
+        values: list[Any] = []
+        for props, response in zip(slices, responses, strict=True):
+            if isinstance(response, DeviceException):
+                _LOGGER.warning("Unable to get properties %s: %s", props, response)
+                values.extend(self._property_placeholder(p, response) for p in props)
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                values.extend(response)
+
+        return values
 
-            _props[:] = _props[max_properties:]
+    @staticmethod
+    def _property_placeholder(prop, error: DeviceException) -> Any:
+        """Return the value used for a property that could not be fetched.
 
+        This is None for miio properties. For miot properties, this is an error
+        response for the requested property to keep the did, siid and piid.
+        """
+        if not isinstance(prop, dict):
+            return None
+
+        code = getattr(error, "code", None)
+        return {**prop, "code": code if isinstance(code, int) else -1}
+
+    def _check_properties_count(self, properties, values) -> None:
+        """Log if the number of received values does not match the request."""
         properties_count = len(properties)
         values_count = len(values)
         if properties_count != values_count:
@@ -261,13 +703,26 @@ class Device(metaclass=DeviceGroupMeta):
                 values_count,
             )
 
-        return values
-
     @command()
     def status(self) -> DeviceStatus:
         """Return device status."""
         raise NotImplementedError()
 
+    async def async_status(self) -> DeviceStatus:
+        """Return device status using asyncio.
+
+        .. note::
+
+            Only :class:`~miio.integrations.genericmiot.genericmiot.GenericMiot`
+            implements this natively. For all other devices, the blocking
+            :func:`status` is run in the default executor, occupying one of its
+            threads until the device responds.
+
+        Integrations can override this to build the status using the asyncio
+        methods (e.g., :func:`async_get_properties`).
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.status)
+
     @command()
     def descriptors(self) -> DescriptorCollection[Descriptor]:
         """Return a collection containing all descriptors for the device."""
@@ -3,16 +3,31 @@
 Persists the miIO protocol message sequence counter between CLI invocations.
 Without this, restarting the CLI resets the counter to 0, and devices ignore
 messages with sequence IDs they've already seen, causing timeouts.
+
+The handshake state is persisted as well, which allows skipping the handshake
+on the first request while the cached handshake is still valid.
+
+:class:`StateStore` keeps the state of all devices in a single SQLite database,
+which can be shared by multiple processes. The sequence ids are handed out in
+blocks, so processes talking to the same device never reuse each other's ids.
+The per-device JSON files (:func:`read_cache`, :func:`write_cache`) are kept for
+backwards compatibility, and their state is migrated to the store on first use
+(see :func:`StateStore.migrate_json_cache`).
 """
 
 import hashlib
 import json
 import logging
+import sqlite3
+import threading
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
-from typing import TypedDict
+from typing import NotRequired, TypedDict
 
 from platformdirs import user_cache_dir
 
+from .miioprotocol import MAX_ID, HandshakeState
+
 _LOGGER = logging.getLogger(__name__)
 
 CACHE_DIR = Path(user_cache_dir("python-miio"))
@@ -24,9 +39,17 @@ class DeviceState(TypedDict):
     seq: The miIO protocol message sequence counter. Each message sent to a
     device increments this counter, and the device tracks seen IDs to
     deduplicate. Persisting it avoids ID reuse across CLI invocations.
+
+    device_id: The device id from the last handshake, as a hex string.
+    ts_offset: Difference between the device timestamp and the local clock in
+    seconds, used to extrapolate the device timestamp.
+    last_handshake: Unix timestamp of the last handshake.
     """
 
     seq: int
+    device_id: NotRequired[str]
+    ts_offset: NotRequired[float]
+    last_handshake: NotRequired[float]
 
 
 def _cache_path(ip: str) -> Path:
@@ -45,13 +68,25 @@ def read_cache(ip: str) -> DeviceState:
         data = json.loads(path.read_text())
         seq = int(data["seq"])
         _LOGGER.debug("Loaded cache for %s: seq=%d", ip, seq)
-        return DeviceState(seq=seq)
+        state = DeviceState(seq=seq)
     except FileNotFoundError:
         return DeviceState(seq=0)
     except (json.JSONDecodeError, KeyError, TypeError, ValueError) as ex:
         _LOGGER.warning("Corrupt cache for %s, ignoring: %s", ip, ex)
         return DeviceState(seq=0)
 
+    try:
+        if "device_id" in data:
+            bytes.fromhex(data["device_id"])
+            state["device_id"] = data["device_id"]
+            state["ts_offset"] = float(data["ts_offset"])
+            state["last_handshake"] = float(data["last_handshake"])
+    except (KeyError, TypeError, ValueError) as ex:
+        _LOGGER.warning("Corrupt handshake cache for %s, ignoring: %s", ip, ex)
+        return DeviceState(seq=seq)
+
+    return state
+
 
 def write_cache(ip: str, state: DeviceState) -> None:
     """Write connection state to cache for a device."""
@@ -59,3 +94,254 @@ def write_cache(ip: str, state: DeviceState) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(json.dumps(state))
     _LOGGER.debug("Wrote cache for %s: %s", ip, state)
+
+
+def handshake_from_state(state: DeviceState) -> HandshakeState | None:
+    """Return the cached handshake state, if any."""
+    if "device_id" not in state:
+        return None
+
+    return HandshakeState(
+        device_id=bytes.fromhex(state["device_id"]),
+        ts_offset=timedelta(seconds=state["ts_offset"]),
+        last_handshake=datetime.fromtimestamp(state["last_handshake"], tz=UTC),
+    )
+
+
+def state_for(seq: int, handshake: HandshakeState | None) -> DeviceState:
+    """Return the state to cache for the given sequence id and handshake."""
+    state = DeviceState(seq=seq)
+    if handshake is not None:
+        state["device_id"] = handshake.device_id.hex()
+        state["ts_offset"] = handshake.ts_offset.total_seconds()
+        state["last_handshake"] = handshake.last_handshake.timestamp()
+
+    return state
+
+
+class StateStore:
+    """Connection state of many devices stored in a single SQLite database.
+
+    The database uses write-ahead logging, so multiple processes can read and
+    write it concurrently. Sequence ids are reserved atomically in blocks using
+    :func:`reserve_ids`, and handshake updates are written in batches. Devices use
+    the store through :meth:`miio.device.Device.use_state_store`::
+
+        with StateStore() as store:
+            dev.use_state_store(store)
+            ...
+            dev.save_state()
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS devices (
+            ip TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL DEFAULT 0,
+            device_id TEXT,
+            ts_offset REAL,
+            last_handshake REAL
+        )
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        *,
+        id_block_size: int = 100,
+        batch_size: int = 100,
+    ) -> None:
+        """Open the store, creating it if needed.
+
+        :param path: Database file, defaults to ``state.sqlite3`` in the cache directory
+        :param id_block_size: Number of sequence ids to reserve at once
+        :param batch_size: Number of pending handshake updates to write at once
+        """
+        self.path = path if path is not None else CACHE_DIR / "state.sqlite3"
+        self.id_block_size = id_block_size
+        self.batch_size = batch_size
+        self._pending: dict[str, HandshakeState] = {}
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(self.SCHEMA)
+
+    def load(self, ip: str) -> DeviceState:
+        """Return the stored state for a device."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq, device_id, ts_offset, last_handshake "
+                "FROM devices WHERE ip = ?",
+                (ip,),
+            ).fetchone()
+            pending = self._pending.get(ip)
+
+        return self._to_state(row, pending)
+
+    def load_all(self) -> dict[str, DeviceState]:
+        """Return the stored state for all devices."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ip, seq, device_id, ts_offset, last_handshake FROM devices"
+            ).fetchall()
+            pending = dict(self._pending)
+
+        states = {
+            row[0]: self._to_state(row[1:], pending.pop(row[0], None)) for row in rows
+        }
+        for ip, handshake in pending.items():
+            states[ip] = self._to_state(None, handshake)
+
+        return states
+
+    def migrate_json_cache(self, ip: str) -> bool:
+        """Seed the state of a device from its per-device JSON cache file.
+
+        Nothing is done if the device is already in the store, so the ids reserved
+        from the store are never handed out again.
+
+        :return: True if the state was migrated
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM devices WHERE ip = ?", (ip,)
+            ).fetchone()
+        if row is not None or not _cache_path(ip).exists():
+            return False
+
+        state = read_cache(ip)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO devices "
+                "(ip, seq, device_id, ts_offset, last_handshake) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    ip,
+                    state["seq"],
+                    state.get("device_id"),
+                    state.get("ts_offset"),
+                    state.get("last_handshake"),
+                ),
+            )
+
+        migrated = cursor.rowcount == 1
+        if migrated:
+            _LOGGER.debug("Migrated cached state for %s: %s", ip, state)
+        return migrated
+
+    def reserve_ids(self, ip: str, count: int | None = None) -> range:
+        """Atomically reserve a block of sequence ids for a device.
+
+        The ids wrap around like the protocol's sequence ids do.
+        """
+        count = count if count is not None else self.id_block_size
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT seq FROM devices WHERE ip = ?", (ip,)
+                ).fetchone()
+                start = (row[0] if row is not None else 0) + 1
+                if start + count > MAX_ID:
+                    start = 1
+                self._conn.execute(
+                    "INSERT INTO devices (ip, seq) VALUES (?, ?) "
+                    "ON CONFLICT(ip) DO UPDATE SET seq = excluded.seq",
+                    (ip, start + count - 1),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        _LOGGER.debug("Reserved ids %s-%s for %s", start, start + count - 1, ip)
+        return range(start, start + count)
+
+    def save_seq(self, ip: str, seq: int) -> None:
+        """Write the last used sequence id of a device not reserving id blocks."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO devices (ip, seq) VALUES (?, ?) "
+                "ON CONFLICT(ip) DO UPDATE SET seq = excluded.seq",
+                (ip, seq),
+            )
+
+        _LOGGER.debug("Wrote seq %s for %s", seq, ip)
+
+    def save_handshake(self, ip: str, handshake: HandshakeState | None) -> None:
+        """Queue the handshake state to be written on the next :func:`flush`."""
+        if handshake is None:
+            return
+
+        with self._lock:
+            self._pending[ip] = handshake
+            should_flush = len(self._pending) >= self.batch_size
+
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the pending handshake updates in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+
+            rows = [
+                (
+                    ip,
+                    handshake.device_id.hex(),
+                    handshake.ts_offset.total_seconds(),
+                    handshake.last_handshake.timestamp(),
+                )
+                for ip, handshake in self._pending.items()
+            ]
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO devices (ip, device_id, ts_offset, last_handshake) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT(ip) DO UPDATE SET "
+                    "device_id = excluded.device_id, "
+                    "ts_offset = excluded.ts_offset, "
+                    "last_handshake = excluded.last_handshake",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            self._pending.clear()
+
+        _LOGGER.debug("Wrote handshake state for %s devices", len(rows))
+
+    def close(self) -> None:
+        """Write the pending updates and close the database."""
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self) -> "StateStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def _to_state(row, pending: HandshakeState | None) -> DeviceState:
+        if row is None:
+            state = DeviceState(seq=0)
+        else:
+            seq, device_id, ts_offset, last_handshake = row
+            state = DeviceState(seq=seq)
+            if device_id is not None:
+                state["device_id"] = device_id
+                state["ts_offset"] = ts_offset
+                state["last_handshake"] = last_handshake
+
+        if pending is not None:
+            state = state_for(state["seq"], pending)
+
+        return state
@@ -15,6 +15,7 @@ from .descriptors import (
     PropertyDescriptor,
     RangeDescriptor,
 )
+from .hooks import Phase, timed
 from .identifiers import StandardIdentifier
 
 _LOGGER = logging.getLogger(__name__)
@@ -43,6 +44,11 @@ class _StatusMeta(type):
 
         return cls
 
+    def __call__(cls, *args, **kwargs):
+        """Overridden to report the construction time to the phase hooks."""
+        with timed(Phase.Status):
+            return super().__call__(*args, **kwargs)
+
 
 class DeviceStatus(metaclass=_StatusMeta):
     """Base class for status containers.
@@ -12,7 +12,7 @@ except ImportError:
     echo = click.echo
 
 
-from miio import Message
+from miio.protocol import MessageCodec
 
 
 def read_payloads_from_file(file, tokens: list[str]):
@@ -49,7 +49,7 @@ def read_payloads_from_file(file, tokens: list[str]):
         decrypted = None
         for token in tokens:
             try:
-                decrypted = Message.parse(data, token=bytes.fromhex(token))
+                decrypted = MessageCodec.parse(data, token=bytes.fromhex(token))
                 break
             except BaseException:  # noqa: B036, S112
                 continue
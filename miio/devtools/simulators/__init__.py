@@ -1,4 +1,5 @@
+from .farm import simulator_farm
 from .miiosimulator import miio_simulator
 from .miotsimulator import miot_simulator
 
-__all__ = ["miio_simulator", "miot_simulator"]
+__all__ = ["miio_simulator", "miot_simulator", "simulator_farm"]
@@ -0,0 +1,212 @@
+"""Run a fleet of simulated devices on a single event loop.
+
+This is useful for load testing and benchmarking the communication with a large
+number of devices without having access to them.
+"""
+
+import asyncio
+import ipaddress
+import logging
+from collections.abc import Callable
+
+import attr
+import click
+from yaml import safe_load
+
+from miio import PushServer
+from miio.push_server.server import SERVER_PORT
+
+from .common import create_info_response, did_and_mac_for_model
+from .impairment import Impairment, impair, normal
+from .miiosimulator import MiioSimulator, SimulatedMiio
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Called with the server and the index of each simulated device to add its methods
+SetupCallback = Callable[[PushServer, int], None]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class SimulatedDevice:
+    """Address and identity of a simulated device."""
+
+    ip: str
+    port: int
+    device_id: int
+    server: PushServer = attr.ib(repr=False, eq=False)
+    impairment: Impairment | None = attr.ib(default=None, repr=False, eq=False)
+
+
+class SimulatorFarm:
+    """Simulate multiple devices, each using its own push server.
+
+    By default, all devices listen on 127.0.0.1 using free ports chosen by the OS,
+    so the clients need to be given the port of the device::
+
+        async with SimulatorFarm(100, setup) as farm:
+            for device in farm.devices:
+                dev = Device(device.ip, 32 * "0", port=device.port)
+
+    With `unique_addresses`, each device uses the default port on its own loopback
+    address starting from 127.0.0.2. This requires the whole 127.0.0.0/8 network to
+    be routed to the loopback interface, which is the default on Linux.
+
+    When an `impairment` is given, each device uses its own copy of it to simulate
+    an unreliable network, see :mod:`miio.devtools.simulators.impairment`.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        setup: SetupCallback | None = None,
+        *,
+        model: str = "simulated.device.v1",
+        unique_addresses: bool = False,
+        impairment: Impairment | None = None,
+    ) -> None:
+        """Create a farm.
+
+        :param count: Number of devices to simulate
+        :param setup: Callback for adding the methods to each device
+        :param model: Model reported by miIO.info
+        :param unique_addresses: Use own loopback address for each device
+        :param impairment: Network conditions to simulate for each device
+        """
+        self.count = count
+        self.model = model
+        self.unique_addresses = unique_addresses
+        self._setup = setup
+        self._impairment = impairment
+        self._devices: list[SimulatedDevice] = []
+
+    @property
+    def devices(self) -> list[SimulatedDevice]:
+        """Return the running devices."""
+        return list(self._devices)
+
+    def _address_for(self, index: int) -> tuple[str, int]:
+        if self.unique_addresses:
+            return str(ipaddress.IPv4Address("127.0.0.2") + index), SERVER_PORT
+
+        return "127.0.0.1", 0
+
+    async def start(self) -> list[SimulatedDevice]:
+        """Start the simulated devices."""
+        base_id, mac = did_and_mac_for_model(self.model)
+        for index in range(self.count):
+            ip, port = self._address_for(index)
+            device_id = (base_id + index) % 2**32
+            server = PushServer(device_id=device_id, address=ip, port=port)
+            server.add_method("miIO.info", create_info_response(self.model, ip, mac))
+            if self._setup is not None:
+                self._setup(server, index)
+
+            try:
+                _, protocol = await server.start()
+            except OSError:
+                await self.stop()
+                raise
+
+            impairment = None
+            if self._impairment is not None:
+                impairment = self._impairment.clone(index)
+                impair(protocol, impairment)
+
+            self._devices.append(
+                SimulatedDevice(ip, server.server_port, device_id, server, impairment)
+            )
+
+        _LOGGER.info("Started %s simulated devices", len(self._devices))
+        return self.devices
+
+    async def stop(self) -> None:
+        """Stop all simulated devices."""
+        devices, self._devices = self._devices, []
+        for device in devices:
+            await device.server.stop()
+
+    async def __aenter__(self) -> "SimulatorFarm":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+
+def miio_setup(dev: SimulatedMiio) -> SetupCallback:
+    """Return a setup callback simulating the given miio device description.
+
+    Each simulated device gets its own copy of the description to keep their states
+    independent.
+    """
+
+    def _setup(server: PushServer, index: int) -> None:
+        copy = dev.copy(deep=True)
+        copy._model = dev._model
+        MiioSimulator(dev=copy, server=server)
+
+    return _setup
+
+
+@click.command()
+@click.option("--file", type=click.File("r"), required=True)
+@click.option("--model", type=str, required=False)
+@click.option("--count", type=int, default=10, show_default=True)
+@click.option(
+    "--unique-addresses",
+    is_flag=True,
+    help="Use own loopback address for each device instead of own port",
+)
+@click.option("--latency", type=float, default=0, help="Mean latency in seconds")
+@click.option("--jitter", type=float, default=0, help="Latency stddev in seconds")
+@click.option("--loss", type=float, default=0, help="Packet loss probability")
+@click.option("--duplicate", type=float, default=0, help="Duplication probability")
+@click.option("--reorder", type=float, default=0, help="Reordering probability")
+@click.option("--outage-interval", type=float, help="Go silent every N seconds")
+@click.option("--outage-duration", type=float, default=0, help="Outage length")
+@click.option("--seed", type=int, help="Random seed for reproducible impairments")
+def simulator_farm(
+    file,
+    model,
+    count,
+    unique_addresses,
+    latency,
+    jitter,
+    loss,
+    duplicate,
+    reorder,
+    outage_interval,
+    outage_duration,
+    seed,
+):
+    """Simulate multiple miio devices."""
+    dev = SimulatedMiio.parse_obj(safe_load(file.read()))
+    dev._model = model if model is not None else next(iter(dev.models)).model
+
+    impairment = None
+    if latency or jitter or loss or duplicate or reorder or outage_interval:
+        impairment = Impairment(
+            latency=normal(latency, jitter) if jitter else latency,
+            loss=loss,
+            duplicate=duplicate,
+            reorder=reorder,
+            outage_interval=outage_interval,
+            outage_duration=outage_duration,
+            seed=seed,
+        )
+
+    farm = SimulatorFarm(
+        count,
+        miio_setup(dev),
+        model=dev._model,
+        unique_addresses=unique_addresses,
+        impairment=impairment,
+    )
+
+    loop = asyncio.get_event_loop()
+    for device in loop.run_until_complete(farm.start()):
+        click.echo(f"{device.ip}:{device.port} (device id: {device.device_id})")
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(farm.stop())
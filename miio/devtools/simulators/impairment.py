@@ -0,0 +1,187 @@
+"""Network impairment injection for the simulated devices.
+
+The impairments are applied to the datagrams sent by a simulated device, so from the
+client's point of view a lost response cannot be distinguished from a lost request.
+This allows reproducing bad network conditions to see how the retries and the
+handshakes of :class:`miio.miioprotocol.MiIOProtocol` behave::
+
+    impairment = Impairment(latency=normal(0.05, 0.02), loss=0.1, seed=1)
+    async with SimulatorFarm(10, setup, impairment=impairment) as farm:
+        farm.devices[0].impairment.silence(5)
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from collections.abc import Callable
+from random import Random
+from time import monotonic
+from typing import Any
+
+import attr
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Returns the latency in seconds using the given random generator
+Latency = Callable[[Random], float]
+
+
+def constant(value: float) -> Latency:
+    """Return a latency distribution always returning the given value."""
+    return lambda rng: value
+
+
+def uniform(low: float, high: float) -> Latency:
+    """Return a latency distribution uniformly distributed between low and high."""
+    return lambda rng: rng.uniform(low, high)
+
+
+def normal(mean: float, stddev: float) -> Latency:
+    """Return a normally distributed latency distribution, clamped to zero."""
+    return lambda rng: max(0.0, rng.gauss(mean, stddev))
+
+
+def exponential(mean: float) -> Latency:
+    """Return an exponentially distributed latency distribution."""
+    return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+
+
+@attr.s(auto_attribs=True)
+class Impairment:
+    """Network conditions of a simulated device.
+
+    :param latency: Delay in seconds, or a distribution returning it
+    :param loss: Probability of dropping a datagram
+    :param duplicate: Probability of sending a datagram twice
+    :param reorder: Probability of holding a datagram back for `reorder_delay`
+    :param outage_interval: Go silent periodically every given seconds
+    :param outage_duration: Length of the periodic outages in seconds
+    :param seed: Seed for the random generator to make the runs reproducible
+    """
+
+    latency: float | Latency = 0.0
+    loss: float = 0.0
+    duplicate: float = 0.0
+    reorder: float = 0.0
+    reorder_delay: float = 0.05
+    outage_interval: float | None = None
+    outage_duration: float = 0.0
+    seed: int | None = None
+    stats: Counter = attr.ib(factory=Counter, init=False)
+    _random: Random = attr.ib(init=False)
+    _started: float = attr.ib(init=False)
+    _silent_until: float = attr.ib(default=0.0, init=False)
+
+    @_random.default
+    def _create_random(self) -> Random:
+        return Random(self.seed)  # noqa: S311
+
+    @_started.default
+    def _now(self) -> float:
+        return monotonic()
+
+    def clone(self, index: int) -> "Impairment":
+        """Return a copy with its own state, e.g., for another simulated device.
+
+        The seed is offset by the index to avoid identical behavior between devices.
+        """
+        seed = self.seed + index if self.seed is not None else None
+        return attr.evolve(self, seed=seed)
+
+    def silence(self, duration: float) -> None:
+        """Drop all datagrams for the given number of seconds."""
+        self._silent_until = monotonic() + duration
+
+    @property
+    def is_silent(self) -> bool:
+        """Return True if the device is currently not responding."""
+        now = monotonic()
+        if now < self._silent_until:
+            return True
+
+        if self.outage_interval:
+            elapsed = (now - self._started) % self.outage_interval
+            return elapsed >= self.outage_interval - self.outage_duration
+
+        return False
+
+    def delays(self) -> list[float]:
+        """Return the delays for sending the copies of a datagram.
+
+        An empty list means that the datagram is dropped.
+        """
+        if self.is_silent:
+            self.stats["silenced"] += 1
+            return []
+
+        rng = self._random
+        if rng.random() < self.loss:
+            self.stats["dropped"] += 1
+            return []
+
+        copies = 1
+        if rng.random() < self.duplicate:
+            self.stats["duplicated"] += 1
+            copies = 2
+
+        delays = []
+        for _ in range(copies):
+            delay = self.latency(rng) if callable(self.latency) else self.latency
+            if rng.random() < self.reorder:
+                self.stats["reordered"] += 1
+                delay += self.reorder_delay
+            delays.append(delay)
+
+        self.stats["sent"] += copies
+        return delays
+
+
+class ImpairedTransport:
+    """Datagram transport wrapper applying the impairment to the sent datagrams."""
+
+    def __init__(
+        self, transport: asyncio.DatagramTransport, impairment: Impairment
+    ) -> None:
+        self._transport = transport
+        self.impairment = impairment
+        self._handles: set[asyncio.TimerHandle] = set()
+
+    def sendto(self, data: bytes, addr: Any = None) -> None:
+        """Send the datagram, possibly delayed, duplicated or not at all."""
+        for delay in self.impairment.delays():
+            if delay <= 0:
+                self._transport.sendto(data, addr)
+                continue
+
+            loop = asyncio.get_running_loop()
+            handle = loop.call_later(delay, self._send_delayed, data, addr)
+            self._handles.add(handle)
+
+    def _send_delayed(self, data: bytes, addr: Any) -> None:
+        now = asyncio.get_running_loop().time()
+        self._handles = {h for h in self._handles if h.when() > now}
+        if self._transport.is_closing():
+            return
+
+        self._transport.sendto(data, addr)
+
+    def close(self) -> None:
+        """Cancel the delayed datagrams and close the transport."""
+        for handle in self._handles:
+            handle.cancel()
+        self._handles.clear()
+        self._transport.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._transport, name)
+
+
+def impair(protocol: Any, impairment: Impairment) -> ImpairedTransport:
+    """Apply the impairment to the responses of a started push server.
+
+    :param protocol: Protocol returned by :meth:`miio.PushServer.start`
+    """
+    transport = ImpairedTransport(protocol.transport, impairment)
+    protocol.transport = transport
+    _LOGGER.debug("Applied %s", impairment)
+    return transport
@@ -42,5 +42,20 @@ class UnsupportedFeatureException(DeviceException):
     """Exception communicating that the device does not support the wanted feature."""
 
 
+class DeviceUnavailableException(DeviceException):
+    """Exception raised when the device is known to be unreachable.
+
+    This is raised without contacting the device while the circuit breaker of the
+    device is open, see :class:`miio.circuitbreaker.CircuitBreaker`.
+    """
+
+
+class RequestCancelledException(DeviceException):
+    """Exception raised when a queued request was cancelled before being sent.
+
+    See :class:`miio.scheduler.RequestScheduler`.
+    """
+
+
 class CloudException(Exception):
     """Exception raised for cloud connectivity issues."""
@@ -0,0 +1,127 @@
+"""Executor serializing the requests per device.
+
+The protocol state of a device (sequence id, handshake) must not be modified by
+multiple threads at once, but there is no reason to serialize the requests to
+unrelated devices. :class:`SerialExecutor` runs the submitted callables on a thread
+pool while guaranteeing that the callables for a single device are executed one at
+a time, ordered by their :func:`miio.scheduler.request_priority` and then by the
+order of submission.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import Context, copy_context
+from typing import Any, TypeVar
+
+from .scheduler import current_priority
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_WorkItem = tuple[int, int, Future, Context, Callable[..., Any], tuple, dict]
+
+
+class SerialExecutor:
+    """Thread pool running the submitted callables serially per key.
+
+    Devices given an executor use it to serialize their requests, which allows
+    sharing them between threads::
+
+        executor = SerialExecutor(max_workers=8)
+        dev = Device(ip, token, executor=executor)
+        future = dev.submit(dev.status)
+    """
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="miio-device"
+        )
+        self._queues: dict[Hashable, list[_WorkItem]] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shutdown = False
+
+    def submit(
+        self, key: Hashable, fn: Callable[..., T], /, *args, **kwargs
+    ) -> "Future[T]":
+        """Schedule `fn(*args, **kwargs)` to be run after the earlier calls for key.
+
+        The callable is run in a copy of the current context, so the request priority
+        set by the caller applies to it. Queued calls with a higher priority are run
+        before the ones with a lower priority.
+
+        :raises RuntimeError: if the executor has been shut down.
+        """
+        future: Future[T] = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+
+            queue = self._queues.get(key)
+            start_worker = queue is None
+            if queue is None:
+                queue = self._queues[key] = []
+            heapq.heappush(
+                queue,
+                (
+                    current_priority(),
+                    next(self._counter),
+                    future,
+                    copy_context(),
+                    fn,
+                    args,
+                    kwargs,
+                ),
+            )
+
+        if start_worker:
+            self._pool.submit(self._drain, key)
+
+        return future
+
+    def in_worker(self, key: Hashable) -> bool:
+        """Return True if called from a callable running for the given key."""
+        return getattr(self._local, "key", None) is key
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting new calls, the queued ones are still executed."""
+        with self._lock:
+            self._shutdown = True
+
+        self._pool.shutdown(wait=wait)
+
+    def _drain(self, key: Hashable) -> None:
+        """Run the queued calls for the key until the queue is empty."""
+        self._local.key = key
+        try:
+            while True:
+                with self._lock:
+                    queue = self._queues[key]
+                    if not queue:
+                        del self._queues[key]
+                        return
+                    _, _, future, context, fn, args, kwargs = heapq.heappop(queue)
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    result = context.run(fn, *args, **kwargs)
+                except BaseException as ex:
+                    future.set_exception(ex)
+                else:
+                    future.set_result(result)
+        finally:
+            self._local.key = None
+
+    def __enter__(self) -> "SerialExecutor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
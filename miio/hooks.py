@@ -0,0 +1,99 @@
+"""Timing hooks for the phases of sending a request.
+
+Hooks registered with :func:`add_phase_hook` are called after each phase of a request
+with the phase, its start time as given by :func:`time.perf_counter`, and its
+duration in seconds. This allows plugging in tracing or profiling without patching
+the library::
+
+    def print_phase(phase: Phase, start: float, duration: float):
+        print(f"{phase.value}: {duration * 1000:.3f}ms")
+
+    remove = add_phase_hook(print_phase)
+    dev.status()
+    remove()
+
+When no hooks are registered, the phases are not timed at all.
+
+Note that when using a shared transport, the responses are decrypted and decoded
+by the reader thread of the transport, so those phases are reported from there.
+"""
+
+import logging
+from collections.abc import Callable
+from contextlib import AbstractContextManager, nullcontext
+from enum import Enum
+from time import perf_counter
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Phase(Enum):
+    """Phases of sending a request and handling its response."""
+
+    #: Creating the request payload and the message header
+    Build = "build"
+    #: Serializing the request payload to JSON
+    Encode = "encode"
+    #: Encrypting the request payload
+    Encrypt = "encrypt"
+    #: Sending the request
+    Send = "send"
+    #: Waiting for the response
+    Wait = "wait"
+    #: Decrypting the response payload
+    Decrypt = "decrypt"
+    #: Deserializing the response payload from JSON
+    Decode = "decode"
+    #: Creating a status container from the response
+    Status = "status"
+
+
+PhaseHook = Callable[[Phase, float, float], None]
+
+# replaced instead of modified to allow iterating without locking
+_HOOKS: tuple[PhaseHook, ...] = ()
+_NO_TIMING = nullcontext()
+
+
+def add_phase_hook(hook: PhaseHook) -> Callable[[], None]:
+    """Register a hook called after each phase.
+
+    :return: Callable to remove the hook
+    """
+    global _HOOKS
+    _HOOKS = (*_HOOKS, hook)
+
+    return lambda: remove_phase_hook(hook)
+
+
+def remove_phase_hook(hook: PhaseHook) -> None:
+    """Remove a registered hook."""
+    global _HOOKS
+    _HOOKS = tuple(h for h in _HOOKS if h is not hook)
+
+
+class _PhaseTimer:
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase: Phase) -> None:
+        self.phase = phase
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        duration = perf_counter() - self.start
+        for hook in _HOOKS:
+            try:
+                hook(self.phase, self.start, duration)
+            except Exception:
+                _LOGGER.exception("Phase hook %s failed", hook)
+
+
+def timed(phase: Phase) -> AbstractContextManager[None]:
+    """Return a context manager reporting the duration of the phase to the hooks."""
+    if not _HOOKS:
+        return _NO_TIMING
+
+    return _PhaseTimer(phase)
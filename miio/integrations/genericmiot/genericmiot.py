@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from functools import partial
 
@@ -70,6 +71,20 @@ class GenericMiot(MiotDevice):
 
         return GenericMiotStatus(response, self)
 
+    async def async_status(self) -> GenericMiotStatus:
+        """Return status based on the miot model using asyncio."""
+        if not self._initialized:
+            # initializing requires fetching the model information from the cloud
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._initialize_descriptors
+            )
+
+        response = await self.async_get_properties(
+            self._status_query, property_getter="get_properties", max_properties=10
+        )
+
+        return GenericMiotStatus(response, self)
+
     def _create_action(self, act: MiotAction) -> ActionDescriptor | None:
         """Create action descriptor for miot action."""
         desc = act.get_descriptor()
@@ -0,0 +1,215 @@
+"""Metrics for the communication with the devices.
+
+:class:`MetricsRegistry` collects the protocol level metrics for each device using it,
+such as the request counts, the round-trip times and the errors::
+
+    registry = MetricsRegistry()
+    dev = Device(ip, token, metrics=registry)
+    dev.status()
+
+    print(dev.metrics.rtt.quantile(0.95))
+    print(registry.export_prometheus())
+
+The metrics can be exported in the Prometheus text format for scraping.
+"""
+
+import bisect
+import threading
+from collections import Counter
+
+import attr
+
+#: Upper bounds of the round-trip time buckets, in seconds
+RTT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Histogram with fixed buckets, like used by Prometheus."""
+
+    def __init__(self, buckets: tuple[float, ...] = RTT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        # the last bucket counts the values over the largest bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a value to the histogram."""
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """Return the cumulative count for each bucket bound, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(
+            (*self.buckets, float("inf")), self._counts, strict=True
+        ):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate the quantile using linear interpolation within the bucket.
+
+        Values over the largest bucket bound are reported as the largest bound.
+        Returns None if there are no values.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        lower, below = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if bound == float("inf"):
+                    return self.buckets[-1]
+                in_bucket = total - below
+                return lower + (bound - lower) * (rank - below) / in_bucket
+
+            lower, below = bound, total
+
+        return self.buckets[-1]
+
+
+@attr.s(auto_attribs=True)
+class DeviceMetrics:
+    """Protocol metrics for a single device."""
+
+    device: str
+    #: Number of sent requests per method, including retries
+    requests: Counter = attr.ib(factory=Counter)
+    rtt: Histogram = attr.ib(factory=Histogram)
+    retries: int = 0
+    timeouts: int = 0
+    handshakes: int = 0
+    checksum_errors: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False)
+
+    def record_request(self, method: str, size: int) -> None:
+        with self._lock:
+            self.requests[method] += 1
+            self.bytes_sent += size
+
+    def record_response(self, size: int) -> None:
+        with self._lock:
+            self.bytes_received += size
+
+    def record_rtt(self, rtt: float) -> None:
+        with self._lock:
+            self.rtt.observe(rtt)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Increment the counter with the given name, e.g., timeouts."""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def summary(self) -> dict:
+        """Return the metrics as a dictionary."""
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "rtt": {
+                    "count": self.rtt.count,
+                    "sum": self.rtt.sum,
+                    "p50": self.rtt.quantile(0.5),
+                    "p95": self.rtt.quantile(0.95),
+                    "p99": self.rtt.quantile(0.99),
+                },
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "handshakes": self.handshakes,
+                "checksum_errors": self.checksum_errors,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+            }
+
+
+_COUNTERS = [
+    ("retries", "Number of retried requests"),
+    ("timeouts", "Number of requests without a response in time"),
+    ("handshakes", "Number of completed handshakes"),
+    ("checksum_errors", "Number of responses with an invalid checksum"),
+    ("bytes_sent", "Number of bytes sent"),
+    ("bytes_received", "Number of bytes received"),
+]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    pairs = (f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+class MetricsRegistry:
+    """Registry for the metrics of multiple devices."""
+
+    def __init__(self, prefix: str = "miio") -> None:
+        self.prefix = prefix
+        self._devices: dict[str, DeviceMetrics] = {}
+        self._lock = threading.Lock()
+
+    def device(self, name: str) -> DeviceMetrics:
+        """Return the metrics for the given device, creating them if needed."""
+        with self._lock:
+            if name not in self._devices:
+                self._devices[name] = DeviceMetrics(name)
+
+            return self._devices[name]
+
+    @property
+    def devices(self) -> dict[str, DeviceMetrics]:
+        """Return the metrics for all devices."""
+        with self._lock:
+            return dict(self._devices)
+
+    def summary(self) -> dict[str, dict]:
+        """Return the metrics of all devices as a dictionary."""
+        return {name: metrics.summary() for name, metrics in self.devices.items()}
+
+    def export_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        devices = sorted(self.devices.items())
+        lines = []
+
+        name = f"{self.prefix}_requests_total"
+        lines += [
+            f"# HELP {name} Number of requests sent, including retries",
+            f"# TYPE {name} counter",
+        ]
+        for device, metrics in devices:
+            with metrics._lock:
+                requests = sorted(metrics.requests.items())
+            for method, count in requests:
+                lines.append(f"{name}{_labels(device=device, method=method)} {count}")
+
+        for counter, description in _COUNTERS:
+            name = f"{self.prefix}_{counter}_total"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for device, metrics in devices:
+                value = getattr(metrics, counter)
+                lines.append(f"{name}{_labels(device=device)} {value}")
+
+        name = f"{self.prefix}_rtt_seconds"
+        lines += [
+            f"# HELP {name} Round-trip time of the requests",
+            f"# TYPE {name} histogram",
+        ]
+        for device, metrics in devices:
+            with metrics._lock:
+                buckets = metrics.rtt.cumulative()
+                total, count = metrics.rtt.sum, metrics.rtt.count
+            for bound, value in buckets:
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{name}_bucket{_labels(device=device, le=le)} {value}")
+            lines.append(f"{name}_sum{_labels(device=device)} {total}")
+            lines.append(f"{name}_count{_labels(device=device)} {count}")
+
+        return "\n".join(lines) + "\n"
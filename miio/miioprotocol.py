@@ -1,29 +1,99 @@
 """miIO protocol implementation.
 
 This module contains the implementation of routines to send handshakes, send commands
-and discover devices (MiIOProtocol).
+and discover devices (MiIOProtocol), an asyncio-based variant of the same
+(AsyncMiIOProtocol), and a variant serving recorded responses (ReplayProtocol).
 """
 
+import asyncio
 import binascii
 import codecs
+import ipaddress
 import logging
+import math
+import selectors
 import socket
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
 from datetime import UTC, datetime, timedelta
 from pprint import pformat as pf
 from typing import Any
 
+import attr
 import construct
 
+from .circuitbreaker import CircuitBreaker
 from .exceptions import (
     DeviceError,
     DeviceException,
+    DeviceUnavailableException,
     InvalidTokenException,
+    PayloadDecodeException,
     RecoverableError,
 )
-from .protocol import Message
+from .hooks import Phase, timed
+from .metrics import DeviceMetrics, MetricsRegistry
+from .protocol import Message, MessageCodec, receive_buffer
+from .recording import Recorder, Replay
+from .rtt import RTTEstimator
+from .transport import SharedTransport
 
 _LOGGER = logging.getLogger(__name__)
 
+# magic, length 32
+HELO_BYTES = bytes.fromhex(
+    "21310020ffffffffffffffffffffffffffffffffffffffffffffffffffffffff"
+)
+
+#: Default packet rate for network sweeps
+SWEEP_RATE = 2000
+
+#: Sequence ids wrap around before reaching this value
+MAX_ID = 9999
+
+#: How long a restored handshake is valid when no handshake timeout is set
+RESTORED_HANDSHAKE_MAX_AGE = timedelta(hours=1)
+
+# checksums used by the devices not exposing their token in the handshake
+_HIDDEN_TOKENS = (bytes(16), b"\xff" * 16)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class DiscoveredDevice:
+    """Device found using the handshake discovery."""
+
+    ip: str
+    device_id: int
+    ts: datetime
+    #: The token, only exposed by devices that have not been provisioned yet
+    token: bytes | None = None
+
+    @classmethod
+    def from_message(cls, ip: str, m: Any) -> "DiscoveredDevice":
+        """Create an instance from a handshake response."""
+        header = m.header.value
+        token = m.checksum if m.checksum not in _HIDDEN_TOKENS else None
+        return cls(
+            ip=ip,
+            device_id=int.from_bytes(header.device_id, byteorder="big"),
+            ts=header.ts,
+            token=token,
+        )
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class HandshakeState:
+    """Handshake state that can be persisted to skip the initial handshake."""
+
+    device_id: bytes
+    #: Difference between the device timestamp and the local clock
+    ts_offset: timedelta
+    last_handshake: datetime
+
 
 class MiIOProtocol:
     def __init__(
@@ -36,6 +106,14 @@ class MiIOProtocol:
         timeout: int = 5,
         *,
         handshake_timeout: int | None = None,
+        transport: SharedTransport | None = None,
+        max_in_flight: int = 1,
+        adaptive_timeout: bool = False,
+        circuit_breaker: CircuitBreaker | None = None,
+        tolerant_decoding: bool = False,
+        metrics: MetricsRegistry | None = None,
+        port: int = 54321,
+        recorder: Recorder | None = None,
     ) -> None:
         """Create a :class:`Device` instance.
 
@@ -53,15 +131,46 @@ class MiIOProtocol:
         :param handshake_timeout: How many seconds can pass before a new handshake
             is needed. Set to 0 to handshake before every request. When not set,
             falls back to the lazy_discover behavior for backward compatibility.
+        :param transport: Shared transport to use instead of creating a new socket
+            for each request, see :class:`miio.transport.SharedTransport`.
+        :param max_in_flight: How many requests can be sent to the device without
+            waiting for the responses, see :func:`send_many`. Defaults to 1 as some
+            devices do not handle concurrent requests.
+        :param adaptive_timeout: If True, the response timeout is derived from the
+            measured round-trip times instead of always waiting for `timeout`,
+            which is then used as the upper limit.
+        :param circuit_breaker: Circuit breaker to fail fast while the device is
+            unreachable, see :class:`miio.circuitbreaker.CircuitBreaker`.
+        :param tolerant_decoding: If True, malformed responses are fixed in a single
+            pass instead of trying the known quirks one by one, see
+            :func:`miio.protocol.decode_payload`.
+        :param metrics: Registry to collect the metrics for the device to, see
+            :class:`miio.metrics.MetricsRegistry`.
+        :param port: UDP port of the device, only needed for simulated devices.
+        :param recorder: Recorder to record the sent commands and their responses
+            to, see :class:`miio.recording.Recorder`.
         """
         self.ip = ip
-        self.port = 54321
+        self.port = port
         if token is None:
             token = 32 * "0"
         self.token = bytes.fromhex(token)
         self.debug = debug
         self._timeout = timeout
         self.__id = start_id
+        self._transport = transport
+        self.max_in_flight = max_in_flight
+        self._rtt: RTTEstimator | None = (
+            RTTEstimator(timeout) if adaptive_timeout else None
+        )
+        self._circuit_breaker = circuit_breaker
+        self._tolerant = tolerant_decoding
+        self._recorder = recorder
+        self._metrics: DeviceMetrics | None = None
+        if metrics is not None:
+            # devices behind the same address are told apart by the port
+            name = (ip or "") if port == 54321 else f"{ip}:{port}"
+            self._metrics = metrics.device(name)
 
         if handshake_timeout is not None:
             self._handshake_timeout: timedelta | None = timedelta(
@@ -77,6 +186,15 @@ class MiIOProtocol:
         # these come from the device, but we initialize them here to make mypy happy
         self._device_ts: datetime = datetime.now(tz=UTC)
         self._device_id = b""
+        self._ts_offset: timedelta | None = None
+        self._reserve_ids: Callable[[], range] | None = None
+        # protects the sequence id and the handshake state
+        self._lock = threading.RLock()
+        self._handshake_lock = threading.Lock()
+        self._handshake_attempt = 0
+        self._handshake_error: DeviceException | None = None
+        self._handshake_task: asyncio.Future | None = None
+        self._id_block = range(0)
 
     def send_handshake(self, *, retry_count=3) -> Message:
         """Send a handshake to the device.
@@ -90,23 +208,61 @@ class MiIOProtocol:
         :raises DeviceException: if the device could not be discovered after retries.
         """
         try:
-            m = MiIOProtocol.discover(self.ip)
+            m = MiIOProtocol.discover(
+                self.ip, transport=self._transport, port=self.port
+            )
         except DeviceException as ex:
             if retry_count > 0:
                 return self.send_handshake(retry_count=retry_count - 1)
 
             raise ex
 
+        return self._handle_handshake(m)
+
+    def _ensure_handshake(self) -> None:
+        """Handshake, sharing the result with concurrent callers.
+
+        Only a single handshake is done at a time. Callers waiting for an ongoing
+        handshake use its outcome instead of sending their own.
+
+        :raises DeviceException: if the handshake failed.
+        """
+        attempt = self._handshake_attempt
+        with self._handshake_lock:
+            if self._handshake_attempt == attempt and not self._needs_handshake():
+                # another caller finished the handshake before the attempt was read
+                _LOGGER.debug("Handshake already done by a concurrent caller")
+                return
+
+            if self._handshake_attempt == attempt:
+                try:
+                    self.send_handshake()
+                    self._handshake_error = None
+                except DeviceException as ex:
+                    self._handshake_error = ex
+                finally:
+                    self._handshake_attempt += 1
+            else:
+                _LOGGER.debug("Reusing the handshake done by a concurrent caller")
+
+            if self._handshake_error is not None:
+                raise self._handshake_error
+
+    def _handle_handshake(self, m: Any) -> Message:
+        """Store the device information from a handshake response."""
         if m is None:
             _LOGGER.debug("Unable to discover a device at address %s", self.ip)
             raise DeviceException(f"Unable to discover the device {self.ip}")
 
         header = m.header.value
-        self._device_id = header.device_id
-        self._device_ts = header.ts
-        self._discovered = True
-        self._last_handshake = datetime.now(tz=UTC)
+        with self._lock:
+            self._device_id = header.device_id
+            self._device_ts = header.ts
+            self._discovered = True
+            self._last_handshake = datetime.now(tz=UTC)
+            self._ts_offset = self._device_ts - self._last_handshake
 
+        self._count("handshakes")
         if self.debug > 1:
             _LOGGER.debug(m)
         _LOGGER.debug(
@@ -118,6 +274,136 @@ class MiIOProtocol:
 
         return m
 
+    @property
+    def circuit_breaker(self) -> CircuitBreaker | None:
+        """Return the circuit breaker, if enabled."""
+        return self._circuit_breaker
+
+    def _check_availability(self) -> bool:
+        """Check the circuit breaker before sending a request.
+
+        :return: True if the device needs to be probed first.
+        :raises DeviceUnavailableException: if the circuit breaker is open.
+        """
+        if self._circuit_breaker is None:
+            return False
+
+        return self._circuit_breaker.before_request()
+
+    @contextmanager
+    def _track_availability(self, record_success: bool = True):
+        """Report the outcome of the wrapped request to the circuit breaker.
+
+        Error responses and invalid tokens count as successes, as the device did
+        respond to the request.
+
+        :param record_success: Record a success if nothing is raised, disable to
+            let the caller decide based on the returned results
+        """
+        breaker = self._circuit_breaker
+        if breaker is None:
+            yield
+            return
+
+        try:
+            yield
+        except (DeviceError, InvalidTokenException):
+            breaker.record_success()
+            raise
+        except DeviceException:
+            breaker.record_failure()
+            raise
+
+        if record_success:
+            breaker.record_success()
+
+    def _probe(self) -> None:
+        """Probe the device with a hello packet before letting requests through.
+
+        A response doubles as a handshake for the following request.
+
+        :raises DeviceUnavailableException: if the device does not respond.
+        """
+        with self._probing():
+            m = MiIOProtocol.discover(
+                self.ip,
+                self._attempt_timeout(0),
+                transport=self._transport,
+                port=self.port,
+            )
+            self._handle_probe(m)
+
+    @contextmanager
+    def _probing(self):
+        """Report the outcome of the wrapped probe to the circuit breaker.
+
+        Failing to probe opens the breaker again, while an interrupted probe, e.g.,
+        due to a cancellation, lets the next caller probe instead.
+        """
+        breaker = self._circuit_breaker
+        assert breaker is not None  # noqa: S101
+        try:
+            yield
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.cancel_probe()
+            raise
+
+        breaker.record_success()
+
+    def _handle_probe(self, m: Any) -> None:
+        """Use the probe response as a handshake.
+
+        :raises DeviceUnavailableException: if the device did not respond.
+        """
+        if m is None:
+            raise DeviceUnavailableException(
+                f"Device {self.ip} did not respond to the probe"
+            )
+
+        self._handle_handshake(m)
+
+    @property
+    def handshake_state(self) -> HandshakeState | None:
+        """Return the state of the last handshake, None if not handshaked."""
+        if not self._discovered or self._ts_offset is None:
+            return None
+
+        return HandshakeState(
+            device_id=self._device_id,
+            ts_offset=self._ts_offset,
+            last_handshake=self._last_handshake,  # type: ignore[arg-type]
+        )
+
+    def restore_handshake(self, state: HandshakeState) -> bool:
+        """Restore a previously stored handshake state to skip the handshake.
+
+        The state is only used if it is still within the handshake timeout
+        (or :data:`RESTORED_HANDSHAKE_MAX_AGE` if no timeout is set), the device
+        timestamp is extrapolated from the stored offset.
+
+        :return: True if the state was restored.
+        """
+        max_age = self._handshake_timeout
+        if max_age is None:
+            max_age = RESTORED_HANDSHAKE_MAX_AGE
+
+        now = datetime.now(tz=UTC)
+        if not timedelta(0) <= now - state.last_handshake < max_age:
+            _LOGGER.debug("Not restoring expired handshake from %s", state)
+            return False
+
+        with self._lock:
+            self._device_id = state.device_id
+            self._ts_offset = state.ts_offset
+            self._device_ts = now + state.ts_offset
+            self._last_handshake = state.last_handshake
+            self._discovered = True
+        _LOGGER.debug("Restored handshake state: %s", state)
+        return True
+
     def _needs_handshake(self) -> bool:
         """Return True if a handshake is needed before sending.
 
@@ -138,53 +424,180 @@ class MiIOProtocol:
         return elapsed >= self._handshake_timeout
 
     @staticmethod
-    def discover(addr: str | None = None, timeout: int = 5) -> Any:
+    def discover(
+        addr: str | None = None,
+        timeout: float = 5,
+        *,
+        transport: SharedTransport | None = None,
+        rate: float | None = SWEEP_RATE,
+        port: int = 54321,
+    ) -> Any:
         """Scan for devices in the network. This method is used to discover supported
         devices by sending a handshake message to the broadcast address on port 54321.
         If the target IP address is given, the handshake will be send as an unicast
-        packet.
-
-        :param str addr: Target IP address
-        """
-        is_broadcast = addr is None
-        seen_addrs: list[str] = []
-        if is_broadcast:
-            addr = "<broadcast>"
-            is_broadcast = True
-            _LOGGER.info("Sending discovery to %s with timeout of %ss..", addr, timeout)
-        # magic, length 32
-        helobytes = bytes.fromhex(
-            "21310020ffffffffffffffffffffffffffffffffffffffffffffffffffffffff"
-        )
+        packet. If a network in CIDR notation is given, the handshake is sent to
+        every host of the network, see :func:`iter_sweep`.
+
+        :param str addr: Target IP address or network
+        :param transport: Shared transport to use for unicast discovery
+        :param rate: Maximum number of packets per second when sweeping a network
+        :param port: Port to send the handshake to
+        :raises ValueError: if a transport is given for sweeping a network.
+        """
+        is_network = addr is not None and "/" in addr
+        if is_network and transport is not None:
+            raise ValueError("The shared transport can only be used for a single IP")
+
+        if addr is not None and transport is not None:
+            future = MiIOProtocol._request_handshake(transport, addr, port)
+            try:
+                return future.result(timeout)[0]
+            except TimeoutError:
+                return None  # ignore timeouts on discover
+            finally:
+                transport.unregister((addr, port), None, future)
+
+        if addr is None or is_network:
+            _LOGGER.info("Sending discovery with timeout of %ss..", timeout)
+            if addr is None:
+                found = MiIOProtocol.iter_discover(timeout=timeout, port=port)
+            else:
+                found = MiIOProtocol.iter_sweep(addr, timeout, rate=rate, port=port)
+
+            devices = []
+            for device in found:
+                _LOGGER.info(
+                    "  IP %s (ID: %08x) - token: %s",
+                    device.ip,
+                    device.device_id,
+                    device.token.hex() if device.token else "hidden",
+                )
+                devices.append(device)
+
+            _LOGGER.info("Discovery done")
+            return devices
 
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # the address may be the broadcast address of a subnet
         s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         s.settimeout(timeout)
-        for _ in range(3):
-            s.sendto(helobytes, (addr, 54321))
-        while True:
-            try:
-                data, recv_addr = s.recvfrom(1024)
-                m: Message = Message.parse(data)
-                _LOGGER.debug("Got a response: %s", m)
-                if not is_broadcast:
-                    return m
-
-                if recv_addr[0] not in seen_addrs:
-                    _LOGGER.info(
-                        "  IP %s (ID: %s) - token: %s",
-                        recv_addr[0],
-                        binascii.hexlify(m.header.value.device_id).decode(),
-                        codecs.encode(m.checksum, "hex"),
-                    )
-                    seen_addrs.append(recv_addr[0])
-            except TimeoutError:
-                if is_broadcast:
-                    _LOGGER.info("Discovery done")
-                return  # ignore timeouts on discover
-            except Exception as ex:
-                _LOGGER.warning("error while reading discover results: %s", ex)
-                break
+        try:
+            for _ in range(3):
+                s.sendto(HELO_BYTES, (addr, port))
+            data, _ = s.recvfrom(1024)
+            m: Message = MessageCodec.parse(data)
+            _LOGGER.debug("Got a response: %s", m)
+            return m
+        except TimeoutError:
+            return None  # ignore timeouts on discover
+        except Exception as ex:
+            _LOGGER.warning("error while reading discover results: %s", ex)
+            return None
+        finally:
+            s.close()
+
+    @staticmethod
+    def iter_discover(
+        addrs: Iterable[str] | None = None,
+        timeout: float = 5,
+        *,
+        interfaces: Iterable[str] | None = None,
+        port: int = 54321,
+        rate: float | None = None,
+    ) -> Iterator[DiscoveredDevice]:
+        """Discover devices, yielding them as soon as their responses arrive.
+
+        :param addrs: Addresses to send the handshake to, e.g., the broadcast
+            addresses of multiple subnets. Defaults to the local broadcast address.
+        :param timeout: How many seconds to wait for the responses after the last
+            handshake has been sent
+        :param interfaces: Local addresses of the interfaces to send from.
+            Defaults to letting the operating system choose the interface.
+        :param port: Port to send the handshake to
+        :param rate: Maximum number of packets to send per second, unlimited if None
+        """
+        targets = list(addrs) if addrs is not None else ["<broadcast>"]
+        selector = selectors.DefaultSelector()
+        sockets = []
+        try:
+            for interface in interfaces or ["0.0.0.0"]:  # noqa: S104
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sockets.append(s)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                s.bind((interface, 0))
+                s.setblocking(False)
+                selector.register(s, selectors.EVENT_READ)
+
+            # hosts not responding to the first hello are retried in later rounds
+            pending = deque(
+                (s, target) for _ in range(3) for s in sockets for target in targets
+            )
+            interval = 1 / rate if rate else 0.0
+            next_send = time.monotonic()
+            deadline = math.inf
+            seen: set[str] = set()
+            while True:
+                now = time.monotonic()
+                while pending and next_send <= now:
+                    s, target = pending.popleft()
+                    if target in seen:
+                        continue
+                    try:
+                        s.sendto(HELO_BYTES, (target, port))
+                    except BlockingIOError:
+                        # send buffer is full, wait a bit before continuing
+                        pending.appendleft((s, target))
+                        next_send = now + 0.001
+                        break
+                    except OSError as ex:
+                        _LOGGER.debug("Unable to send to %s: %s", target, ex)
+                    next_send += interval
+
+                if not pending and deadline == math.inf:
+                    deadline = time.monotonic() + timeout
+
+                remaining = (next_send if pending else deadline) - time.monotonic()
+                if not pending and remaining <= 0:
+                    break
+
+                for key, _ in selector.select(max(remaining, 0)):
+                    try:
+                        data, recv_addr = key.fileobj.recvfrom(1024)  # type: ignore[union-attr]
+                    except OSError as ex:
+                        _LOGGER.debug("Error while reading discover results: %s", ex)
+                        continue
+
+                    device = _parse_discovery(data, recv_addr[0], seen)
+                    if device is not None:
+                        yield device
+        finally:
+            selector.close()
+            for s in sockets:
+                s.close()
+
+    @staticmethod
+    def iter_sweep(
+        network: str,
+        timeout: float = 2,
+        *,
+        rate: float | None = SWEEP_RATE,
+        interfaces: Iterable[str] | None = None,
+        port: int = 54321,
+    ) -> Iterator[DiscoveredDevice]:
+        """Discover devices by sending a handshake to every host in the network.
+
+        This is useful for networks where broadcasts are not forwarded.
+        See :func:`iter_discover` for the parameters.
+
+        :param network: Network to sweep in CIDR notation, e.g., 192.168.0.0/22
+        """
+        hosts = [
+            str(host) for host in ipaddress.ip_network(network, strict=False).hosts()
+        ]
+        _LOGGER.debug("Sweeping %s hosts in %s", len(hosts), network)
+        return MiIOProtocol.iter_discover(
+            hosts, timeout, interfaces=interfaces, port=port, rate=rate
+        )
 
     def send(
         self,
@@ -203,53 +616,360 @@ class MiIOProtocol:
         :param retry_count: How many times to retry in case of failure, how many handshakes to send
         :param dict extra_parameters: Extra top-level parameters
         :raises DeviceException: if an error has occurred during communication.
+        :raises DeviceUnavailableException: if the circuit breaker is open.
         """
+        if self._check_availability():
+            self._probe()
 
-        if self._needs_handshake():
-            self.send_handshake()
+        with self._track_availability():
+            if self._recorder is not None:
+                with self._recorder.recording(
+                    command, parameters, extra_parameters
+                ) as exchange:
+                    exchange.result = self._send(
+                        command,
+                        parameters,
+                        retry_count,
+                        extra_parameters=extra_parameters,
+                    )
+                    return exchange.result
 
-        request = self._create_request(command, parameters, extra_parameters)
+            return self._send(
+                command, parameters, retry_count, extra_parameters=extra_parameters
+            )
 
-        send_ts = self._device_ts + timedelta(seconds=1)
-        header = {
-            "length": 0,
-            "unknown": 0x00000000,
-            "device_id": self._device_id,
-            "ts": send_ts,
-        }
+    def _send(
+        self,
+        command: str,
+        parameters: Any | None,
+        retry_count: int,
+        *,
+        extra_parameters: dict | None,
+    ) -> Any:
+        """Send the command, retrying on errors."""
+        attempt = 0
+        while True:
+            if self._needs_handshake():
+                self._ensure_handshake()
 
-        msg = {"data": {"value": request}, "header": {"value": header}, "checksum": 0}
-        m = Message.build(msg, token=self.token)
-        _LOGGER.debug("%s:%s >>: %s", self.ip, self.port, pf(request))
-        if self.debug > 1:
-            _LOGGER.debug(
-                "send (timeout %s): %s",
-                self._timeout,
-                Message.parse(m, token=self.token),
+            msg_id, m = self._create_message(command, parameters, extra_parameters)
+
+            try:
+                start = time.monotonic()
+                response, addr = self._exchange(
+                    msg_id, m, self._attempt_timeout(attempt)
+                )
+                self._record_rtt(time.monotonic() - start)
+                return self._handle_response(response, addr)
+            except construct.core.ChecksumError as ex:
+                self._count("checksum_errors")
+                raise InvalidTokenException(
+                    "Got checksum error which indicates use "
+                    "of an invalid token. "
+                    "Please check your token!"
+                ) from ex
+            except OSError as ex:
+                self._count("timeouts")
+                if attempt >= retry_count:
+                    _LOGGER.error("Got error when receiving: %s", ex)
+                    raise DeviceException("No response from the device") from ex
+
+                self._count("retries")
+                self._prepare_retry(retry_count - attempt, attempt=attempt)
+
+            except RecoverableError as ex:
+                if attempt >= retry_count:
+                    _LOGGER.error("Got error when receiving: %s", ex)
+                    raise DeviceException("Unable to recover failed command") from ex
+
+                self._count("retries")
+                _LOGGER.debug(
+                    "Retrying to send failed command, retries left: %s",
+                    retry_count - attempt,
+                )
+
+            attempt += 1
+
+    @staticmethod
+    def _request_handshake(
+        transport: SharedTransport, addr: str, port: int = 54321
+    ) -> Future:
+        """Send handshake requests using the shared transport."""
+        future = None
+        try:
+            future = transport.request(
+                (addr, port), HELO_BYTES, msg_id=None, token=None
             )
+            for _ in range(2):
+                transport.sendto(HELO_BYTES, (addr, port))
+        except OSError as ex:
+            if future is not None:
+                transport.unregister((addr, port), None, future)
+            raise DeviceException(f"Unable to send handshake to {addr}") from ex
 
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.settimeout(self._timeout)
+        return future
+
+    def _exchange(
+        self, msg_id: int, m: bytes, timeout: float | None = None
+    ) -> tuple[Any, Any]:
+        """Send the message and return the parsed response with its source address.
 
+        :raises DeviceException: if sending the message fails.
+        :raises OSError: if no response is received in time.
+        """
+        if timeout is None:
+            timeout = self._timeout
+
+        channel = self._open_channel()
         try:
-            s.sendto(m, (self.ip, self.port))
+            self._send_on(channel, msg_id, m)
+            return channel.receive(timeout)
+        finally:
+            channel.close()
+
+    def _open_channel(self) -> "_SocketChannel | _SharedChannel":
+        """Return a channel for exchanging messages with the device."""
+        addr = (self.ip, self.port)
+        if self._transport is not None:
+            return _SharedChannel(self._transport, addr, self.token, self._tolerant)  # type: ignore[arg-type]
+
+        return _SocketChannel(addr, self.token, self._tolerant)
+
+    def _send_on(self, channel: "_SocketChannel | _SharedChannel", msg_id: int, m):
+        """Send the message on the given channel.
+
+        :raises DeviceException: if sending the message fails.
+        """
+        try:
+            with timed(Phase.Send):
+                channel.send(msg_id, m)
         except OSError as ex:
             _LOGGER.error("failed to send msg: %s", ex)
             raise DeviceException from ex
 
+    def send_many(
+        self,
+        requests: list[tuple[str, Any]],
+        retry_count: int = 3,
+        *,
+        return_exceptions: bool = False,
+    ) -> list[Any]:
+        """Send multiple commands keeping up to `max_in_flight` requests in flight.
+
+        The responses are matched to the requests using the message id, so they can
+        arrive in any order. The results are returned in the order of the requests.
+
+        :param requests: List of (command, parameters) tuples
+        :param retry_count: How many times to retry each request in case of failure
+        :param return_exceptions: Return the exceptions in place of the results
+            instead of raising the first one
+        :raises DeviceException: if an error has occurred during communication.
+        """
+        if self.max_in_flight <= 1:
+            results: list[Any] = []
+            for command, parameters in requests:
+                try:
+                    results.append(self.send(command, parameters, retry_count))
+                except DeviceException as ex:
+                    if not return_exceptions:
+                        raise
+                    results.append(ex)
+
+            return results
+
+        if self._check_availability():
+            self._probe()
+
+        with self._track_availability(record_success=False):
+            results = self._send_pipelined(requests, retry_count, return_exceptions)
+
+        breaker = self._circuit_breaker
+        if breaker is not None:
+            # requests without a response are not raised with return_exceptions
+            if results and all(_is_unanswered(res) for res in results):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+        return results
+
+    def _send_pipelined(
+        self, requests: list[tuple[str, Any]], retry_count: int, return_exceptions: bool
+    ) -> list[Any]:
+        """Send the requests keeping up to `max_in_flight` requests in flight."""
+        results: list[Any] = [None] * len(requests)
+        queue = deque((idx, retry_count) for idx in range(len(requests)))
+        in_flight: dict[int, tuple[int, int]] = {}
+        # when the requests were first sent, for recording them
+        started: dict[int, float] = {}
+        # when the messages were sent, only for the first attempt (Karn's rule)
+        sent: dict[int, float] = {}
+
+        def _record(idx: int, result: Any = None, error: DeviceException | None = None):
+            if self._recorder is not None:
+                command, parameters = requests[idx]
+                self._recorder.record(
+                    command,
+                    parameters,
+                    started=started[idx],
+                    result=result,
+                    error=error,
+                )
+
+        def _fail(idx: int, ex: DeviceException, cause: Exception | None = None):
+            ex.__cause__ = cause
+            _record(idx, error=ex)
+            if not return_exceptions:
+                raise ex
+            results[idx] = ex
+
+        channel = self._open_channel()
+        try:
+            while queue or in_flight:
+                while queue and len(in_flight) < self.max_in_flight:
+                    if self._needs_handshake():
+                        self._ensure_handshake()
+                    idx, retries = queue.popleft()
+                    command, parameters = requests[idx]
+                    msg_id, m = self._create_message(command, parameters)
+                    started.setdefault(idx, time.monotonic())
+                    self._send_on(channel, msg_id, m)
+                    in_flight[msg_id] = (idx, retries)
+                    if retries == retry_count:
+                        sent[msg_id] = time.monotonic()
+
+                try:
+                    response, addr = channel.receive(self._attempt_timeout(0))
+                except construct.core.ChecksumError as ex:
+                    self._count("checksum_errors")
+                    raise InvalidTokenException(
+                        "Got checksum error which indicates use "
+                        "of an invalid token. "
+                        "Please check your token!"
+                    ) from ex
+                except PayloadDecodeException as ex:
+                    # fail every request in flight if the channel cannot tell
+                    # which one the response was for
+                    failed_id = channel.failed_id
+                    failed = [failed_id] if failed_id in in_flight else list(in_flight)
+                    for msg_id in failed:
+                        idx, _ = in_flight.pop(msg_id)
+                        _fail(idx, PayloadDecodeException(*ex.args), ex)
+                    continue
+                except OSError as ex:
+                    # none of the requests in flight got a response in time
+                    timed_out = list(in_flight.values())
+                    self._count("timeouts", len(timed_out))
+                    in_flight.clear()
+                    for idx, retries in timed_out:
+                        if retries > 0:
+                            self._count("retries")
+                            queue.append((idx, retries - 1))
+                        else:
+                            _fail(
+                                idx, DeviceException("No response from the device"), ex
+                            )
+                    if queue:
+                        attempt = retry_count - min(r for _, r in timed_out)
+                        self._prepare_retry(len(queue), attempt=attempt)
+                    continue
+
+                payload = response.data.value
+                response_id = payload.get("id") if isinstance(payload, dict) else None
+                if response_id not in in_flight:
+                    _LOGGER.debug(
+                        "Ignoring response with unexpected id %s", response_id
+                    )
+                    continue
+
+                idx, retries = in_flight.pop(response_id)
+                if response_id in sent:
+                    self._record_rtt(time.monotonic() - sent.pop(response_id))
+                try:
+                    results[idx] = self._handle_response(response, addr)
+                    _record(idx, result=results[idx])
+                except RecoverableError as ex:
+                    if retries > 0:
+                        self._count("retries")
+                        queue.append((idx, retries - 1))
+                    else:
+                        _fail(
+                            idx, DeviceException("Unable to recover failed command"), ex
+                        )
+                except DeviceError as ex:
+                    _fail(idx, ex)
+        finally:
+            channel.close()
+
+        return results
+
+    def _request_shared(self, msg_id: int, m: bytes) -> Future:
+        """Send the message using the shared transport."""
+        assert self._transport is not None  # noqa: S101
         try:
-            data, addr = s.recvfrom(4096)
-            m = Message.parse(data, token=self.token)
+            return self._transport.request(
+                (self.ip, self.port),  # type: ignore[arg-type]
+                m,
+                msg_id=msg_id,
+                token=self.token,
+                tolerant=self._tolerant,
+            )
+        except OSError as ex:
+            _LOGGER.error("failed to send msg: %s", ex)
+            raise DeviceException from ex
+
+    def _create_message(
+        self, command: str, parameters: Any, extra_parameters: dict | None = None
+    ) -> tuple[int, bytes]:
+        """Create the request and build the encrypted message for it.
+
+        Returns the message id and the built message.
+        """
+        with timed(Phase.Build), self._lock:
+            request = self._create_request(command, parameters, extra_parameters)
+            header = {
+                "length": 0,
+                "unknown": 0x00000000,
+                "device_id": self._device_id,
+                "ts": self._device_ts + timedelta(seconds=1),
+            }
+
+        msg = {"data": {"value": request}, "header": {"value": header}, "checksum": 0}
+        m = MessageCodec.build(msg, token=self.token)
+        if self._metrics is not None:
+            self._metrics.record_request(command, len(m))
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("%s:%s >>: %s", self.ip, self.port, pf(request))
+        if self.debug > 1:
+            _LOGGER.debug(
+                "send (timeout %s): %s",
+                self._timeout,
+                Message.parse(m, token=self.token),
+            )
 
-            if self.debug > 1:
-                _LOGGER.debug("recv from %s: %s", addr[0], m)
+        return request["id"], m
 
-            header = m.header.value
-            payload = m.data.value
+    def _handle_response(self, m: Any, addr) -> Any:
+        """Process the parsed response and return its result.
+
+        :raises DeviceError: if the device responded with an error.
+        """
+        if self.debug > 1:
+            _LOGGER.debug("recv from %s: %s", addr[0], m)
+        if self._metrics is not None:
+            self._metrics.record_response(m.data.length + MessageCodec.HEADER_LENGTH)
 
-            self.__id = payload["id"]
+        header = m.header.value
+        payload = m.data.value
+
+        # responses may arrive out of order when pipelining, so never go backwards
+        # to avoid reusing the ids of the requests still in flight
+        with self._lock:
+            if payload["id"] > self.__id:
+                self.__id = payload["id"]
             self._device_ts = header["ts"]  # type: ignore  # ts uses timeadapter
 
+        if _LOGGER.isEnabledFor(logging.DEBUG):
             _LOGGER.debug(
                 "%s:%s (ts: %s, id: %s) << %s",
                 self.ip,
@@ -258,58 +978,72 @@ class MiIOProtocol:
                 payload["id"],
                 pf(payload),
             )
-            if "error" in payload:
-                self._handle_error(payload["error"])
+        if "error" in payload:
+            self._handle_error(payload["error"])
 
-            try:
-                return payload["result"]
-            except KeyError:
-                return payload
-        except construct.core.ChecksumError as ex:
-            raise InvalidTokenException(
-                "Got checksum error which indicates use "
-                "of an invalid token. "
-                "Please check your token!"
-            ) from ex
-        except OSError as ex:
-            if retry_count > 0:
-                _LOGGER.debug(
-                    "Retrying with incremented id, retries left: %s", retry_count
-                )
-                self.__id += 100
+        try:
+            return payload["result"]
+        except KeyError:
+            return payload
+
+    def _prepare_retry(self, retries_left: int, *, attempt: int = 0) -> None:
+        """Bump the sequence id and force a new handshake before retrying.
+
+        With adaptive timeouts, the first retry reuses the existing handshake as
+        a single lost packet is much more likely than a rebooted device.
+        """
+        _LOGGER.debug("Retrying with incremented id, retries left: %s", retries_left)
+        with self._lock:
+            self.__id += 100
+            if self._rtt is None or attempt > 0:
                 self._discovered = False
-                return self.send(
-                    command,
-                    parameters,
-                    retry_count - 1,
-                    extra_parameters=extra_parameters,
-                )
 
-            _LOGGER.error("Got error when receiving: %s", ex)
-            raise DeviceException("No response from the device") from ex
+    def _attempt_timeout(self, attempt: int) -> float:
+        """Return the timeout for the given attempt, 0 being the first one."""
+        if self._rtt is None:
+            return self._timeout
 
-        except RecoverableError as ex:
-            if retry_count > 0:
-                _LOGGER.debug(
-                    "Retrying to send failed command, retries left: %s", retry_count
-                )
-                return self.send(
-                    command,
-                    parameters,
-                    retry_count - 1,
-                    extra_parameters=extra_parameters,
-                )
+        return self._rtt.timeout(attempt)
 
-            _LOGGER.error("Got error when receiving: %s", ex)
-            raise DeviceException("Unable to recover failed command") from ex
+    def _record_rtt(self, rtt: float) -> None:
+        """Update the round-trip time estimate with a measured sample."""
+        if self._rtt is not None:
+            self._rtt.update(rtt)
+        if self._metrics is not None:
+            self._metrics.record_rtt(rtt)
+
+    @property
+    def metrics(self) -> DeviceMetrics | None:
+        """Return the metrics for the device, if collected."""
+        return self._metrics
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        """Increment the named counter of the device metrics, if collected."""
+        if self._metrics is not None:
+            self._metrics.increment(name, amount)
 
     @property
     def _id(self) -> int:
         """Increment and return the sequence id."""
-        self.__id += 1
-        if self.__id >= 9999:
-            self.__id = 1
-        return self.__id
+        with self._lock:
+            self.__id += 1
+            if self._reserve_ids is not None:
+                if self.__id not in self._id_block:
+                    self._id_block = self._reserve_ids()
+                    self.__id = self._id_block.start
+            elif self.__id >= MAX_ID:
+                self.__id = 1
+            return self.__id
+
+    def use_id_blocks(self, reserve: Callable[[], range]) -> None:
+        """Use sequence ids from blocks handed out by the given callable.
+
+        This allows multiple processes to share a device without reusing the
+        sequence ids, see :meth:`miio.device_cache.StateStore.reserve_ids`.
+        """
+        self._reserve_ids = reserve
+        self._id_block = reserve()
+        self.__id = self._id_block.start - 1
 
     @property
     def raw_id(self):
@@ -337,3 +1071,588 @@ class MiIOProtocol:
             request = {**request, **extra_parameters}
 
         return request
+
+
+def _parse_discovery(data: bytes, ip: str, seen: set[str]) -> DiscoveredDevice | None:
+    """Parse a handshake response, returning None for duplicates and invalid data."""
+    if ip in seen:
+        return None
+
+    try:
+        m = MessageCodec.parse(data)
+    except Exception as ex:
+        _LOGGER.debug("Unable to parse discover response from %s: %s", ip, ex)
+        return None
+
+    _LOGGER.debug("Got a response: %s", m)
+    seen.add(ip)
+    return DiscoveredDevice.from_message(ip, m)
+
+
+def _is_unanswered(result: Any) -> bool:
+    """Return True if the result is an error caused by the device not responding."""
+    return isinstance(result, DeviceException) and not isinstance(
+        result, DeviceError | InvalidTokenException | PayloadDecodeException
+    )
+
+
+class _SocketChannel:
+    """Blocking request channel using a dedicated socket."""
+
+    def __init__(self, addr, token: bytes, tolerant: bool = False) -> None:
+        self._addr = addr
+        self._token = token
+        self._tolerant = tolerant
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        #: Id of the request the last raised error was for, never known here
+        self.failed_id: int | None = None
+
+    def send(self, msg_id: int, m: bytes) -> None:
+        self._sock.sendto(m, self._addr)
+
+    def receive(self, timeout: float) -> tuple[Any, Any]:
+        """Return the next parsed response and its source address."""
+        self._sock.settimeout(timeout)
+        buffer = receive_buffer()
+        with timed(Phase.Wait):
+            size, addr = self._sock.recvfrom_into(buffer)
+        m = MessageCodec.parse(
+            memoryview(buffer)[:size], token=self._token, tolerant=self._tolerant
+        )
+        return m, addr
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+class _SharedChannel:
+    """Blocking request channel using a :class:`SharedTransport`."""
+
+    def __init__(
+        self, transport: SharedTransport, addr, token: bytes, tolerant: bool = False
+    ) -> None:
+        self._transport = transport
+        self._addr = addr
+        self._token = token
+        self._tolerant = tolerant
+        self._pending: dict[int, Future] = {}
+        #: Id of the request the last raised error was for
+        self.failed_id: int | None = None
+
+    def send(self, msg_id: int, m: bytes) -> None:
+        self._pending[msg_id] = self._transport.request(
+            self._addr, m, msg_id=msg_id, token=self._token, tolerant=self._tolerant
+        )
+
+    def receive(self, timeout: float) -> tuple[Any, Any]:
+        """Return the next parsed response and its source address."""
+        with timed(Phase.Wait):
+            done, _ = wait(self._pending.values(), timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError("Timed out waiting for a response")
+
+        future = done.pop()
+        msg_id = next(k for k, v in self._pending.items() if v is future)
+        del self._pending[msg_id]
+        self.failed_id = msg_id if future.exception() is not None else None
+        return future.result()
+
+    def close(self) -> None:
+        for msg_id, future in self._pending.items():
+            self._transport.unregister(self._addr, msg_id, future)
+
+
+class _DatagramResponse(asyncio.DatagramProtocol):
+    """Datagram protocol collecting responses for :class:`AsyncMiIOProtocol`."""
+
+    def __init__(self) -> None:
+        self.responses: asyncio.Queue[tuple[bytes, Any]] = asyncio.Queue()
+        self.error: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.responses.put_nowait((data, addr))
+
+    def error_received(self, exc: Exception) -> None:
+        if not self.error.done():
+            self.error.set_exception(exc)
+
+    async def receive(self, timeout: float) -> tuple[bytes, Any]:
+        """Return the next received datagram.
+
+        :raises TimeoutError: if nothing is received in time.
+        :raises OSError: if the socket reported an error.
+        """
+        receive = asyncio.ensure_future(self.responses.get())
+        try:
+            done, _ = await asyncio.wait(
+                (receive, self.error),
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            receive.cancel()
+
+        if receive in done:
+            return receive.result()
+        if self.error in done:
+            raise self.error.exception()  # type: ignore[misc]
+
+        raise TimeoutError("Timed out waiting for a response")
+
+
+class AsyncMiIOProtocol(MiIOProtocol):
+    """miIO protocol with asyncio-based I/O.
+
+    In addition to the blocking methods inherited from :class:`MiIOProtocol`, this
+    class provides coroutine counterparts (:func:`async_send`,
+    :func:`async_send_handshake`, :func:`async_discover`) which use
+    :meth:`asyncio.loop.create_datagram_endpoint` instead of blocking sockets.
+    This allows polling a large number of devices from a single event loop without
+    pushing every call into an executor.
+
+    The state (sequence id, device timestamp, handshake) is shared between the
+    blocking and the asyncio methods, so both can be used on the same instance.
+    """
+
+    async def async_send_handshake(self, *, retry_count=3) -> Message:
+        """Send a handshake to the device.
+
+        See :func:`MiIOProtocol.send_handshake`.
+
+        :raises DeviceException: if the device could not be discovered after retries.
+        """
+        try:
+            m = await AsyncMiIOProtocol.async_discover(
+                self.ip, transport=self._transport, port=self.port
+            )
+        except DeviceException as ex:
+            if retry_count > 0:
+                return await self.async_send_handshake(retry_count=retry_count - 1)
+
+            raise ex
+
+        return self._handle_handshake(m)
+
+    async def _async_ensure_handshake(self) -> None:
+        """Handshake, sharing an ongoing handshake with concurrent tasks.
+
+        :raises DeviceException: if the handshake failed.
+        """
+        task = self._handshake_task
+        if task is None or task.done():
+            task = self._handshake_task = asyncio.ensure_future(
+                self.async_send_handshake()
+            )
+            # avoid warnings about unretrieved exceptions if all callers cancelled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            _LOGGER.debug("Waiting for the ongoing handshake")
+
+        # a cancelled caller must not cancel the handshake of the others
+        await asyncio.shield(task)
+
+    async def _async_probe(self) -> None:
+        """Probe the device with a hello packet, see :func:`MiIOProtocol._probe`."""
+        with self._probing():
+            m = await AsyncMiIOProtocol.async_discover(
+                self.ip,
+                self._attempt_timeout(0),
+                transport=self._transport,
+                port=self.port,
+            )
+            self._handle_probe(m)
+
+    @staticmethod
+    async def async_discover(
+        addr: str | None = None,
+        timeout: float = 5,
+        *,
+        transport: SharedTransport | None = None,
+        rate: float | None = SWEEP_RATE,
+        port: int = 54321,
+    ) -> Any:
+        """Scan for devices in the network.
+
+        See :func:`MiIOProtocol.discover`.
+
+        :param str addr: Target IP address or network
+        :param transport: Shared transport to use for unicast discovery
+        :param port: Port to send the handshake to
+        :raises ValueError: if a transport is given for sweeping a network.
+        """
+        is_network = addr is not None and "/" in addr
+        if is_network and transport is not None:
+            raise ValueError("The shared transport can only be used for a single IP")
+
+        if addr is not None and transport is not None:
+            future = MiIOProtocol._request_handshake(transport, addr, port)
+            try:
+                return (await asyncio.wait_for(asyncio.wrap_future(future), timeout))[0]
+            except TimeoutError:
+                return None  # ignore timeouts on discover
+            finally:
+                transport.unregister((addr, port), None, future)
+
+        if addr is None or is_network:
+            _LOGGER.info("Sending discovery with timeout of %ss..", timeout)
+            if addr is None:
+                found = AsyncMiIOProtocol.async_iter_discover(
+                    timeout=timeout, port=port
+                )
+            else:
+                found = AsyncMiIOProtocol.async_iter_sweep(
+                    addr, timeout, rate=rate, port=port
+                )
+
+            devices = [device async for device in found]
+            _LOGGER.info("Discovery done, found %s devices", len(devices))
+            return devices
+
+        loop = asyncio.get_running_loop()
+        endpoint, protocol = await loop.create_datagram_endpoint(
+            _DatagramResponse, family=socket.AF_INET, allow_broadcast=True
+        )
+        try:
+            for _ in range(3):
+                endpoint.sendto(HELO_BYTES, (addr, port))
+
+            data, _ = await protocol.receive(timeout)
+            m: Message = MessageCodec.parse(data)
+            _LOGGER.debug("Got a response: %s", m)
+            return m
+        except TimeoutError:
+            return None  # ignore timeouts on discover
+        except Exception as ex:
+            _LOGGER.warning("error while reading discover results: %s", ex)
+            return None
+        finally:
+            endpoint.close()
+
+    @staticmethod
+    async def async_iter_discover(
+        addrs: Iterable[str] | None = None,
+        timeout: float = 5,
+        *,
+        interfaces: Iterable[str] | None = None,
+        port: int = 54321,
+        rate: float | None = None,
+    ) -> AsyncIterator[DiscoveredDevice]:
+        """Discover devices, yielding them as soon as their responses arrive.
+
+        See :func:`MiIOProtocol.iter_discover`.
+        """
+        targets = list(addrs) if addrs is not None else ["<broadcast>"]
+        loop = asyncio.get_running_loop()
+        # a single protocol instance collects the responses from all endpoints
+        protocol = _DatagramResponse()
+        endpoints = []
+        sender: asyncio.Future | None = None
+        try:
+            for interface in interfaces or ["0.0.0.0"]:  # noqa: S104
+                endpoint, _ = await loop.create_datagram_endpoint(
+                    lambda: protocol,
+                    local_addr=(interface, 0),
+                    family=socket.AF_INET,
+                    allow_broadcast=True,
+                )
+                endpoints.append(endpoint)
+
+            seen: set[str] = set()
+
+            async def _send_hellos() -> None:
+                # hosts not responding to the first hello are retried in later rounds
+                start = loop.time()
+                sends = (
+                    (endpoint, target)
+                    for _ in range(3)
+                    for endpoint in endpoints
+                    for target in targets
+                )
+                for idx, (endpoint, target) in enumerate(sends):
+                    if target in seen:
+                        continue
+                    if rate and (delay := start + idx / rate - loop.time()) > 0:
+                        await asyncio.sleep(delay)
+                    endpoint.sendto(HELO_BYTES, (target, port))
+
+            sender = asyncio.ensure_future(_send_hellos())
+            deadline = math.inf
+            while True:
+                if sender.done() and deadline == math.inf:
+                    sender.result()
+                    deadline = loop.time() + timeout
+                # wake up regularly to notice when all hellos have been sent
+                wait = min(deadline - loop.time(), 0.1)
+                try:
+                    data, recv_addr = await protocol.receive(wait)
+                except TimeoutError:
+                    if loop.time() >= deadline:
+                        return
+                    continue
+                except OSError as ex:
+                    _LOGGER.debug("Error while reading discover results: %s", ex)
+                    protocol.error = loop.create_future()
+                    continue
+
+                device = _parse_discovery(data, recv_addr[0], seen)
+                if device is not None:
+                    yield device
+        finally:
+            if sender is not None:
+                sender.cancel()
+            for endpoint in endpoints:
+                endpoint.close()
+
+    @staticmethod
+    def async_iter_sweep(
+        network: str,
+        timeout: float = 2,
+        *,
+        rate: float | None = SWEEP_RATE,
+        interfaces: Iterable[str] | None = None,
+        port: int = 54321,
+    ) -> AsyncIterator[DiscoveredDevice]:
+        """Discover devices by sending a handshake to every host in the network.
+
+        See :func:`MiIOProtocol.iter_sweep`.
+        """
+        hosts = [
+            str(host) for host in ipaddress.ip_network(network, strict=False).hosts()
+        ]
+        _LOGGER.debug("Sweeping %s hosts in %s", len(hosts), network)
+        return AsyncMiIOProtocol.async_iter_discover(
+            hosts, timeout, interfaces=interfaces, port=port, rate=rate
+        )
+
+    async def async_send(
+        self,
+        command: str,
+        parameters: Any | None = None,
+        retry_count: int = 3,
+        *,
+        extra_parameters: dict | None = None,
+    ) -> Any:
+        """Build and send the given command.
+
+        See :func:`MiIOProtocol.send`.
+
+        :param str command: Command to send
+        :param dict parameters: Parameters to send, or an empty list
+        :param retry_count: How many times to retry in case of failure, how many handshakes to send
+        :param dict extra_parameters: Extra top-level parameters
+        :raises DeviceException: if an error has occurred during communication.
+        :raises DeviceUnavailableException: if the circuit breaker is open.
+        """
+        if self._check_availability():
+            await self._async_probe()
+
+        with self._track_availability():
+            if self._recorder is not None:
+                with self._recorder.recording(
+                    command, parameters, extra_parameters
+                ) as exchange:
+                    exchange.result = await self._async_send(
+                        command,
+                        parameters,
+                        retry_count,
+                        extra_parameters=extra_parameters,
+                    )
+                    return exchange.result
+
+            return await self._async_send(
+                command, parameters, retry_count, extra_parameters=extra_parameters
+            )
+
+    async def _async_send(
+        self,
+        command: str,
+        parameters: Any | None,
+        retry_count: int,
+        *,
+        extra_parameters: dict | None,
+    ) -> Any:
+        """Send the command, retrying on errors."""
+        attempt = 0
+        while True:
+            if self._needs_handshake():
+                await self._async_ensure_handshake()
+
+            msg_id, m = self._create_message(command, parameters, extra_parameters)
+
+            try:
+                start = time.monotonic()
+                response, addr = await self._async_exchange(
+                    msg_id, m, self._attempt_timeout(attempt)
+                )
+                self._record_rtt(time.monotonic() - start)
+                return self._handle_response(response, addr)
+            except construct.core.ChecksumError as ex:
+                self._count("checksum_errors")
+                raise InvalidTokenException(
+                    "Got checksum error which indicates use "
+                    "of an invalid token. "
+                    "Please check your token!"
+                ) from ex
+            except OSError as ex:
+                self._count("timeouts")
+                if attempt >= retry_count:
+                    _LOGGER.error("Got error when receiving: %s", ex)
+                    raise DeviceException("No response from the device") from ex
+
+                self._count("retries")
+                self._prepare_retry(retry_count - attempt, attempt=attempt)
+
+            except RecoverableError as ex:
+                if attempt >= retry_count:
+                    _LOGGER.error("Got error when receiving: %s", ex)
+                    raise DeviceException("Unable to recover failed command") from ex
+
+                self._count("retries")
+                _LOGGER.debug(
+                    "Retrying to send failed command, retries left: %s",
+                    retry_count - attempt,
+                )
+
+            attempt += 1
+
+    async def _async_exchange(
+        self, msg_id: int, m: bytes, timeout: float | None = None
+    ) -> tuple[Any, Any]:
+        """Send the message and return the parsed response with its source address.
+
+        :raises DeviceException: if sending the message fails.
+        :raises OSError: if no response is received in time.
+        """
+        if timeout is None:
+            timeout = self._timeout
+
+        if self._transport is not None:
+            with timed(Phase.Send):
+                future = self._request_shared(msg_id, m)
+            try:
+                with timed(Phase.Wait):
+                    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            finally:
+                # the future is already cancelled when the wait timed out
+                self._transport.unregister((self.ip, self.port), msg_id, future)  # type: ignore[arg-type]
+
+        loop = asyncio.get_running_loop()
+        try:
+            endpoint, protocol = await loop.create_datagram_endpoint(
+                _DatagramResponse,
+                remote_addr=(self.ip, self.port),  # type: ignore[arg-type]
+            )
+        except OSError as ex:
+            _LOGGER.error("failed to send msg: %s", ex)
+            raise DeviceException from ex
+
+        try:
+            with timed(Phase.Send):
+                endpoint.sendto(m)
+            with timed(Phase.Wait):
+                data, addr = await protocol.receive(timeout)
+            return (
+                MessageCodec.parse(data, token=self.token, tolerant=self._tolerant),
+                addr,
+            )
+        finally:
+            endpoint.close()
+
+    async def async_send_many(
+        self,
+        requests: list[tuple[str, Any]],
+        retry_count: int = 3,
+        *,
+        return_exceptions: bool = False,
+    ) -> list[Any]:
+        """Send multiple commands keeping up to `max_in_flight` requests in flight.
+
+        See :func:`MiIOProtocol.send_many`.
+        """
+        if self._needs_handshake():
+            await self._async_ensure_handshake()
+
+        window = asyncio.Semaphore(max(self.max_in_flight, 1))
+
+        async def _send(command: str, parameters: Any) -> Any:
+            async with window:
+                return await self.async_send(command, parameters, retry_count)
+
+        results = await asyncio.gather(
+            *(_send(command, parameters) for command, parameters in requests),
+            return_exceptions=return_exceptions,
+        )
+        # only device errors are returned, like done by send_many
+        for res in results:
+            if isinstance(res, BaseException) and not isinstance(res, DeviceException):
+                raise res
+
+        return results
+
+
+class ReplayProtocol(AsyncMiIOProtocol):
+    """Protocol serving recorded responses instead of communicating with a device.
+
+    The responses are delayed by the recorded response times scaled by the
+    `time_scale` of the replay, see :class:`miio.recording.Replay`.
+    """
+
+    def __init__(self, replay: Replay, ip: str | None = None, token=None, **kwargs):
+        super().__init__(ip, token, **kwargs)
+        self._replay = replay
+        self._discovered = True
+
+    def _needs_handshake(self) -> bool:
+        return False
+
+    def send(
+        self,
+        command: str,
+        parameters: Any | None = None,
+        retry_count: int = 3,
+        *,
+        extra_parameters: dict | None = None,
+    ) -> Any:
+        """Return the recorded response for the command.
+
+        :raises DeviceException: if the command has not been recorded, or the
+            recorded request failed.
+        """
+        exchange = self._replay.next(command, parameters, extra_parameters)
+        time.sleep(self._replay.delay(exchange))
+        return exchange.outcome()
+
+    def send_many(
+        self,
+        requests: list[tuple[str, Any]],
+        retry_count: int = 3,
+        *,
+        return_exceptions: bool = False,
+    ) -> list[Any]:
+        """Return the recorded responses for the commands."""
+        results: list[Any] = []
+        for command, parameters in requests:
+            try:
+                results.append(self.send(command, parameters, retry_count))
+            except DeviceException as ex:
+                if not return_exceptions:
+                    raise
+                results.append(ex)
+
+        return results
+
+    async def async_send(
+        self,
+        command: str,
+        parameters: Any | None = None,
+        retry_count: int = 3,
+        *,
+        extra_parameters: dict | None = None,
+    ) -> Any:
+        """Return the recorded response for the command.
+
+        See :func:`send`.
+        """
+        exchange = self._replay.next(command, parameters, extra_parameters)
+        await asyncio.sleep(self._replay.delay(exchange))
+        return exchange.outcome()
@@ -80,19 +80,34 @@ class MiotDevice(Device):
 
     def get_properties_for_mapping(self, *, max_properties=15) -> list:
         """Retrieve raw properties based on mapping."""
+        return self.get_properties(
+            self._properties_for_mapping(),
+            property_getter="get_properties",
+            max_properties=max_properties,
+        )
+
+    async def async_get_properties_for_mapping(self, *, max_properties=15) -> list:
+        """Retrieve raw properties based on mapping using asyncio."""
+        if self._model is None and self._info is None:
+            await self.async_info()
+
+        return await self.async_get_properties(
+            self._properties_for_mapping(),
+            property_getter="get_properties",
+            max_properties=max_properties,
+        )
+
+    def _properties_for_mapping(self) -> list[dict]:
+        """Return the property request payload for readable properties in mapping."""
         mapping = self._get_mapping()
 
         # We send property key in "did" because it's sent back via response and we can identify the property.
-        properties = [
+        return [
             {"did": k, **_filter_request_fields(v)}
             for k, v in mapping.items()
             if _is_readable_property(v)
         ]
 
-        return self.get_properties(
-            properties, property_getter="get_properties", max_properties=max_properties
-        )
-
     @command(
         click.argument("name", type=str),
         click.argument("params", type=LiteralParamType(), required=False),
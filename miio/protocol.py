@@ -17,13 +17,22 @@ import datetime
 import hashlib
 import json
 import logging
+import re
+import struct
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import lru_cache
 from typing import Any
 
 from construct import (
     Adapter,
     Bytes,
     Checksum,
+    ChecksumError,
     Const,
+    ConstError,
+    Container,
     Default,
     GreedyBytes,
     Hex,
@@ -33,6 +42,7 @@ from construct import (
     Pointer,
     RawCopy,
     Rebuild,
+    StreamError,
     Struct,
 )
 from cryptography.hazmat.backends import default_backend
@@ -40,9 +50,117 @@ from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 from miio.exceptions import PayloadDecodeException
+from miio.hooks import Phase, timed
 
 _LOGGER = logging.getLogger(__name__)
 
+# Maximum number of tokens for which the derived ciphers are kept cached
+CIPHER_CACHE_SIZE = 1024
+
+_PKCS7 = padding.PKCS7(128)
+
+JSONDumps = Callable[[Any], bytes]
+JSONLoads = Callable[[bytes | str], Any]
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def _stdlib_backend() -> tuple[JSONDumps, JSONLoads]:
+    return _stdlib_dumps, json.loads
+
+
+def _orjson_backend() -> tuple[JSONDumps, JSONLoads]:
+    import orjson  # type: ignore[import-not-found]
+
+    def dumps(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g., integers not fitting into 64 bits
+            return _stdlib_dumps(obj)
+
+    # orjson.JSONDecodeError is a subclass of ValueError, like for json
+    return dumps, orjson.loads
+
+
+def _msgspec_backend() -> tuple[JSONDumps, JSONLoads]:
+    import msgspec  # type: ignore[import-not-found]
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def dumps(obj: Any) -> bytes:
+        try:
+            return encoder.encode(obj)
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(obj)
+
+    def loads(data: bytes | str) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as ex:
+            raise ValueError(str(ex)) from ex
+
+    return dumps, loads
+
+
+# in the order of preference
+_JSON_BACKENDS: dict[str, Callable[[], tuple[JSONDumps, JSONLoads]]] = {
+    "orjson": _orjson_backend,
+    "msgspec": _msgspec_backend,
+    "json": _stdlib_backend,
+}
+
+_json_backend = "json"
+_json_dumps: JSONDumps = _stdlib_dumps
+_json_loads: JSONLoads = json.loads
+
+
+def get_json_backend() -> str:
+    """Return the name of the JSON backend used for the payloads."""
+    return _json_backend
+
+
+def set_json_backend(name: str | None = None) -> str:
+    """Select the JSON backend used for the payloads.
+
+    The standard library :mod:`json` is used by default. The optional backends can
+    be installed using the `speedups` extra::
+
+        pip install python-miio[speedups]
+
+    Note that the optional backends are not fully equivalent to :mod:`json`:
+    the requests are sent as compact UTF-8 without escaping non-ASCII characters,
+    NaN and infinity are rejected in the responses, and integers not fitting into
+    64 bits are decoded as floats.
+
+    :param name: Name of the backend (orjson, msgspec or json), or None to use
+        the fastest installed one
+    :return: Name of the selected backend
+    :raises ValueError: if the backend is not known
+    :raises ImportError: if the requested backend is not installed
+    """
+    global _json_backend, _json_dumps, _json_loads
+
+    if name is not None and name not in _JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+
+    for candidate in [name] if name is not None else list(_JSON_BACKENDS):
+        try:
+            _json_dumps, _json_loads = _JSON_BACKENDS[candidate]()
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+
+        _json_backend = candidate
+        _LOGGER.debug("Using %s for JSON payloads", candidate)
+        return candidate
+
+    raise Exception("this should never happen")
+
 
 class Utils:
     """This class is adapted from the original xpn.py code by gst666."""
@@ -69,6 +187,18 @@ class Utils:
         iv = Utils.md5(key + token)
         return key, iv
 
+    @staticmethod
+    @lru_cache(maxsize=CIPHER_CACHE_SIZE)
+    def cipher(token: bytes) -> Cipher:
+        """Return the cipher for the given token.
+
+        The key derivation and the token verification are done only once per token,
+        the results are kept in a bounded LRU cache.
+        """
+        Utils.verify_token(token)
+        key, iv = Utils.key_iv(token)
+        return Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+
     @staticmethod
     def encrypt(plaintext: bytes, token: bytes) -> bytes:
         """Encrypt plaintext with a given token.
@@ -79,34 +209,27 @@ class Utils:
         """
         if not isinstance(plaintext, bytes):
             raise TypeError("plaintext requires bytes")
-        Utils.verify_token(token)
-        key, iv = Utils.key_iv(token)
-        padder = padding.PKCS7(128).padder()
+        encryptor = Utils.cipher(token).encryptor()
+        padder = _PKCS7.padder()
 
         padded_plaintext = padder.update(plaintext) + padder.finalize()
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-
-        encryptor = cipher.encryptor()
         return encryptor.update(padded_plaintext) + encryptor.finalize()
 
     @staticmethod
-    def decrypt(ciphertext: bytes, token: bytes) -> bytes:
+    def decrypt(ciphertext: bytes | memoryview, token: bytes) -> bytes:
         """Decrypt ciphertext with a given token.
 
-        :param bytes ciphertext: Ciphertext to decrypt
+        :param bytes ciphertext: Ciphertext to decrypt, a memoryview can be used to
+            avoid copying the data
         :param bytes token: Token to use
         :return: Decrypted bytes object
         """
-        if not isinstance(ciphertext, bytes):
+        if not isinstance(ciphertext, bytes | memoryview):
             raise TypeError("ciphertext requires bytes")
-        Utils.verify_token(token)
-        key, iv = Utils.key_iv(token)
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-
-        decryptor = cipher.decryptor()
+        decryptor = Utils.cipher(token).decryptor()
         padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
 
-        unpadder = padding.PKCS7(128).unpadder()
+        unpadder = _PKCS7.unpadder()
         unpadded_plaintext = unpadder.update(padded_plaintext)
         unpadded_plaintext += unpadder.finalize()
         return unpadded_plaintext
@@ -147,6 +270,142 @@ class TimeAdapter(Adapter):
         return datetime.datetime.fromtimestamp(obj, tz=datetime.UTC)
 
 
+# list of adaption functions for malformed json payload (quirks)
+DECRYPTED_QUIRKS = [
+    # try without modifications first
+    lambda decrypted_bytes: decrypted_bytes,
+    # powerstrip returns malformed JSON if the device is not
+    # connected to the cloud, so we try to fix it here carefully.
+    lambda decrypted_bytes: decrypted_bytes.replace(b',,"otu_stat"', b',"otu_stat"'),
+    # xiaomi cloud returns malformed json when answering _sync.batch_gen_room_up_url
+    # command so try to sanitize it
+    lambda decrypted_bytes: (
+        decrypted_bytes[: decrypted_bytes.rfind(b"\x00")]
+        if b"\x00" in decrypted_bytes
+        else decrypted_bytes
+    ),
+    # fix double-oh values for 090615.curtain.jldj03, ##1411
+    lambda decrypted_bytes: decrypted_bytes.replace(b'"value":00', b'"value":0'),
+    # fix double commas for xiaomi.vacuum.b112, fw: 2.2.4_0049
+    lambda decrypted_bytes: decrypted_bytes.replace(b",,", b","),
+    # fix "result":," no sense key for xiaomi.vacuum.b112, fw:2.2.4_0050
+    lambda decrypted_bytes: decrypted_bytes.replace(b'"result":,', b""),
+]
+
+
+def encode_payload(obj: Any, token: bytes) -> bytes:
+    """Serialize the given payload to JSON and encrypt it with the token.
+
+    :param obj: JSON object to encrypt
+    """
+    with timed(Phase.Encode):
+        data = _json_dumps(obj) + b"\x00"
+    with timed(Phase.Encrypt):
+        return Utils.encrypt(data, token)
+
+
+# index of the quirk that last succeeded per token, tried first for the next payload
+_QUIRK_HINTS: OrderedDict[bytes | None, int] = OrderedDict()
+_QUIRK_HINTS_LOCK = threading.Lock()
+
+# all the byte replacements done by the quirks, matched in a single pass
+_TOLERANT_FIXES = re.compile(rb',,+|"result":,|"value":00')
+_TOLERANT_REPLACEMENTS = {b'"result":,': b"", b'"value":00': b'"value":0'}
+
+
+def _tolerant_fix(match: re.Match) -> bytes:
+    return _TOLERANT_REPLACEMENTS.get(match.group(), b",")
+
+
+def tolerant_loads(decrypted: bytes) -> Any:
+    """Decode JSON after fixing all the known quirks in a single pass.
+
+    This is equivalent to trying each of :data:`DECRYPTED_QUIRKS`, but it also
+    handles payloads containing multiple different quirks.
+    """
+    if b"\x00" in decrypted:
+        decrypted = decrypted[: decrypted.rfind(b"\x00")]
+
+    return _json_loads(_TOLERANT_FIXES.sub(_tolerant_fix, decrypted))
+
+
+def _remember_quirk(token: bytes | None, index: int) -> None:
+    """Store the successful quirk to try it first for the next payload.
+
+    The hints for the least recently used tokens are dropped when the cache is full.
+    """
+    with _QUIRK_HINTS_LOCK:
+        _QUIRK_HINTS[token] = index
+        _QUIRK_HINTS.move_to_end(token)
+        if len(_QUIRK_HINTS) > CIPHER_CACHE_SIZE:
+            _QUIRK_HINTS.popitem(last=False)
+
+
+def decode_payload(
+    data: bytes | memoryview, token: bytes | None, *, tolerant: bool = False
+) -> dict | bytes:
+    """Decrypt the payload and decode it to a JSON object.
+
+    If the decryption fails, the raw bytes are returned.
+    The payload can be given as a memoryview to avoid copying it before decryption.
+
+    Malformed payloads are fixed by trying the quirks one by one, starting with
+    the one that worked for the previous malformed payload using the same token.
+    If `tolerant` is set, all the quirks are instead fixed in a single pass,
+    see :func:`tolerant_loads`.
+
+    :raises PayloadDecodeException: if the decrypted payload is not valid JSON.
+    """
+    # Missing payload is expected for discovery messages.
+    if not data:
+        return bytes(data)
+    try:
+        with timed(Phase.Decrypt):
+            decrypted = Utils.decrypt(data, token)  # type: ignore[arg-type]
+        decrypted = decrypted.rstrip(b"\x00")
+    except Exception:
+        data = bytes(data)
+        _LOGGER.debug("Unable to decrypt, returning raw bytes: %s", data)
+        return data
+
+    with timed(Phase.Decode):
+        return _loads_payload(decrypted, token, tolerant)
+
+
+def _loads_payload(decrypted: bytes, token: bytes | None, tolerant: bool) -> Any:
+    """Decode the decrypted payload, fixing the known quirks if needed."""
+    if tolerant:
+        try:
+            return _json_loads(decrypted)
+        except ValueError:
+            pass
+        try:
+            return tolerant_loads(decrypted)
+        except ValueError as ex:
+            _LOGGER.error("Unable to parse json '%s': %s", decrypted, ex)
+            raise PayloadDecodeException("Unable to parse message payload") from ex
+
+    # the unmodified payload is always tried first to avoid altering valid payloads
+    hint = _QUIRK_HINTS.get(token, 0)
+    order = [0, *sorted(range(1, len(DECRYPTED_QUIRKS)), key=lambda i: i != hint)]
+    for tries, i in enumerate(order, start=1):
+        try:
+            result = _json_loads(DECRYPTED_QUIRKS[i](decrypted))
+        except Exception as ex:
+            # log the error when decrypted bytes couldn't be loaded
+            # after trying all quirk adaptions
+            if tries == len(order):
+                _LOGGER.error("Unable to parse json '%s': %s", decrypted, ex)
+                raise PayloadDecodeException("Unable to parse message payload") from ex
+            continue
+
+        if i != 0:
+            _remember_quirk(token, i)
+        return result
+
+    raise Exception("this should never happen")
+
+
 class EncryptionAdapter(Adapter):
     """Adapter to handle communication encryption."""
 
@@ -155,63 +414,11 @@ class EncryptionAdapter(Adapter):
 
         :param obj: JSON object to encrypt
         """
-        # pp(context)
-        return Utils.encrypt(
-            json.dumps(obj).encode("utf-8") + b"\x00", context["_"]["token"]
-        )
+        return encode_payload(obj, context["_"]["token"])
 
     def _decode(self, obj, context, path) -> dict | bytes:
         """Decrypts the payload using the token stored in the context."""
-        # Missing payload is expected for discovery messages.
-        if not obj:
-            return obj
-        try:
-            decrypted = Utils.decrypt(obj, context["_"]["token"])
-            decrypted = decrypted.rstrip(b"\x00")
-        except Exception:
-            _LOGGER.debug("Unable to decrypt, returning raw bytes: %s", obj)
-            return obj
-
-        # list of adaption functions for malformed json payload (quirks)
-        decrypted_quirks = [
-            # try without modifications first
-            lambda decrypted_bytes: decrypted_bytes,
-            # powerstrip returns malformed JSON if the device is not
-            # connected to the cloud, so we try to fix it here carefully.
-            lambda decrypted_bytes: decrypted_bytes.replace(
-                b',,"otu_stat"', b',"otu_stat"'
-            ),
-            # xiaomi cloud returns malformed json when answering _sync.batch_gen_room_up_url
-            # command so try to sanitize it
-            lambda decrypted_bytes: (
-                decrypted_bytes[: decrypted_bytes.rfind(b"\x00")]
-                if b"\x00" in decrypted_bytes
-                else decrypted_bytes
-            ),
-            # fix double-oh values for 090615.curtain.jldj03, ##1411
-            lambda decrypted_bytes: decrypted_bytes.replace(
-                b'"value":00', b'"value":0'
-            ),
-            # fix double commas for xiaomi.vacuum.b112, fw: 2.2.4_0049
-            lambda decrypted_bytes: decrypted_bytes.replace(b",,", b","),
-            # fix "result":," no sense key for xiaomi.vacuum.b112, fw:2.2.4_0050
-            lambda decrypted_bytes: decrypted_bytes.replace(b'"result":,', b""),
-        ]
-
-        for i, quirk in enumerate(decrypted_quirks):
-            try:
-                decoded = quirk(decrypted).decode("utf-8")
-                return json.loads(decoded)
-            except Exception as ex:
-                # log the error when decrypted bytes couldn't be loaded
-                # after trying all quirk adaptions
-                if i == len(decrypted_quirks) - 1:
-                    _LOGGER.error("Unable to parse json '%s': %s", decrypted, ex)
-                    raise PayloadDecodeException(
-                        "Unable to parse message payload"
-                    ) from ex
-
-        raise Exception("this should never happen")
+        return decode_payload(obj, context["_"].get("token"))
 
 
 Message = Struct(
@@ -240,3 +447,134 @@ Message = Struct(
         Checksum(Bytes(16), Utils.md5, Utils.checksum_field_bytes),
     ),
 )
+
+
+_HEADER = struct.Struct(">HHI4sI")
+_RECEIVE_BUFFERS = threading.local()
+
+
+def receive_buffer() -> bytearray:
+    """Return a buffer for receiving a message, reused within the calling thread.
+
+    The buffer fits the longest possible message, so the received messages are
+    never truncated. Use it with :meth:`socket.socket.recvfrom_into` and pass a
+    memoryview of the received bytes to :meth:`MessageCodec.parse`.
+    """
+    buffer = getattr(_RECEIVE_BUFFERS, "buffer", None)
+    if buffer is None:
+        buffer = _RECEIVE_BUFFERS.buffer = bytearray(MessageCodec.MAX_LENGTH)
+
+    return buffer
+
+
+class MessageCodec:
+    """Construct-free implementation of :data:`Message`.
+
+    This implements the same wire format as :data:`Message` using :mod:`struct`,
+    avoiding the overhead of the interpreted construct machinery on the hot path.
+    The results are :class:`construct.Container` instances with the same layout as
+    the ones returned by :data:`Message`, so they can be used interchangeably.
+
+    :data:`Message` remains the reference implementation and is useful for debugging.
+    """
+
+    MAGIC = 0x2131
+    HEADER_LENGTH = 32
+    #: The length of the message is a 16-bit field in the header
+    MAX_LENGTH = 0xFFFF
+
+    @staticmethod
+    def build(obj: dict, token: bytes) -> bytes:
+        """Build a message from the given container.
+
+        :param obj: dictionary with `data` and `header`, like for :data:`Message`
+        :param token: Token used for encryption and the checksum
+        """
+        data = encode_payload(obj["data"]["value"], token)
+        header = obj["header"]["value"]
+        length = MessageCodec.HEADER_LENGTH + len(data)
+        device_id = header["device_id"]
+        if isinstance(device_id, int):
+            device_id = device_id.to_bytes(4, byteorder="big")
+        if len(device_id) != 4:
+            raise ValueError(f"Invalid device id: {device_id!r}")
+
+        raw_header = _HEADER.pack(
+            MessageCodec.MAGIC,
+            length,
+            header.get("unknown", 0),
+            device_id,
+            calendar.timegm(header["ts"].timetuple()),
+        )
+        # the encrypted payload is never empty, so the checksum is always computed
+        checksum = Utils.md5(raw_header + token + data)
+
+        return raw_header + checksum + data
+
+    @staticmethod
+    def parse(
+        data: bytes | bytearray | memoryview,
+        token: bytes | None = None,
+        *,
+        tolerant: bool = False,
+    ) -> Container:
+        """Parse the given message.
+
+        The message is parsed without copying it before the decryption, which allows
+        receiving into a reusable buffer. The returned container does not refer to
+        the given data.
+
+        :param data: Raw message
+        :param token: Token used for decryption and checksum verification
+        :param tolerant: Fix malformed payloads in a single pass, see
+            :func:`decode_payload`
+        :raises ChecksumError: if the checksum does not match
+        :raises PayloadDecodeException: if the payload is not valid JSON, or the
+            message is shorter than the length given in its header
+        """
+        view = memoryview(data)
+        if len(view) < MessageCodec.HEADER_LENGTH:
+            raise StreamError(f"Message too short ({len(view)} bytes)")
+
+        magic, length, unknown, device_id, ts = _HEADER.unpack_from(view)
+        if magic != MessageCodec.MAGIC:
+            raise ConstError(f"Invalid magic {magic:#x}")
+        if len(view) < length:
+            raise PayloadDecodeException(
+                f"Truncated message, got {len(view)} of {length} bytes"
+            )
+
+        raw_header = bytes(view[:16])
+        checksum = bytes(view[16:32])
+        payload = view[32:]
+        if length != MessageCodec.HEADER_LENGTH:
+            if token is None:
+                raise ChecksumError("Token is required to verify the checksum")
+            expected = hashlib.md5(raw_header)  # noqa: S324
+            expected.update(token)
+            expected.update(payload)
+            if expected.digest() != checksum:
+                raise ChecksumError("Wrong checksum")
+
+        return Container(
+            data=Container(
+                data=bytes(payload),
+                value=decode_payload(payload, token, tolerant=tolerant),
+                offset1=32,
+                offset2=len(view),
+                length=len(payload),
+            ),
+            header=Container(
+                data=raw_header,
+                value=Container(
+                    length=length,
+                    unknown=unknown,
+                    device_id=device_id,
+                    ts=datetime.datetime.fromtimestamp(ts, tz=datetime.UTC),
+                ),
+                offset1=0,
+                offset2=16,
+                length=16,
+            ),
+            checksum=checksum,
+        )
@@ -54,11 +54,24 @@ class PushServer:
         await push_server.stop()
     """
 
-    def __init__(self, *, device_ip=None, device_id=None):
-        """Initialize the class."""
+    def __init__(
+        self,
+        *,
+        device_ip=None,
+        device_id=None,
+        address="0.0.0.0",  # noqa: S104
+        port=SERVER_PORT,
+    ):
+        """Initialize the class.
+
+        The address and the port can be changed to run multiple servers on a single
+        host, e.g., for simulating many devices. Use port 0 to bind to a free port,
+        the bound port is available as :attr:`server_port` after starting.
+        """
         self._device_ip = device_ip
 
-        self._address = "0.0.0.0"  # noqa: S104
+        self._address = address
+        self._port = port
         self._server_ip = None
 
         self._device_id = device_id if device_id is not None else int(FAKE_DEVICE_ID)
@@ -211,7 +224,7 @@ class PushServer:
     async def _get_server_ip(self):
         """Connect to the miio device to get server_ip using a one time use socket."""
         get_ip_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-        get_ip_socket.bind((self._address, SERVER_PORT))
+        get_ip_socket.bind((self._address, self._port))
         get_ip_socket.setblocking(False)
         await self._loop.sock_connect(get_ip_socket, (self._device_ip, SERVER_PORT))
         server_ip = get_ip_socket.getsockname()[0]
@@ -226,8 +239,9 @@ class PushServer:
 
         # Create a fresh socket that will be used for the push server
         udp_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-        udp_socket.bind((self._address, SERVER_PORT))
+        udp_socket.bind((self._address, self._port))
         udp_socket.setblocking(False)
+        self._port = udp_socket.getsockname()[1]
 
         return await self._loop.create_datagram_endpoint(
             lambda: ServerProtocol(self._loop, udp_socket, self),
@@ -314,6 +328,11 @@ class PushServer:
         """Return the IP of the device running this server."""
         return self._server_ip
 
+    @property
+    def server_port(self) -> int:
+        """Return the port the server is listening on."""
+        return self._port
+
     @property
     def device_id(self):
         """Return the ID of the fake device beeing emulated."""
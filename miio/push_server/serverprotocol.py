@@ -3,7 +3,7 @@ import datetime
 import logging
 import struct
 
-from ..protocol import Message
+from ..protocol import MessageCodec
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -69,7 +69,7 @@ class ServerProtocol:
             "header": {"value": header},
             "checksum": 0,
         }
-        response = Message.build(msg, token=token)
+        response = MessageCodec.build(msg, token=token)
 
         return response
 
@@ -94,7 +94,7 @@ class ServerProtocol:
         token = self.server._registered_devices[host]["token"]
         callback = self.server._registered_devices[host]["callback"]
 
-        msg = Message.parse(data, token=token)
+        msg = MessageCodec.parse(data, token=token)
         msg_value = msg.data.value
         msg_id = msg_value["id"]
         _LOGGER.debug("<< %s:%s: %s", host, port, msg_value)
@@ -114,7 +114,7 @@ class ServerProtocol:
     def _handle_datagram_from_client(self, host: str, port: int, data):
         """Handle datagram from a regular client."""
         token = bytes.fromhex(32 * "0")  # TODO: make token configurable?
-        msg = Message.parse(data, token=token)
+        msg = MessageCodec.parse(data, token=token)
         msg_value = msg.data.value
         msg_id = msg_value["id"]
 
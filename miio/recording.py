@@ -0,0 +1,230 @@
+"""Recording and replaying the communication with devices.
+
+The requests sent to a device and the decrypted responses can be recorded to a file
+using :class:`Recorder`::
+
+    with Recorder("vacuum.jsonl.gz") as recorder:
+        dev = RoborockVacuum(ip, token, recorder=recorder)
+        dev.status()
+
+The recorded exchanges can then be served back without the device using
+:class:`Replay`, either with the original timing or scaled by `time_scale`::
+
+    dev = RoborockVacuum(ip, token, replay=Replay.from_file("vacuum.jsonl.gz"))
+    dev.status()
+
+This allows running realistic workloads, e.g., for benchmarking, without having
+access to the devices.
+"""
+
+import gzip
+import json
+import logging
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from os import PathLike
+from time import monotonic
+from typing import IO, Any, Literal
+
+import attr
+
+from .exceptions import DeviceError, DeviceException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(auto_attribs=True)
+class Exchange:
+    """Request sent to a device and the outcome of it."""
+
+    method: str
+    params: Any = None
+    extra: dict | None = None
+    result: Any = None
+    #: Error code and message for failed requests
+    error: dict | None = None
+    #: Seconds from sending the request to receiving the response
+    elapsed: float = 0.0
+    #: Seconds from the start of the recording to sending the request
+    offset: float = 0.0
+
+    @property
+    def key(self) -> str:
+        """Return the key used for matching the requests."""
+        return json.dumps([self.method, self.params, self.extra], sort_keys=True)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the exchange as a dict, leaving out the unset fields."""
+        return {
+            k: v for k, v in attr.asdict(self).items() if v is not None or k == "result"
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Exchange":
+        """Create an exchange from the dict returned by :func:`to_dict`."""
+        return cls(**data)
+
+    def outcome(self) -> Any:
+        """Return the recorded result, or raise the recorded error."""
+        if self.error is None:
+            return self.result
+
+        if "code" in self.error:
+            raise DeviceError(self.error)
+
+        raise DeviceException(self.error.get("message"))
+
+
+def _open(path: str | PathLike, mode: Literal["rt", "wt"]) -> IO[str]:
+    """Open the file, using gzip compression based on the file extension."""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+
+    return open(path, mode, encoding="utf-8")
+
+
+def load_exchanges(path: str | PathLike) -> list[Exchange]:
+    """Load the exchanges from a file created by :class:`Recorder`."""
+    with _open(path, "rt") as file:
+        return [Exchange.from_dict(json.loads(line)) for line in file if line.strip()]
+
+
+class Recorder:
+    """Record the exchanges with the devices to a file.
+
+    The file contains a JSON object per line and is gzip-compressed if the name ends
+    with `.gz`. A single recorder can be shared by multiple devices.
+    """
+
+    def __init__(self, path: str | PathLike) -> None:
+        self.path = path
+        self._file: IO[str] | None = _open(path, "wt")
+        self._lock = threading.Lock()
+        self._started = monotonic()
+        self.count = 0
+
+    def record(
+        self,
+        method: str,
+        params: Any = None,
+        extra: dict | None = None,
+        *,
+        started: float,
+        result: Any = None,
+        error: DeviceException | None = None,
+    ) -> Exchange:
+        """Record an exchange started at the given :func:`time.monotonic` time."""
+        exchange = Exchange(
+            method,
+            params,
+            extra,
+            result=result,
+            elapsed=monotonic() - started,
+            offset=started - self._started,
+        )
+        if isinstance(error, DeviceError):
+            exchange.error = {"code": error.code, "message": error.message}
+        elif error is not None:
+            exchange.error = {"message": str(error)}
+
+        line = json.dumps(exchange.to_dict(), separators=(",", ":"), default=repr)
+        with self._lock:
+            if self._file is None:
+                _LOGGER.debug("Recorder is closed, dropping %s", exchange)
+                return exchange
+            self._file.write(line + "\n")
+            self.count += 1
+
+        return exchange
+
+    @contextmanager
+    def recording(
+        self, method: str, params: Any = None, extra: dict | None = None
+    ) -> Iterator[Exchange]:
+        """Record the exchange done inside the block.
+
+        The result has to be stored to the yielded exchange, the raised device
+        errors are recorded automatically::
+
+            with recorder.recording("get_prop", ["power"]) as exchange:
+                exchange.result = protocol.send("get_prop", ["power"])
+        """
+        started = monotonic()
+        exchange = Exchange(method, params, extra)
+        try:
+            yield exchange
+        except DeviceException as ex:
+            self.record(method, params, extra, started=started, error=ex)
+            raise
+
+        self.record(method, params, extra, started=started, result=exchange.result)
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        with self._lock:
+            file, self._file = self._file, None
+
+        if file is not None:
+            file.close()
+            _LOGGER.debug("Recorded %s exchanges to %s", self.count, self.path)
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Replay:
+    """Serve the recorded exchanges back.
+
+    The requests are matched using the method and the parameters. When the same
+    request was recorded multiple times, the responses are returned in the recorded
+    order, and starting over from the first one when `loop` is set.
+
+    :param exchanges: Recorded exchanges
+    :param time_scale: Multiplier for the recorded response times, 0 to respond
+        immediately
+    :param loop: Start over after all responses to a request have been used
+    """
+
+    def __init__(
+        self, exchanges: Iterable[Exchange], *, time_scale: float = 1.0, loop=True
+    ) -> None:
+        self.time_scale = time_scale
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._recorded: dict[str, list[Exchange]] = {}
+        for exchange in exchanges:
+            self._recorded.setdefault(exchange.key, []).append(exchange)
+        self._queues = {
+            key: deque(recorded) for key, recorded in self._recorded.items()
+        }
+
+    @classmethod
+    def from_file(cls, path: str | PathLike, **kwargs) -> "Replay":
+        """Create a replay from a file created by :class:`Recorder`."""
+        return cls(load_exchanges(path), **kwargs)
+
+    def next(
+        self, method: str, params: Any = None, extra: dict | None = None
+    ) -> Exchange:
+        """Return the next recorded exchange for the request.
+
+        :raises DeviceException: if the request has not been recorded.
+        """
+        key = Exchange(method, params, extra).key
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue and self.loop and key in self._recorded:
+                queue = self._queues[key] = deque(self._recorded[key])
+            if not queue:
+                raise DeviceException(f"No recorded response for {method} {params}")
+
+            return queue.popleft()
+
+    def delay(self, exchange: Exchange) -> float:
+        """Return how long to wait before responding."""
+        return exchange.elapsed * self.time_scale
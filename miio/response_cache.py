@@ -0,0 +1,111 @@
+"""Read-through cache for the responses of idempotent commands.
+
+Integrations and their consumers often request the same information several times
+in a short period, e.g., when multiple entities are updated using the same device.
+:class:`ResponseCache` stores the responses of the read-only commands for a short
+time to avoid the duplicate round trips::
+
+    dev = Device(ip, token, response_cache=ResponseCache())
+
+Any other command is considered to change the state of the device, and clears the
+cache after it has been sent.
+"""
+
+import copy
+import json
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Final
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Returned by :meth:`ResponseCache.get` when there is no valid cached response.
+MISSING: Final = object()
+
+#: Default time-to-live in seconds for the cached commands.
+DEFAULT_TTLS: dict[str, float] = {
+    "miIO.info": 60,
+    "get_prop": 1,
+    "get_properties": 1,
+    "get_room_mapping": 60,
+    "get_consumable": 10,
+    "get_timer": 10,
+}
+
+
+class ResponseCache:
+    """LRU cache for command responses with per-command expiration times.
+
+    The entries are keyed by the command and its parameters. Only the commands
+    with a TTL are cached, sending any other command clears the cache.
+    """
+
+    def __init__(self, ttls: dict[str, float] | None = None, *, maxsize: int = 128):
+        """Create a cache.
+
+        :param ttls: Time-to-live in seconds per command, defaults to
+            :data:`DEFAULT_TTLS`
+        :param maxsize: Maximum number of cached responses
+        """
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_cacheable(self, method: str) -> bool:
+        """Return True if the responses for the command are cached."""
+        return method in self.ttls
+
+    @staticmethod
+    def _key(method: str, params: Any, extra_parameters: Any) -> tuple[str, str]:
+        return method, json.dumps([params, extra_parameters], sort_keys=True)
+
+    def get(self, method: str, params: Any = None, extra_parameters: Any = None):
+        """Return a copy of the cached response, or :data:`MISSING`."""
+        if not self.is_cacheable(method):
+            return MISSING
+
+        key = self._key(method, params, extra_parameters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+
+            expires, result = entry
+            if expires <= monotonic():
+                del self._entries[key]
+                return MISSING
+
+            self._entries.move_to_end(key)
+
+        _LOGGER.debug("Using cached response for %s(%s)", method, params)
+        # the callers are free to modify the returned values
+        return copy.deepcopy(result)
+
+    def put(self, method: str, params: Any, extra_parameters: Any, result: Any) -> None:
+        """Store the response, if the command is cacheable."""
+        if not self.is_cacheable(method):
+            return
+
+        key = self._key(method, params, extra_parameters)
+        expires = monotonic() + self.ttls[method]
+        with self._lock:
+            self._entries[key] = (expires, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, method: str | None = None) -> None:
+        """Remove the cached responses for the given command, or all if None."""
+        with self._lock:
+            if method is None:
+                self._entries.clear()
+                return
+
+            for key in [key for key in self._entries if key[0] == method]:
+                del self._entries[key]
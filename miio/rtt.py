@@ -0,0 +1,83 @@
+"""Round-trip time estimation for adaptive retransmission timeouts.
+
+The estimator follows the algorithm used by TCP (RFC 6298): the smoothed round-trip
+time and its variance are updated from each measured sample, and the retransmission
+timeout is derived from these. Retransmissions back off exponentially with a bit of
+jitter to avoid synchronized retries from multiple clients.
+"""
+
+import random
+
+#: Gain for the smoothed round-trip time
+ALPHA = 1 / 8
+#: Gain for the round-trip time variance
+BETA = 1 / 4
+#: Multiplier for the variance when calculating the timeout
+K = 4
+
+
+class RTTEstimator:
+    """Estimate the retransmission timeout from measured round-trip times.
+
+    Until the first sample is received, the initial timeout is used.
+    """
+
+    #: Relative amount of random jitter added to the backed off timeouts
+    JITTER = 0.1
+
+    def __init__(
+        self,
+        initial_timeout: float,
+        *,
+        min_timeout: float = 0.2,
+        max_timeout: float | None = None,
+    ) -> None:
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout if max_timeout is not None else initial_timeout
+        self.srtt: float | None = None
+        self.rttvar: float | None = None
+
+    def update(self, sample: float) -> None:
+        """Update the estimate with a measured round-trip time in seconds."""
+        if self.srtt is None or self.rttvar is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+            return
+
+        self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - sample)
+        self.srtt = (1 - ALPHA) * self.srtt + ALPHA * sample
+
+    @property
+    def rto(self) -> float:
+        """Return the retransmission timeout for the first attempt."""
+        if self.srtt is None or self.rttvar is None:
+            return self.initial_timeout
+
+        return self._clamp(self.srtt + K * self.rttvar)
+
+    def timeout(self, attempt: int = 0) -> float:
+        """Return the timeout for the given attempt, 0 being the first one.
+
+        The timeout is doubled for each retransmission and randomized by
+        :attr:`JITTER` to avoid synchronized retries.
+        """
+        if attempt == 0:
+            return self.rto
+
+        backoff = self.rto * 2**attempt
+        backoff *= random.uniform(1 - self.JITTER, 1 + self.JITTER)  # noqa: S311
+        return self._clamp(backoff)
+
+    def reset(self) -> None:
+        """Forget the measurements, e.g., when the device has been unreachable."""
+        self.srtt = None
+        self.rttvar = None
+
+    def _clamp(self, timeout: float) -> float:
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def __repr__(self) -> str:
+        return (
+            f"<RTTEstimator srtt={self.srtt} rttvar={self.rttvar} rto={self.rto:.3f}>"
+        )
@@ -0,0 +1,308 @@
+"""Request scheduling with priorities and rate limits.
+
+Some devices drop requests when they receive them too quickly, while interactive
+commands should not wait behind the background polling. :class:`RequestScheduler`
+sends the requests of a device one at a time, ordered by their priority, and limits
+the request rate using a token bucket.
+
+The priority is given using the :func:`request_priority` context manager, which
+applies to all requests sent within it, including the ones sent by the integrations::
+
+    scheduler = RequestScheduler(rate=2)
+    dev = Device(ip, token, scheduler=scheduler)
+
+    with request_priority(Priority.Polling, supersede="status"):
+        dev.status()
+
+The asyncio methods of the device go through the same queue using
+:meth:`RequestScheduler.async_run`.
+
+A newer :func:`request_priority` block with the same `supersede` key cancels the
+requests of the older blocks, so a slow device does not fall behind by answering
+outdated polls. This covers the whole operation: if the older poll is still in
+progress, its remaining requests fail instead of the newer poll.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from enum import IntEnum
+from time import monotonic, sleep
+from typing import TypeVar
+
+import attr
+
+from .exceptions import RequestCancelledException
+
+_LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Request priority, lower values are sent first."""
+
+    Interactive = 0
+    Polling = 1
+    Bulk = 2
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class _RequestContext:
+    priority: Priority = Priority.Interactive
+    supersede: str | None = None
+    generation: int = 0
+
+
+_GENERATIONS = itertools.count(1)
+_DEFAULT_CONTEXT = _RequestContext()
+_CONTEXT: ContextVar[_RequestContext] = ContextVar(
+    "miio_request_context", default=_DEFAULT_CONTEXT
+)
+
+
+@contextmanager
+def request_priority(
+    priority: Priority, *, supersede: str | None = None
+) -> Iterator[None]:
+    """Set the priority for the requests sent within the context.
+
+    :param priority: Priority of the requests
+    :param supersede: Key for cancelling the requests of the older blocks using the
+        same key
+    """
+    generation = next(_GENERATIONS) if supersede is not None else 0
+    token = _CONTEXT.set(
+        _RequestContext(priority=priority, supersede=supersede, generation=generation)
+    )
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def current_priority() -> Priority:
+    """Return the priority set by the enclosing :func:`request_priority`."""
+    return _CONTEXT.get().priority
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts of `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens / self.rate
+
+
+@attr.s(auto_attribs=True, order=False)
+class _Ticket:
+    priority: int
+    seq: int
+    supersede: str | None
+    generation: int = 0
+    cancelled: bool = False
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RequestScheduler:
+    """Send requests one at a time in the order of their priority.
+
+    Requests with the same priority are sent in the order they were scheduled.
+    """
+
+    def __init__(self, rate: float | None = None, *, burst: int = 1) -> None:
+        """Create a scheduler.
+
+        :param rate: Maximum number of requests per second, unlimited if None
+        :param burst: Number of requests that can be sent without waiting
+        """
+        self.rate = rate
+        self._bucket = TokenBucket(rate, burst) if rate is not None else None
+        self._queue: list[_Ticket] = []
+        self._busy = False
+        self._counter = itertools.count()
+        self._latest: dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def pending(self) -> int:
+        """Return the number of queued requests."""
+        with self._cond:
+            return sum(not ticket.cancelled for ticket in self._queue)
+
+    def run(self, fn: Callable[..., T], /, *args, **kwargs) -> T:
+        """Call `fn(*args, **kwargs)` when it is its turn.
+
+        The priority is taken from the current :func:`request_priority` context.
+
+        :raises RequestCancelledException: if superseded by a newer operation.
+        """
+        context = _CONTEXT.get()
+        ticket = self._enqueue(context)
+        self._wait_turn(ticket)
+        try:
+            if self._bucket is not None and (delay := self._bucket.reserve()) > 0:
+                _LOGGER.debug("Rate limited, waiting %.3fs", delay)
+                sleep(delay)
+
+            return fn(*args, **kwargs)
+        finally:
+            self._release()
+
+    async def async_run(self, fn: Callable[..., Awaitable[T]], /, *args, **kwargs) -> T:
+        """Await `fn(*args, **kwargs)` when it is its turn.
+
+        This shares the queue with :func:`run`, see it for details.
+
+        :raises RequestCancelledException: if superseded by a newer operation.
+        """
+        context = _CONTEXT.get()
+        ticket = self._enqueue(context)
+        try:
+            await self._async_wait_turn(ticket)
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+
+        try:
+            if self._bucket is not None and (delay := self._bucket.reserve()) > 0:
+                _LOGGER.debug("Rate limited, waiting %.3fs", delay)
+                await asyncio.sleep(delay)
+
+            return await fn(*args, **kwargs)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Let the next request run."""
+        with self._cond:
+            self._busy = False
+            self._notify()
+
+    def _cancel(self, ticket: _Ticket) -> None:
+        """Remove a ticket whose caller stopped waiting."""
+        with self._cond:
+            ticket.cancelled = True
+            self._notify()
+
+    def _notify(self) -> None:
+        """Wake up all waiting requests, must be called with the lock held."""
+        self._cond.notify_all()
+        for loop, waiter in self._waiters:
+            # the loop of an abandoned waiter may already be closed
+            with suppress(RuntimeError):
+                loop.call_soon_threadsafe(_wake, waiter)
+        self._waiters.clear()
+
+    def _enqueue(self, context: _RequestContext) -> _Ticket:
+        ticket = _Ticket(
+            priority=context.priority,
+            seq=next(self._counter),
+            supersede=context.supersede,
+            generation=context.generation,
+        )
+        with self._cond:
+            if ticket.supersede is not None:
+                self._supersede(ticket, ticket.supersede)
+
+            heapq.heappush(self._queue, ticket)
+
+        return ticket
+
+    def _supersede(self, ticket: _Ticket, key: str) -> None:
+        """Cancel the requests of the operations older than the ticket's.
+
+        :raises RequestCancelledException: if the ticket belongs to an operation
+            superseded by a newer one.
+        """
+        latest = self._latest.get(key, 0)
+        if ticket.generation < latest:
+            raise RequestCancelledException(
+                f"Request superseded by a newer '{key}' request"
+            )
+
+        if ticket.generation == latest:
+            return
+
+        self._latest[key] = ticket.generation
+        for queued in self._queue:
+            if queued.supersede == key and not queued.cancelled:
+                _LOGGER.debug("Cancelling superseded request %s", queued)
+                queued.cancelled = True
+        self._notify()
+
+    def _wait_turn(self, ticket: _Ticket) -> None:
+        """Wait until the ticket is the first in the queue and nothing is running."""
+        with self._cond:
+            while not self._take_turn(ticket):
+                self._cond.wait()
+
+    async def _async_wait_turn(self, ticket: _Ticket) -> None:
+        """Wait for the turn of the ticket without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._take_turn(ticket):
+                    return
+
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+
+            await waiter
+
+    def _take_turn(self, ticket: _Ticket) -> bool:
+        """Start running the ticket if it is its turn, called with the lock held.
+
+        :raises RequestCancelledException: if the ticket has been cancelled.
+        """
+        while self._queue and self._queue[0].cancelled:
+            heapq.heappop(self._queue)
+
+        if ticket.cancelled:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            self._notify()
+            raise RequestCancelledException(
+                f"Request superseded by a newer '{ticket.supersede}' request"
+            )
+
+        if not self._busy and self._queue[0] is ticket:
+            heapq.heappop(self._queue)
+            self._busy = True
+            return True
+
+        return False
+
+    def __repr__(self) -> str:
+        return f"<RequestScheduler pending={self.pending} busy={self._busy}>"
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
@@ -2,6 +2,47 @@ import pytest
 
 from ..device import Device
 from ..devicestatus import DeviceStatus, action, sensor, setting
+from ..devtools.simulators.farm import SimulatedDevice
+from ..miioprotocol import MiIOProtocol
+from .dummies import DummyUDPDevice
+
+TOKEN = 32 * "0"
+
+
+@pytest.fixture
+def dummy_udp_device():
+    """Returns a device responding on a local UDP socket."""
+    dev = DummyUDPDevice(token=TOKEN).start()
+    yield dev
+    dev.stop()
+
+
+def protocol_for(dummy, cls=MiIOProtocol, *, discovered=True, timeout=1, **kwargs):
+    """Return a protocol for the dummy or simulated device.
+
+    The handshake is skipped unless `discovered` is False.
+    """
+    if isinstance(dummy, SimulatedDevice):
+        ip, port = dummy.ip, dummy.port
+        device_id = dummy.device_id.to_bytes(4, "big")
+    else:
+        ip, port = dummy.addr
+        device_id = dummy.DEVICE_ID
+
+    proto = cls(ip, TOKEN, timeout=timeout, port=port, **kwargs)
+    if discovered:
+        proto._discovered = True
+        proto._device_id = device_id
+    return proto
+
+
+def device_for(dummy, cls=Device, *, timeout=1, **kwargs):
+    """Return a device for the dummy device, skipping the handshake."""
+    ip, port = dummy.addr
+    dev = cls(ip, TOKEN, timeout=timeout, port=port, **kwargs)
+    dev._protocol._discovered = True
+    dev._protocol._device_id = dummy.DEVICE_ID
+    return dev
 
 
 @pytest.fixture
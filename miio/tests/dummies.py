@@ -1,4 +1,11 @@
-from miio import DescriptorCollection, DeviceError
+import socket
+import struct
+import threading
+from datetime import UTC, datetime
+
+from miio import DescriptorCollection, DeviceError, Message
+from miio.miioprotocol import HELO_BYTES
+from miio.protocol import Utils
 
 
 class DummyMiIOProtocol:
@@ -99,3 +106,91 @@ class DummyMiotDevice(DummyDevice):
             if prop["did"] == property_key:
                 prop["value"] = value
         return None
+
+
+class DummyUDPDevice:
+    """Fake miIO device answering requests on a loopback UDP socket.
+
+    The responses are created by calling `handler` with the decrypted request
+    payload, returning None causes the request to be dropped.
+    This allows testing the protocol implementations against a real socket.
+    """
+
+    DEVICE_ID = b"\x01\x02\x03\x04"
+
+    def __init__(self, handler=None, token=32 * "0", ip="127.0.0.1", port=0):
+        self.token = bytes.fromhex(token)
+        self.response_token: bytes | None = None
+        self.handler = handler or (lambda payload: {"result": ["ok"]})
+        self.requests: list[dict] = []
+        self.last_addr = None
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((ip, port))
+        self._sock.settimeout(0.05)
+        self._running = False
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    @property
+    def addr(self) -> tuple[str, int]:
+        return self._sock.getsockname()
+
+    def start(self) -> "DummyUDPDevice":
+        self._running = True
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self._thread.join()
+        self._sock.close()
+
+    def respond(self, payload: dict, addr, result: dict) -> None:
+        header = {
+            "length": 0,
+            "unknown": 0,
+            "device_id": self.DEVICE_ID,
+            "ts": datetime.now(tz=UTC),
+        }
+        msg = {
+            "data": {"value": {**result, "id": payload["id"]}},
+            "header": {"value": header},
+            "checksum": 0,
+        }
+        token = self.response_token or self.token
+        self._sock.sendto(Message.build(msg, token=token), addr)
+
+    def respond_raw(self, plaintext: bytes, addr) -> None:
+        """Respond with an arbitrary, possibly malformed, payload."""
+        token = self.response_token or self.token
+        data = Utils.encrypt(plaintext, token)
+        ts = int(datetime.now(tz=UTC).timestamp())
+        header = struct.pack(">HHI4sI", 0x2131, 32 + len(data), 0, self.DEVICE_ID, ts)
+        self._sock.sendto(header + Utils.md5(header + token + data) + data, addr)
+
+    def _serve(self) -> None:
+        while self._running:
+            try:
+                data, addr = self._sock.recvfrom(4096)
+            except TimeoutError:
+                continue
+            if data == HELO_BYTES:
+                self._sock.sendto(
+                    struct.pack(
+                        ">HHI4sI16s",
+                        0x2131,
+                        32,
+                        0,
+                        self.DEVICE_ID,
+                        int(datetime.now(tz=UTC).timestamp()),
+                        self.token,
+                    ),
+                    addr,
+                )
+                continue
+
+            payload = Message.parse(data, token=self.token).data.value
+            self.requests.append(payload)
+            self.last_addr = addr
+            result = self.handler(payload)
+            if result is not None:
+                self.respond(payload, addr, result)
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from miio import Device, DeviceError, DeviceException, InvalidTokenException
+from miio.miioprotocol import AsyncMiIOProtocol
+
+from .conftest import TOKEN, device_for, protocol_for
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_async_send(dummy_udp_device):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol)
+
+    assert await proto.async_send("echo", ["foo", 1]) == ["foo", 1]
+    assert dummy_udp_device.requests[0]["method"] == "echo"
+    assert proto.raw_id == dummy_udp_device.requests[0]["id"]
+
+
+async def test_async_send_concurrent(dummy_udp_device):
+    """Requests to multiple devices can be awaited concurrently."""
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    protos = [protocol_for(dummy_udp_device, AsyncMiIOProtocol) for _ in range(5)]
+
+    res = await asyncio.gather(
+        *(proto.async_send("echo", [idx]) for idx, proto in enumerate(protos))
+    )
+    assert res == [[idx] for idx in range(5)]
+
+
+async def test_async_send_device_error(dummy_udp_device):
+    dummy_udp_device.handler = lambda payload: {
+        "error": {"code": -1, "message": "error"}
+    }
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol)
+
+    with pytest.raises(DeviceError):
+        await proto.async_send("fail")
+
+
+async def test_async_send_invalid_token(dummy_udp_device):
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol)
+    dummy_udp_device.response_token = bytes.fromhex(32 * "f")
+
+    with pytest.raises(InvalidTokenException):
+        await proto.async_send("info")
+
+
+async def test_async_send_retry(dummy_udp_device, mocker):
+    """Timeouts are retried with a new handshake and an incremented id."""
+    calls = []
+
+    def _drop_first(payload):
+        calls.append(payload["id"])
+        if len(calls) == 1:
+            return None
+        return {"result": "ok"}
+
+    dummy_udp_device.handler = _drop_first
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, timeout=0.1)
+    handshake = mocker.patch.object(proto, "async_send_handshake")
+
+    assert await proto.async_send("retry", retry_count=1) == "ok"
+    handshake.assert_called_once()
+    assert calls[1] - calls[0] > 100
+
+
+async def test_async_send_no_response(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, timeout=0.05)
+    mocker.patch.object(proto, "async_send_handshake")
+
+    with pytest.raises(DeviceException, match="No response"):
+        await proto.async_send("nothing", retry_count=1)
+
+    assert len(dummy_udp_device.requests) == 2
+
+
+async def test_async_send_handshake(mocker):
+    proto = AsyncMiIOProtocol("127.0.0.1", TOKEN)
+    discover = mocker.patch.object(
+        AsyncMiIOProtocol, "async_discover", side_effect=DeviceException("fail")
+    )
+
+    with pytest.raises(DeviceException):
+        await proto.async_send_handshake(retry_count=2)
+
+    assert discover.call_count == 3
+
+
+async def test_device_async_methods(dummy_udp_device):
+    info = {"model": "dummy.model", "mac": "00:00:00:00:00:00"}
+
+    def _handler(payload):
+        if payload["method"] == "miIO.info":
+            return {"result": info}
+        return {"result": payload["params"]}
+
+    dummy_udp_device.handler = _handler
+    dev = device_for(dummy_udp_device)
+
+    assert (await dev.async_info()).model == "dummy.model"
+    assert await dev.async_send("echo", [1]) == [1]
+
+    props = list(range(5))
+    assert await dev.async_get_properties(props, max_properties=2) == props
+    assert len(dummy_udp_device.requests) == 5
+
+
+async def test_device_async_status_fallback(mocker):
+    """The default async_status calls the blocking status() in an executor."""
+    status = mocker.patch("miio.Device.status", return_value="status")
+    dev = Device("127.0.0.1", TOKEN)
+
+    assert await dev.async_status() == "status"
+    status.assert_called_once()
@@ -0,0 +1,201 @@
+import asyncio
+import struct
+
+import pytest
+
+from miio import DeviceError, DeviceException, DeviceUnavailableException
+from miio.circuitbreaker import CircuitBreaker, CircuitState
+from miio.miioprotocol import AsyncMiIOProtocol, MiIOProtocol
+from miio.protocol import MessageCodec
+
+from .conftest import protocol_for
+
+
+@pytest.fixture
+def clock(mocker):
+    now = [0.0]
+    mocker.patch("miio.circuitbreaker.monotonic", side_effect=lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+
+def test_states(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    assert breaker.state == CircuitState.Closed
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Closed
+    assert not breaker.before_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Open
+    with pytest.raises(DeviceUnavailableException, match="retrying in 10s"):
+        breaker.before_request()
+
+    clock[0] = 10
+    assert breaker.state == CircuitState.HalfOpen
+    assert breaker.before_request()
+    # only a single probe is allowed at a time
+    with pytest.raises(DeviceUnavailableException):
+        breaker.before_request()
+
+    # failed probe opens the breaker again
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Open
+
+    clock[0] = 20
+    assert breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.Closed
+    assert breaker.failures == 0
+
+
+def test_fail_fast(dummy_udp_device, breaker, clock, mocker):
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(dummy_udp_device, timeout=0.05, circuit_breaker=breaker)
+    mocker.patch.object(proto, "send_handshake")
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="No response"):  # noqa: B017
+            proto.send("echo", retry_count=0)
+
+    assert breaker.state == CircuitState.Open
+    with pytest.raises(DeviceUnavailableException):
+        proto.send("echo")
+
+    assert len(dummy_udp_device.requests) == 2
+
+
+def test_fail_fast_pipelined(dummy_udp_device, clock, mocker):
+    """Batches without any response count as failures."""
+    dummy_udp_device.handler = lambda payload: None
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    proto = protocol_for(
+        dummy_udp_device, timeout=0.05, circuit_breaker=breaker, max_in_flight=2
+    )
+    mocker.patch.object(proto, "send_handshake")
+    requests = [("echo", [idx]) for idx in range(2)]
+
+    for _ in range(breaker.failure_threshold):
+        results = proto.send_many(requests, retry_count=0, return_exceptions=True)
+        assert all(isinstance(res, DeviceException) for res in results)
+
+    assert breaker.state == CircuitState.Open
+    with pytest.raises(DeviceUnavailableException):
+        proto.send_many(requests, return_exceptions=True)
+
+
+def test_pipelined_success_closes(dummy_udp_device):
+    """A batch with at least one response counts as a success."""
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    proto = protocol_for(dummy_udp_device, circuit_breaker=breaker, max_in_flight=2)
+
+    assert proto.send_many([("echo", [0]), ("echo", [1])]) == [[0], [1]]
+    assert breaker.failures == 0
+
+
+def test_probe(dummy_udp_device, breaker, clock, mocker):
+    dummy_udp_device.handler = lambda payload: {"result": "ok"}
+    proto = protocol_for(dummy_udp_device, timeout=0.05, circuit_breaker=breaker)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    clock[0] = 30
+    discover = mocker.patch.object(MiIOProtocol, "discover", return_value=None)
+    with pytest.raises(DeviceUnavailableException, match="probe"):
+        proto.send("echo")
+    assert breaker.state == CircuitState.Open
+    assert not dummy_udp_device.requests
+
+    clock[0] = 60
+    hello = struct.pack(
+        ">HHI4sI16s", 0x2131, 32, 0, dummy_udp_device.DEVICE_ID, 1000, bytes(16)
+    )
+    discover.return_value = MessageCodec.parse(hello)
+    assert proto.send("echo") == "ok"
+    assert breaker.state == CircuitState.Closed
+    assert discover.call_count == 2
+
+
+def test_device_error_closes(dummy_udp_device, breaker):
+    """Error responses mean that the device is reachable."""
+    dummy_udp_device.handler = lambda payload: {"error": {"code": -1}}
+    proto = protocol_for(dummy_udp_device, timeout=0.05, circuit_breaker=breaker)
+    breaker.record_failure()
+
+    with pytest.raises(DeviceError):
+        proto.send("fail")
+
+    assert breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_async_fail_fast(dummy_udp_device, breaker, clock, mocker):
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, timeout=0.05, circuit_breaker=breaker
+    )
+    mocker.patch.object(proto, "async_send_handshake")
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="No response"):  # noqa: B017
+            await proto.async_send("echo", retry_count=0)
+
+    with pytest.raises(DeviceUnavailableException):
+        await proto.async_send("echo")
+
+    assert len(dummy_udp_device.requests) == 2
+
+
+def test_probe_error(dummy_udp_device, breaker, clock, mocker):
+    """Errors raised while probing open the breaker again."""
+    dummy_udp_device.handler = lambda payload: {"result": "ok"}
+    proto = protocol_for(dummy_udp_device, timeout=0.05, circuit_breaker=breaker)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    clock[0] = 30
+    mocker.patch.object(MiIOProtocol, "discover", side_effect=DeviceException("fail"))
+    with pytest.raises(DeviceException, match="fail"):
+        proto.send("echo")
+
+    assert breaker.state == CircuitState.Open
+    assert not breaker._probing
+
+
+@pytest.mark.asyncio
+async def test_async_probe_cancelled(dummy_udp_device, breaker, clock, mocker):
+    """A cancelled probe lets the next request probe the device."""
+    dummy_udp_device.handler = lambda payload: {"result": "ok"}
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, timeout=0.05, circuit_breaker=breaker
+    )
+    breaker.record_failure()
+    breaker.record_failure()
+    clock[0] = 30
+
+    async def _discover(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    discover = mocker.patch.object(
+        AsyncMiIOProtocol, "async_discover", side_effect=_discover
+    )
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(proto.async_send("echo"), 0.05)
+
+    assert breaker.state == CircuitState.HalfOpen
+    assert not breaker._probing
+
+    hello = struct.pack(
+        ">HHI4sI16s", 0x2131, 32, 0, dummy_udp_device.DEVICE_ID, 1000, bytes(16)
+    )
+    discover.side_effect = None
+    discover.return_value = MessageCodec.parse(hello)
+    assert await proto.async_send("echo") == "ok"
+    assert breaker.state == CircuitState.Closed
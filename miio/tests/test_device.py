@@ -12,7 +12,14 @@ from miio import (
     MiotDevice,
     PropertyDescriptor,
 )
-from miio.exceptions import DeviceInfoUnavailableException, PayloadDecodeException
+from miio.exceptions import (
+    DeviceError,
+    DeviceException,
+    DeviceInfoUnavailableException,
+    DeviceUnavailableException,
+    PayloadDecodeException,
+    RequestCancelledException,
+)
 
 DEVICE_CLASSES = Device.__subclasses__() + MiotDevice.__subclasses__()  # type: ignore
 DEVICE_CLASSES.remove(MiotDevice)
@@ -31,6 +38,85 @@ def test_get_properties_splitting(mocker, max_properties):
     assert send.call_count == math.ceil(len(properties) / max_properties)
 
 
+def test_get_properties_failed_slice(mocker):
+    """Failing slices are replaced with placeholders after the first success."""
+    error = DeviceError({"code": -1, "message": "fail"})
+    send = mocker.patch("miio.Device.send", side_effect=[[0, 1], error, [4]])
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+
+    assert d.get_properties(list(range(5)), max_properties=2) == [0, 1, None, None, 4]
+    assert send.call_count == 3
+
+
+def test_get_properties_unanswered_slice(mocker):
+    """The slices after an unanswered one are not sent."""
+    send = mocker.patch(
+        "miio.Device.send", side_effect=[[0], DeviceException("timeout"), [2], [3]]
+    )
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+
+    assert d.get_properties(list(range(4)), max_properties=1) == [0, None, None, None]
+    assert send.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "error",
+    [RequestCancelledException("superseded"), DeviceUnavailableException("open")],
+)
+def test_get_properties_aborted(mocker, error):
+    """Cancellation and open circuit breaker abort the remaining slices."""
+    send = mocker.patch("miio.Device.send", side_effect=[[0, 1], error, [4]])
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+
+    with pytest.raises(type(error)):
+        d.get_properties(list(range(5)), max_properties=2)
+    assert send.call_count == 2
+
+
+def test_get_properties_aborted_pipelined(mocker):
+    send_many = mocker.patch(
+        "miio.Device._send_many", return_value=[[0, 1], RequestCancelledException()]
+    )
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+    d.max_in_flight = 2
+
+    with pytest.raises(RequestCancelledException):
+        d.get_properties(list(range(4)), max_properties=2)
+    send_many.assert_called_once()
+
+
+def test_get_properties_failed_first_slice(mocker):
+    send = mocker.patch("miio.Device.send", side_effect=DeviceException("fail"))
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+
+    with pytest.raises(DeviceException):
+        d.get_properties(list(range(5)), max_properties=2)
+    send.assert_called_once()
+
+
+def test_get_properties_failed_first_slice_error(mocker):
+    """Error responses to the first slice do not skip the remaining slices."""
+    error = DeviceError({"code": -1, "message": "fail"})
+    send = mocker.patch("miio.Device.send", side_effect=[error, [2, 3], [4]])
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+
+    assert d.get_properties(list(range(5)), max_properties=2) == [None, None, 2, 3, 4]
+    assert send.call_count == 3
+
+
+def test_get_properties_miot_placeholder(mocker):
+    """Placeholders for miot properties keep the ids and carry the error code."""
+    error = DeviceError({"code": -9999, "message": "user ack timeout"})
+    mocker.patch("miio.Device.send", side_effect=[[{"did": "a", "code": 0}], error])
+    d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
+
+    props = [{"did": "a", "siid": 2, "piid": 1}, {"did": "b", "siid": 2, "piid": 2}]
+    assert d.get_properties(props, max_properties=1) == [
+        {"did": "a", "code": 0},
+        {"did": "b", "siid": 2, "piid": 2, "code": -9999},
+    ]
+
+
 def test_default_timeout_and_retry(mocker):
     send = mocker.patch("miio.miioprotocol.MiIOProtocol.send")
     d = Device("127.0.0.1", "68ffffffffffffffffffffffffffffff")
@@ -1,9 +1,22 @@
 import json
+import threading
+from datetime import UTC, datetime, timedelta
+from functools import partial
 from pathlib import Path
 
 import pytest
 
-from miio.device_cache import DeviceState, _cache_path, read_cache, write_cache
+from miio import Device
+from miio.device_cache import (
+    DeviceState,
+    StateStore,
+    _cache_path,
+    handshake_from_state,
+    read_cache,
+    state_for,
+    write_cache,
+)
+from miio.miioprotocol import MAX_ID, HandshakeState, MiIOProtocol
 
 
 @pytest.fixture
@@ -81,3 +94,174 @@ def test_write_cache_valid_json(cache_dir: Path) -> None:
     write_cache("192.168.1.1", DeviceState(seq=99))
     data: dict = json.loads(_cache_path("192.168.1.1").read_text())
     assert data == {"seq": 99}
+
+
+def test_handshake_roundtrip(cache_dir: Path) -> None:
+    handshake = HandshakeState(
+        device_id=b"\x01\x02\x03\x04",
+        ts_offset=timedelta(seconds=-123.5),
+        last_handshake=datetime(2024, 1, 1, tzinfo=UTC),
+    )
+    write_cache("192.168.1.1", state_for(7, handshake))
+
+    state = read_cache("192.168.1.1")
+    assert state["seq"] == 7
+    assert state["device_id"] == "01020304"
+    assert handshake_from_state(state) == handshake
+
+
+def test_handshake_missing(cache_dir: Path) -> None:
+    write_cache("192.168.1.1", state_for(7, None))
+    assert handshake_from_state(read_cache("192.168.1.1")) is None
+
+
+def test_read_cache_corrupt_handshake(cache_dir: Path) -> None:
+    """Corrupt handshake state is ignored, but the sequence id is kept."""
+    data = {"seq": 7, "device_id": "nothex", "ts_offset": 0, "last_handshake": 0}
+    _cache_path("192.168.1.1").write_text(json.dumps(data))
+
+    state = read_cache("192.168.1.1")
+    assert state == {"seq": 7}
+    assert handshake_from_state(state) is None
+
+
+@pytest.fixture
+def store(cache_dir: Path):
+    with StateStore(cache_dir / "state.sqlite3", id_block_size=10) as store:
+        yield store
+
+
+def test_store_reserve_ids(store: StateStore) -> None:
+    assert store.reserve_ids("192.168.1.1") == range(1, 11)
+    assert store.reserve_ids("192.168.1.1", 5) == range(11, 16)
+    assert store.reserve_ids("192.168.1.2") == range(1, 11)
+    assert store.load("192.168.1.1")["seq"] == 15
+
+
+def test_store_reserve_ids_wraps(store: StateStore) -> None:
+    store.reserve_ids("192.168.1.1", MAX_ID - 5)
+    assert store.reserve_ids("192.168.1.1") == range(1, 11)
+
+
+def test_store_reserve_ids_concurrent(cache_dir: Path) -> None:
+    """Stores sharing the database never hand out the same ids."""
+    path = cache_dir / "state.sqlite3"
+    stores = [StateStore(path, id_block_size=5) for _ in range(4)]
+    reserved: list[int] = []
+
+    def _reserve(store: StateStore) -> None:
+        for _ in range(20):
+            reserved.extend(store.reserve_ids("192.168.1.1"))
+
+    threads = [threading.Thread(target=_reserve, args=(s,)) for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        store.close()
+
+    assert sorted(reserved) == list(range(1, 401))
+
+
+def test_store_handshake_batching(cache_dir: Path) -> None:
+    path = cache_dir / "state.sqlite3"
+    handshake = HandshakeState(
+        device_id=b"\x01\x02\x03\x04",
+        ts_offset=timedelta(seconds=-10),
+        last_handshake=datetime(2024, 1, 1, tzinfo=UTC),
+    )
+    store = StateStore(path, batch_size=3)
+    other = StateStore(path)
+
+    for idx in range(2):
+        store.save_handshake(f"10.0.0.{idx}", handshake)
+    store.save_handshake("10.0.0.9", None)
+    # pending updates are visible locally, but not written yet
+    assert handshake_from_state(store.load("10.0.0.0")) == handshake
+    assert other.load_all() == {}
+
+    store.save_handshake("10.0.0.2", handshake)
+    states = other.load_all()
+    assert sorted(states) == ["10.0.0.0", "10.0.0.1", "10.0.0.2"]
+    assert all(handshake_from_state(s) == handshake for s in states.values())
+
+    # handshake updates do not touch the sequence ids
+    assert other.reserve_ids("10.0.0.0") == range(1, 101)
+    store.save_handshake("10.0.0.0", handshake)
+    store.close()
+    assert other.load("10.0.0.0")["seq"] == 100
+    other.close()
+
+
+def test_store_migrate_json_cache(store: StateStore) -> None:
+    handshake = HandshakeState(
+        device_id=b"\x01\x02\x03\x04",
+        ts_offset=timedelta(seconds=-10),
+        last_handshake=datetime(2024, 1, 1, tzinfo=UTC),
+    )
+    write_cache("192.168.1.1", state_for(42, handshake))
+
+    assert store.migrate_json_cache("192.168.1.1")
+    assert handshake_from_state(store.load("192.168.1.1")) == handshake
+    assert store.reserve_ids("192.168.1.1") == range(43, 53)
+
+    # the store is not overwritten by the stale JSON cache
+    assert not store.migrate_json_cache("192.168.1.1")
+    assert store.load("192.168.1.1")["seq"] == 52
+
+
+def test_store_migrate_json_cache_missing(store: StateStore) -> None:
+    assert not store.migrate_json_cache("192.168.1.1")
+    assert store.load_all() == {}
+
+
+def test_protocol_id_blocks(store: StateStore) -> None:
+    proto = MiIOProtocol("192.168.1.1")
+    proto.use_id_blocks(partial(store.reserve_ids, "192.168.1.1"))
+
+    ids = [proto._id for _ in range(15)]
+    assert ids == list(range(1, 16))
+    assert store.load("192.168.1.1")["seq"] == 20
+
+    # retries skip to the next block
+    proto._prepare_retry(1)
+    assert proto._id == 21
+
+
+def test_device_state_store(store: StateStore) -> None:
+    handshake = HandshakeState(
+        device_id=b"\x01\x02\x03\x04",
+        ts_offset=timedelta(seconds=-10),
+        last_handshake=datetime.now(tz=UTC).replace(microsecond=0),
+    )
+    store.save_handshake("192.168.1.1", handshake)
+    dev = Device("192.168.1.1", 32 * "0")
+
+    dev.use_state_store(store)
+
+    assert dev._protocol.handshake_state == handshake
+    assert dev._protocol._id == 1
+    assert store.load("192.168.1.1")["seq"] == 10
+
+    dev.save_state()
+    store.flush()
+    # the ids are reserved, so the last used id is not written back
+    assert store.load("192.168.1.1")["seq"] == 10
+
+
+def test_device_state_store_start_id(store: StateStore) -> None:
+    dev = Device("192.168.1.1", 32 * "0", start_id=500)
+
+    dev.use_state_store(store, reserve_ids=False)
+    assert dev._protocol._id == 501
+
+    dev.save_state()
+    assert store.load("192.168.1.1")["seq"] == 501
+
+
+def test_device_state_store_missing() -> None:
+    dev = Device("192.168.1.1", 32 * "0")
+
+    with pytest.raises(ValueError):
+        dev.save_state()
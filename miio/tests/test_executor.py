@@ -0,0 +1,152 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from miio import Device
+from miio.executor import SerialExecutor
+from miio.scheduler import (
+    Priority,
+    RequestScheduler,
+    current_priority,
+    request_priority,
+)
+
+from .conftest import TOKEN, device_for
+from .dummies import DummyUDPDevice
+
+
+@pytest.fixture
+def executor():
+    with SerialExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def test_serial_per_key(executor):
+    running = []
+    overlaps = []
+    order = []
+
+    def _task(idx):
+        if running:
+            overlaps.append(idx)
+        running.append(idx)
+        time.sleep(0.01)
+        order.append(idx)
+        running.remove(idx)
+
+    futures = [executor.submit("dev", _task, idx) for idx in range(10)]
+    for future in futures:
+        future.result()
+
+    assert not overlaps
+    assert order == list(range(10))
+
+
+def test_parallel_between_keys(executor):
+    """Calls for different keys do not wait for each other."""
+    barrier = threading.Barrier(2, timeout=1)
+
+    futures = [executor.submit(key, barrier.wait) for key in ("a", "b")]
+
+    for future in futures:
+        future.result()
+
+
+def test_exception(executor):
+    def _fail():
+        raise ValueError("fail")
+
+    with pytest.raises(ValueError, match="fail"):
+        executor.submit("dev", _fail).result()
+
+    # the queue keeps working after a failure
+    assert executor.submit("dev", lambda: 1).result() == 1
+
+
+def test_in_worker(executor):
+    assert not executor.in_worker("dev")
+    assert executor.submit("dev", executor.in_worker, "dev").result()
+    assert not executor.submit("dev", executor.in_worker, "other").result()
+
+
+def test_priority_order(executor):
+    release = threading.Event()
+    order = []
+    blocker = executor.submit("dev", release.wait, 1)
+
+    for name, priority in [
+        ("bulk", Priority.Bulk),
+        ("poll", Priority.Polling),
+        ("user", Priority.Interactive),
+        ("poll2", Priority.Polling),
+    ]:
+        with request_priority(priority):
+            future = executor.submit("dev", order.append, name)
+
+    release.set()
+    blocker.result()
+    future.result()
+    executor.shutdown()
+
+    assert order == ["user", "poll", "poll2", "bulk"]
+
+
+def test_context_is_copied(executor):
+    with request_priority(Priority.Bulk):
+        future = executor.submit("dev", current_priority)
+
+    assert future.result() == Priority.Bulk
+    assert executor.submit("dev", current_priority).result() == Priority.Interactive
+
+
+def test_device_with_scheduler(executor, mocker):
+    """The scheduler sees the priority of the caller through the executor."""
+    dummy = DummyUDPDevice(lambda payload: {"result": payload["params"]}).start()
+    scheduler = RequestScheduler()
+    enqueue = mocker.spy(scheduler, "_enqueue")
+    dev = device_for(dummy, executor=executor, scheduler=scheduler)
+
+    try:
+        with request_priority(Priority.Bulk, supersede="status"):
+            assert dev.send("echo", [1]) == [1]
+    finally:
+        dummy.stop()
+
+    context = enqueue.call_args.args[0]
+    assert context.priority == Priority.Bulk
+    assert context.supersede == "status"
+
+
+def test_shutdown():
+    executor = SerialExecutor()
+    executor.shutdown()
+
+    with pytest.raises(RuntimeError):
+        executor.submit("dev", lambda: 1)
+
+
+def test_device_without_executor():
+    dev = Device("127.0.0.1", TOKEN)
+
+    with pytest.raises(ValueError):
+        dev.submit(dev.send, "info")
+
+
+def test_device_shared_between_threads(executor):
+    dummy = DummyUDPDevice(lambda payload: {"result": payload["params"]}).start()
+    dev = device_for(dummy, executor=executor)
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda idx: dev.send("echo", [idx]), range(32)))
+
+        # calls made from a worker of the device are run directly
+        assert dev.submit(dev.send, "echo", ["nested"]).result() == ["nested"]
+    finally:
+        dummy.stop()
+
+    assert results == [[idx] for idx in range(32)]
+    ids = [req["id"] for req in dummy.requests]
+    assert len(set(ids)) == len(ids)
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from miio import DeviceException
+from miio.miioprotocol import AsyncMiIOProtocol
+
+from .conftest import protocol_for
+from .dummies import DummyUDPDevice
+
+
+def _slow_handshake(proto, calls, fail=False):
+    def _handshake(*args, **kwargs):
+        calls.append(threading.get_ident())
+        time.sleep(0.1)
+        if fail:
+            raise DeviceException("Unable to discover the device")
+        proto._discovered = True
+        proto._device_id = DummyUDPDevice.DEVICE_ID
+
+    return _handshake
+
+
+def _run_concurrently(func, count=5):
+    barrier = threading.Barrier(count)
+    results: list = []
+
+    def _run():
+        barrier.wait()
+        try:
+            results.append(func())
+        except Exception as ex:
+            results.append(ex)
+
+    threads = [threading.Thread(target=_run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def test_single_flight_handshake(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: {"result": "ok"}
+    proto = protocol_for(dummy_udp_device, discovered=False)
+    calls: list = []
+    mocker.patch.object(
+        proto, "send_handshake", side_effect=_slow_handshake(proto, calls)
+    )
+
+    results = _run_concurrently(lambda: proto.send("echo"))
+
+    assert results == ["ok"] * 5
+    assert len(calls) == 1
+    # the concurrent requests got unique ids
+    ids = [req["id"] for req in dummy_udp_device.requests]
+    assert len(set(ids)) == 5
+
+
+def test_single_flight_handshake_failure(dummy_udp_device, mocker):
+    """Waiters share the failure instead of trying again themselves."""
+    proto = protocol_for(dummy_udp_device, discovered=False)
+    calls: list = []
+    mocker.patch.object(
+        proto, "send_handshake", side_effect=_slow_handshake(proto, calls, fail=True)
+    )
+
+    results = _run_concurrently(lambda: proto.send("echo", retry_count=0))
+
+    assert all(isinstance(res, DeviceException) for res in results)
+    assert len(calls) == 1
+
+    # later callers try again
+    with pytest.raises(DeviceException):
+        proto.send("echo", retry_count=0)
+    assert len(calls) == 2
+
+
+def test_handshake_finished_while_waiting(dummy_udp_device, mocker):
+    """A handshake finished before taking the lock is not repeated."""
+    proto = protocol_for(dummy_udp_device, discovered=False)
+    calls: list = []
+    mocker.patch.object(
+        proto, "send_handshake", side_effect=_slow_handshake(proto, calls)
+    )
+
+    assert proto._needs_handshake()
+    # another caller completes the handshake after the check
+    proto._ensure_handshake()
+    proto._ensure_handshake()
+
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_single_flight_handshake(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: {"result": "ok"}
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, discovered=False)
+    calls = []
+
+    async def _handshake(*args, **kwargs):
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        proto._discovered = True
+        proto._device_id = DummyUDPDevice.DEVICE_ID
+
+    mocker.patch.object(proto, "async_send_handshake", side_effect=_handshake)
+
+    results = await asyncio.gather(*(proto.async_send("echo") for _ in range(5)))
+
+    assert results == ["ok"] * 5
+    assert len(calls) == 1
@@ -0,0 +1,164 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from miio.miioprotocol import AsyncMiIOProtocol, DiscoveredDevice, MiIOProtocol
+from miio.protocol import MessageCodec
+
+from .dummies import DummyUDPDevice
+
+
+@pytest.fixture
+def dummy_udp_devices():
+    first = DummyUDPDevice().start()
+    _, port = first.addr
+    second = DummyUDPDevice(ip="127.0.0.2", port=port).start()
+    yield first, second
+    first.stop()
+    second.stop()
+
+
+def _targets(devices):
+    return [dev.addr[0] for dev in devices], devices[0].addr[1]
+
+
+def test_iter_discover(dummy_udp_devices):
+    addrs, port = _targets(dummy_udp_devices)
+
+    start = time.monotonic()
+    found = []
+    for device in MiIOProtocol.iter_discover(addrs, timeout=5, port=port):
+        found.append(device)
+        if len(found) == len(addrs):
+            break
+
+    # the results are available before the timeout
+    assert time.monotonic() - start < 1
+    assert sorted(dev.ip for dev in found) == addrs
+    assert all(dev.device_id == 0x01020304 for dev in found)
+    # all-zero checksum means that the token is not exposed
+    assert found[0].token is None
+
+
+def test_iter_discover_deduplicates(dummy_udp_devices):
+    """Each device is only reported once, even if it responds to every hello."""
+    addrs, port = _targets(dummy_udp_devices)
+
+    found = list(
+        MiIOProtocol.iter_discover(
+            addrs * 2, timeout=0.2, interfaces=["127.0.0.1"], port=port
+        )
+    )
+
+    assert len(found) == 2
+
+
+def test_from_message():
+    hello = bytes.fromhex("21310020000000000102030400000064") + bytes(range(16))
+    device = DiscoveredDevice.from_message("127.0.0.1", MessageCodec.parse(hello))
+
+    assert device.device_id == 0x01020304
+    assert device.token == bytes(range(16))
+    assert device.ts.timestamp() == 100
+
+    hidden = hello[:16] + b"\xff" * 16
+    assert (
+        DiscoveredDevice.from_message("127.0.0.1", MessageCodec.parse(hidden)).token
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_async_iter_discover(dummy_udp_devices):
+    addrs, port = _targets(dummy_udp_devices)
+
+    found = [
+        device
+        async for device in AsyncMiIOProtocol.async_iter_discover(
+            addrs, timeout=0.2, port=port
+        )
+    ]
+
+    assert sorted(dev.ip for dev in found) == addrs
+
+
+def test_iter_sweep(dummy_udp_devices):
+    _, port = _targets(dummy_udp_devices)
+
+    found = list(MiIOProtocol.iter_sweep("127.0.0.0/29", timeout=0.2, port=port))
+
+    assert sorted(dev.ip for dev in found) == ["127.0.0.1", "127.0.0.2"]
+
+
+def test_iter_sweep_rate(dummy_udp_devices):
+    _, port = _targets(dummy_udp_devices)
+    rate = 200
+
+    start = time.monotonic()
+    found = list(
+        MiIOProtocol.iter_sweep("127.0.0.0/28", timeout=0, rate=rate, port=port)
+    )
+
+    assert len(found) == 2
+    # 14 hosts, devices answering the first hello are not retried
+    assert time.monotonic() - start >= (3 * 14 - 2 * 2 - 1) / rate
+
+
+def test_discover_network(mocker):
+    """Networks given in CIDR notation are swept."""
+    device = DiscoveredDevice(ip="10.0.0.1", device_id=1, ts=None)
+    sweep = mocker.patch.object(MiIOProtocol, "iter_sweep", return_value=iter([device]))
+
+    assert MiIOProtocol.discover("10.0.0.0/22", timeout=1, rate=100) == [device]
+    sweep.assert_called_once_with("10.0.0.0/22", 1, rate=100, port=54321)
+
+
+def test_discover_broadcast(mocker):
+    """The single address may be a broadcast address."""
+    sock = mocker.patch("socket.socket").return_value
+    sock.recvfrom.side_effect = TimeoutError
+
+    assert MiIOProtocol.discover("192.168.1.255", timeout=1) is None
+    sock.setsockopt.assert_called_once_with(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.sendto.assert_called_with(mocker.ANY, ("192.168.1.255", 54321))
+
+
+@pytest.mark.asyncio
+async def test_async_discover_broadcast(mocker):
+    loop = asyncio.get_running_loop()
+    endpoint = mocker.patch.object(
+        loop, "create_datagram_endpoint", side_effect=OSError("stop")
+    )
+
+    with pytest.raises(OSError):
+        await AsyncMiIOProtocol.async_discover("192.168.1.255", timeout=1)
+    assert endpoint.call_args.kwargs["allow_broadcast"] is True
+
+
+@pytest.mark.asyncio
+async def test_discover_network_transport(mocker):
+    """Sweeping does not resolve the network as a hostname for the transport."""
+    transport = mocker.Mock()
+
+    with pytest.raises(ValueError):
+        MiIOProtocol.discover("10.0.0.0/22", transport=transport)
+    transport.request.assert_not_called()
+
+    with pytest.raises(ValueError):
+        await AsyncMiIOProtocol.async_discover("10.0.0.0/22", transport=transport)
+
+
+@pytest.mark.asyncio
+async def test_async_iter_sweep(dummy_udp_devices):
+    _, port = _targets(dummy_udp_devices)
+
+    found = [
+        device
+        async for device in AsyncMiIOProtocol.async_iter_sweep(
+            "127.0.0.0/29", timeout=0.2, rate=1000, port=port
+        )
+    ]
+
+    assert sorted(dev.ip for dev in found) == ["127.0.0.1", "127.0.0.2"]
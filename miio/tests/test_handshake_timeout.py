@@ -1,9 +1,10 @@
 from datetime import UTC, datetime, timedelta
 from unittest.mock import MagicMock, patch
 
+import attr
 import pytest
 
-from miio.miioprotocol import MiIOProtocol
+from miio.miioprotocol import HandshakeState, MiIOProtocol
 
 
 class TestNeedsHandshake:
@@ -117,3 +118,57 @@ class TestHandshakeTimestamp:
             with pytest.raises(Exception):  # noqa: B017
                 proto.send("test_cmd", retry_count=0)
             mock_hs.assert_not_called()
+
+
+class TestRestoreHandshake:
+    """Tests for persisting and restoring the handshake state."""
+
+    def _handshaked(self, **kwargs) -> MiIOProtocol:
+        proto = MiIOProtocol("127.0.0.1", **kwargs)
+        mock_msg: MagicMock = MagicMock()
+        mock_msg.header.value.device_id = b"\x01\x02\x03\x04"
+        mock_msg.header.value.ts = datetime.now(tz=UTC) - timedelta(days=1)
+        mock_msg.checksum = b"\x00" * 16
+        with patch.object(MiIOProtocol, "discover", return_value=mock_msg):
+            proto.send_handshake()
+        return proto
+
+    def _state(self, **kwargs) -> HandshakeState:
+        state = self._handshaked(**kwargs).handshake_state
+        assert state is not None
+        return state
+
+    def test_handshake_state(self) -> None:
+        assert MiIOProtocol("127.0.0.1").handshake_state is None
+
+        state = self._handshaked().handshake_state
+        assert state is not None
+        assert state.device_id == b"\x01\x02\x03\x04"
+        assert abs(state.ts_offset + timedelta(days=1)) < timedelta(seconds=1)
+
+    def test_restore_skips_handshake(self) -> None:
+        state = self._state(handshake_timeout=60)
+        proto = MiIOProtocol("127.0.0.1", handshake_timeout=60)
+
+        assert proto.restore_handshake(state) is True
+        assert proto._needs_handshake() is False
+        assert proto._device_id == b"\x01\x02\x03\x04"
+        expected_ts = datetime.now(tz=UTC) - timedelta(days=1)
+        assert abs(proto._device_ts - expected_ts) < timedelta(seconds=1)
+
+    @pytest.mark.parametrize(
+        ("kwargs", "age"),
+        [
+            ({"handshake_timeout": 60}, timedelta(seconds=90)),
+            ({"handshake_timeout": 0}, timedelta(0)),
+            ({}, timedelta(hours=2)),
+            ({}, -timedelta(hours=1)),
+        ],
+    )
+    def test_restore_expired(self, kwargs, age) -> None:
+        state = self._state()
+        state = attr.evolve(state, last_handshake=datetime.now(tz=UTC) - age)
+        proto = MiIOProtocol("127.0.0.1", **kwargs)
+
+        assert proto.restore_handshake(state) is False
+        assert proto._needs_handshake() is True
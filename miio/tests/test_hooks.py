@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from miio import DeviceStatus
+from miio.hooks import Phase, add_phase_hook, remove_phase_hook, timed
+from miio.miioprotocol import AsyncMiIOProtocol
+
+from .conftest import protocol_for
+
+
+@pytest.fixture
+def phases():
+    phases = []
+    # ignore the phases reported by the dummy device serving in its own thread
+    thread = threading.get_ident()
+
+    def _hook(phase, start, duration):
+        assert start > 0
+        assert duration >= 0
+        if threading.get_ident() == thread:
+            phases.append(phase)
+
+    remove = add_phase_hook(_hook)
+    yield phases
+    remove()
+
+
+SEND_PHASES = [
+    Phase.Build,
+    Phase.Encode,
+    Phase.Encrypt,
+    Phase.Send,
+    Phase.Wait,
+    Phase.Decrypt,
+    Phase.Decode,
+]
+
+
+def test_send_phases(phases, dummy_udp_device):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    assert protocol_for(dummy_udp_device).send("echo", [1]) == [1]
+    assert phases == SEND_PHASES
+
+
+@pytest.mark.asyncio
+async def test_async_send_phases(phases, dummy_udp_device):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol)
+    assert await proto.async_send("echo", [1]) == [1]
+    assert phases == SEND_PHASES
+
+
+def test_status_phase(phases):
+    class Status(DeviceStatus):
+        def __init__(self, data):
+            self.data = data
+
+    assert Status({"power": "on"}).data == {"power": "on"}
+    assert phases == [Phase.Status]
+
+
+def test_failing_hook(phases, caplog):
+    def _fail(phase, start, duration):
+        raise ValueError("fail")
+
+    remove = add_phase_hook(_fail)
+    with timed(Phase.Build):
+        pass
+    remove()
+
+    assert phases == [Phase.Build]
+    assert "Phase hook" in caplog.text
+
+
+def test_no_hooks():
+    """Phases are not timed without hooks."""
+    assert timed(Phase.Build) is timed(Phase.Send)
+
+
+def test_remove_phase_hook(phases):
+    def _hook(phase, start, duration):
+        raise AssertionError("removed hook called")
+
+    add_phase_hook(_hook)
+    remove_phase_hook(_hook)
+    with timed(Phase.Build):
+        pass
+
+    assert phases == [Phase.Build]
@@ -0,0 +1,116 @@
+import pytest
+
+from miio import DeviceException
+from miio.devtools.simulators.farm import SimulatorFarm
+from miio.devtools.simulators.impairment import Impairment, constant, normal, uniform
+from miio.miioprotocol import AsyncMiIOProtocol
+
+from .conftest import protocol_for
+
+
+@pytest.fixture
+def monotonic(mocker):
+    return mocker.patch(
+        "miio.devtools.simulators.impairment.monotonic", return_value=100.0
+    )
+
+
+def _echo(server, index):
+    server.add_method("echo", lambda payload: {"result": payload["params"]})
+
+
+def test_delays_default():
+    impairment = Impairment()
+    assert impairment.delays() == [0.0]
+    assert impairment.stats == {"sent": 1}
+
+
+@pytest.mark.parametrize(
+    "latency", [constant(0.1), uniform(0.05, 0.1), normal(0.1, 0.5), 0.1]
+)
+def test_delays_latency(latency):
+    impairment = Impairment(latency=latency, seed=1)
+    for _ in range(100):
+        (delay,) = impairment.delays()
+        assert 0 <= delay <= 2
+
+
+def test_delays_loss_duplicate_reorder():
+    assert Impairment(loss=1).delays() == []
+    assert Impairment(duplicate=1, latency=0.1).delays() == [0.1, 0.1]
+    assert Impairment(reorder=1, reorder_delay=0.5).delays() == [0.5]
+
+
+def test_delays_seed():
+    """The same seed leads to the same sequence, also for the clones."""
+    impairment = Impairment(latency=uniform(0, 1), loss=0.3, duplicate=0.3, seed=42)
+    first = [impairment.clone(0).delays() for _ in range(50)]
+    assert first == [impairment.clone(0).delays() for _ in range(50)]
+    assert first != [impairment.clone(1).delays() for _ in range(50)]
+
+
+def test_silence(monotonic):
+    impairment = Impairment()
+    impairment.silence(5)
+    assert impairment.delays() == []
+
+    monotonic.return_value += 5
+    assert impairment.delays() == [0.0]
+    assert impairment.stats == {"silenced": 1, "sent": 1}
+
+
+def test_periodic_outage(monotonic):
+    impairment = Impairment(outage_interval=10, outage_duration=2)
+    silent = []
+    for elapsed in range(20):
+        monotonic.return_value = 100.0 + elapsed
+        silent.append(impairment.is_silent)
+
+    assert [idx for idx, value in enumerate(silent) if value] == [8, 9, 18, 19]
+
+
+@pytest.mark.asyncio
+async def test_farm_loss():
+    impairment = Impairment(loss=1)
+    async with SimulatorFarm(2, _echo, impairment=impairment) as farm:
+        with pytest.raises(DeviceException, match="No response"):
+            await protocol_for(
+                farm.devices[0], AsyncMiIOProtocol, timeout=0.05
+            ).async_send("echo", retry_count=0)
+
+        # each device uses its own copy of the impairment
+        first, second = (device.impairment for device in farm.devices)
+        assert first is not second
+        assert first.stats == {"dropped": 1}
+        assert not second.stats
+
+
+@pytest.mark.asyncio
+async def test_farm_latency():
+    impairment = Impairment(latency=0.2)
+    async with SimulatorFarm(1, _echo, impairment=impairment) as farm:
+        (device,) = farm.devices
+        with pytest.raises(DeviceException):
+            await protocol_for(device, AsyncMiIOProtocol, timeout=0.05).async_send(
+                "echo", retry_count=0
+            )
+
+        assert await protocol_for(device, AsyncMiIOProtocol).async_send(
+            "echo", [1]
+        ) == [1]
+
+
+@pytest.mark.asyncio
+async def test_farm_duplicate_and_silence():
+    async with SimulatorFarm(1, _echo, impairment=Impairment(duplicate=1)) as farm:
+        (device,) = farm.devices
+        proto = protocol_for(device, AsyncMiIOProtocol, timeout=0.1)
+        assert await proto.async_send("echo", [1]) == [1]
+        assert device.impairment.stats == {"duplicated": 1, "sent": 2}
+
+        device.impairment.silence(60)
+        with pytest.raises(DeviceException):
+            await proto.async_send("echo", [2], retry_count=0)
+
+        device.impairment.silence(0)
+        assert await proto.async_send("echo", [3]) == [3]
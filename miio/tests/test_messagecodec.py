@@ -0,0 +1,271 @@
+"""Parity tests between the construct-based Message and MessageCodec."""
+
+from datetime import UTC, datetime
+
+import pytest
+from construct import ChecksumError
+
+from miio import protocol
+from miio.exceptions import PayloadDecodeException
+from miio.miioprotocol import HELO_BYTES
+from miio.protocol import Message, MessageCodec, Utils
+
+TOKEN = bytes.fromhex("00112233445566778899aabbccddeeff")
+TS = datetime(2024, 3, 13, 12, 0, 0, tzinfo=UTC)
+
+PAYLOADS = [
+    {"id": 1, "method": "miIO.info", "params": []},
+    {"id": 9999, "method": "get_prop", "params": ["power", "mode"] * 10},
+    {"id": 2, "result": [{"did": str(i), "code": 0, "value": i} for i in range(200)]},
+    {"id": 3, "result": "ünïcödé"},
+]
+
+
+def _msg(payload, device_id=b"\x01\x02\x03\x04", ts=TS):
+    header = {"length": 0, "unknown": 0, "device_id": device_id, "ts": ts}
+    return {"data": {"value": payload}, "header": {"value": header}, "checksum": 0}
+
+
+def _raw_msg(plaintext: bytes, token=TOKEN) -> bytes:
+    """Build a message with arbitrary (possibly malformed) plaintext."""
+    data = Utils.encrypt(plaintext, token)
+    header = (
+        bytes.fromhex("2131")
+        + (32 + len(data)).to_bytes(2, "big")
+        + bytes(4)
+        + bytes.fromhex("01020304")
+        + bytes(4)
+    )
+    return header + Utils.md5(header + token + data) + data
+
+
+def _assert_same(fast, reference):
+    assert fast.data.value == reference.data.value
+    assert fast.data.data == reference.data.data
+    assert fast.data.length == reference.data.length
+    assert fast.header.data == reference.header.data
+    for field in ["length", "unknown", "device_id", "ts"]:
+        assert fast.header.value[field] == reference.header.value[field]
+    assert fast.checksum == reference.checksum
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+@pytest.mark.parametrize("device_id", [b"\x01\x02\x03\x04", b"\xff" * 4, 4141])
+def test_build_parity(payload, device_id):
+    msg = _msg(payload, device_id=device_id)
+    assert MessageCodec.build(msg, token=TOKEN) == Message.build(msg, token=TOKEN)
+
+
+def test_build_naive_timestamp():
+    """Naive timestamps are encoded as-is, like done by the push server."""
+    msg = _msg({"id": 1}, ts=datetime(2024, 1, 1, 1, 1, 1))
+    assert MessageCodec.build(msg, token=TOKEN) == Message.build(msg, token=TOKEN)
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_parse_parity(payload):
+    data = Message.build(_msg(payload), token=TOKEN)
+    _assert_same(
+        MessageCodec.parse(data, token=TOKEN), Message.parse(data, token=TOKEN)
+    )
+
+
+def test_parse_hello():
+    _assert_same(MessageCodec.parse(HELO_BYTES), Message.parse(HELO_BYTES))
+    assert MessageCodec.parse(HELO_BYTES).data.length == 0
+
+
+def test_parse_quirk_lru(quirk_hints, mocker):
+    """The hints of the least recently used tokens are dropped."""
+    mocker.patch("miio.protocol.CIPHER_CACHE_SIZE", 2)
+    tokens = [bytes([idx]) * 16 for idx in range(3)]
+    quirky = b'{"id":2,"result":[{"value":00}]}'
+
+    for token in tokens[:2]:
+        MessageCodec.parse(_raw_msg(quirky, token=token), token=token)
+    MessageCodec.parse(_raw_msg(quirky, token=tokens[0]), token=tokens[0])
+    MessageCodec.parse(_raw_msg(quirky, token=tokens[2]), token=tokens[2])
+
+    assert list(quirk_hints) == [tokens[0], tokens[2]]
+
+
+@pytest.mark.parametrize(
+    "plaintext",
+    [
+        b'{"id": 123456,,"otu_stat":0}',
+        b'{"id": 123456}\x00k',
+        b'{"id":2,"result":,"exe_time":0}',
+        b'{"id":1,"result":[{"value":00}]}',
+    ],
+)
+def test_parse_quirks_parity(plaintext):
+    data = _raw_msg(plaintext)
+    _assert_same(
+        MessageCodec.parse(data, token=TOKEN), Message.parse(data, token=TOKEN)
+    )
+
+
+def test_parse_invalid_json():
+    data = _raw_msg(b'{"id": 123456,,"otu_stat":0')
+    with pytest.raises(PayloadDecodeException):
+        Message.parse(data, token=TOKEN)
+    with pytest.raises(PayloadDecodeException):
+        MessageCodec.parse(data, token=TOKEN)
+
+
+def test_parse_wrong_token():
+    data = Message.build(_msg(PAYLOADS[0]), token=TOKEN)
+    wrong_token = bytes(16)
+    with pytest.raises(ChecksumError):
+        Message.parse(data, token=wrong_token)
+    with pytest.raises(ChecksumError):
+        MessageCodec.parse(data, token=wrong_token)
+
+
+def test_parse_truncated():
+    with pytest.raises(Exception):  # noqa: B017
+        Message.parse(HELO_BYTES[:20])
+    with pytest.raises(Exception):  # noqa: B017
+        MessageCodec.parse(HELO_BYTES[:20])
+
+
+def test_build_invalid_device_id():
+    with pytest.raises(Exception):  # noqa: B017
+        Message.build(_msg({"id": 1}, device_id=b""), token=TOKEN)
+    with pytest.raises(ValueError):
+        MessageCodec.build(_msg({"id": 1}, device_id=b""), token=TOKEN)
+
+
+@pytest.fixture
+def quirk_hints(mocker):
+    return mocker.patch.dict("miio.protocol._QUIRK_HINTS", clear=True)
+
+
+def test_parse_quirk_remembered(quirk_hints, mocker):
+    """The quirk that worked is tried right after the unmodified payload."""
+    data = _raw_msg(b'{"id":2,"result":[1,,2]}')
+    loads = mocker.spy(protocol, "_json_loads")
+
+    assert MessageCodec.parse(data, token=TOKEN).data.value["result"] == [1, 2]
+    assert quirk_hints == {TOKEN: 4}
+    assert loads.call_count == 5
+
+    loads.reset_mock()
+    assert MessageCodec.parse(data, token=TOKEN).data.value["result"] == [1, 2]
+    assert loads.call_count == 2
+
+    # valid payloads are not modified by the remembered quirk
+    valid = _raw_msg(b'{"id":2,"result":"a,,b"}')
+    assert MessageCodec.parse(valid, token=TOKEN).data.value["result"] == "a,,b"
+    assert quirk_hints == {TOKEN: 4}
+
+
+def test_parse_quirk_per_token(quirk_hints):
+    other_token = bytes(16)
+    quirk_hints[other_token] = 1
+    data = _raw_msg(b'{"id":2,"result":[{"value":00}]}')
+
+    assert MessageCodec.parse(data, token=TOKEN).data.value["result"] == [{"value": 0}]
+    assert quirk_hints == {other_token: 1, TOKEN: 3}
+
+
+@pytest.mark.parametrize(
+    "plaintext",
+    [
+        b'{"id": 123456,,"otu_stat":0}',
+        b'{"id": 123456}\x00k',
+        b'{"id":2,"result":,"exe_time":0}',
+        b'{"id":1,"result":[{"value":00}]}',
+        b'{"id":1,"result":[{"value":00},,{"value":1}]}',
+    ],
+)
+def test_parse_tolerant(plaintext, quirk_hints):
+    data = _raw_msg(plaintext)
+    tolerant = MessageCodec.parse(data, token=TOKEN, tolerant=True)
+    assert not quirk_hints
+
+    if plaintext.count(b",,") and b"00" in plaintext:
+        # multiple different quirks are only handled by the tolerant decoder
+        assert tolerant.data.value["result"] == [{"value": 0}, {"value": 1}]
+    else:
+        _assert_same(tolerant, Message.parse(data, token=TOKEN))
+
+
+def test_parse_tolerant_invalid():
+    data = _raw_msg(b'{"id": 123456,,"otu_stat":0')
+    with pytest.raises(PayloadDecodeException):
+        MessageCodec.parse(data, token=TOKEN, tolerant=True)
+
+
+@pytest.fixture(params=["json", "orjson"])
+def json_backend(request):
+    pytest.importorskip(request.param)
+    previous = protocol.get_json_backend()
+    protocol.set_json_backend(request.param)
+    yield request.param
+    protocol.set_json_backend(previous)
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_json_backend_roundtrip(json_backend, payload):
+    data = MessageCodec.build(_msg(payload), token=TOKEN)
+    assert MessageCodec.parse(data, token=TOKEN).data.value == payload
+
+
+def test_json_backend_default():
+    assert protocol.get_json_backend() == "json"
+
+
+def test_json_backend_large_int(json_backend):
+    payload = {"id": 1, "result": 2**70 + 1}
+    data = MessageCodec.build(_msg(payload), token=TOKEN)
+    value = MessageCodec.parse(data, token=TOKEN).data.value
+    if json_backend == "json":
+        assert value == payload
+    else:
+        # documented limitation of the optional backends
+        assert value["result"] == float(payload["result"])
+
+
+def test_json_backend_quirks(json_backend):
+    data = _raw_msg(b'{"id":2,"result":,"exe_time":0}')
+    assert MessageCodec.parse(data, token=TOKEN).data.value == {"id": 2, "exe_time": 0}
+    with pytest.raises(PayloadDecodeException):
+        MessageCodec.parse(_raw_msg(b'{"id": 2'), token=TOKEN)
+
+
+def test_set_json_backend_invalid():
+    with pytest.raises(ValueError):
+        protocol.set_json_backend("invalid")
+
+
+def test_parse_memoryview():
+    """Parsing from a reused buffer does not keep references to it."""
+    data = Message.build(_msg(PAYLOADS[2]), token=TOKEN)
+    buffer = bytearray(len(data) + 100)
+    buffer[: len(data)] = data
+
+    m = MessageCodec.parse(memoryview(buffer)[: len(data)], token=TOKEN)
+    buffer[:] = bytes(len(buffer))
+
+    _assert_same(m, Message.parse(data, token=TOKEN))
+    assert isinstance(m.data.data, bytes)
+
+
+def test_parse_truncated_payload():
+    data = Message.build(_msg(PAYLOADS[2]), token=TOKEN)
+    with pytest.raises(PayloadDecodeException, match="Truncated"):
+        MessageCodec.parse(data[:4096], token=TOKEN)
+
+
+def test_parse_undecryptable_memoryview():
+    """Raw bytes are returned as bytes when the payload cannot be decrypted."""
+    data = _raw_msg(b"{}")[:32] + b"not encrypted"
+    header = bytearray(data[:32])
+    header[2:4] = len(data).to_bytes(2, "big")
+    header[16:32] = Utils.md5(bytes(header[:16]) + TOKEN + b"not encrypted")
+    data = bytes(header) + b"not encrypted"
+
+    m = MessageCodec.parse(memoryview(bytearray(data)), token=TOKEN)
+    assert m.data.value == b"not encrypted"
+    assert isinstance(m.data.value, bytes)
@@ -0,0 +1,93 @@
+import pytest
+
+from miio import Device, DeviceException, InvalidTokenException
+from miio.metrics import Histogram, MetricsRegistry
+from miio.miioprotocol import MiIOProtocol
+
+from .conftest import TOKEN, device_for
+
+
+def test_histogram_quantile():
+    histogram = Histogram(buckets=(1, 2, 4))
+    assert histogram.quantile(0.5) is None
+
+    for value in [0.5, 1.5, 1.5, 3]:
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.sum == 6.5
+    assert histogram.cumulative() == [(1, 1), (2, 3), (4, 4), (float("inf"), 4)]
+    assert histogram.quantile(0.25) == 1
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(1) == 4
+
+
+def test_histogram_overflow():
+    histogram = Histogram(buckets=(1,))
+    histogram.observe(10)
+
+    assert histogram.quantile(0.99) == 1
+
+
+def test_export_prometheus():
+    registry = MetricsRegistry()
+    metrics = registry.device("127.0.0.1")
+    metrics.record_request("get_prop", 64)
+    metrics.record_rtt(0.02)
+    metrics.increment("timeouts", 2)
+    registry.device('strange"name')
+
+    exported = registry.export_prometheus()
+    assert "# TYPE miio_requests_total counter" in exported
+    assert 'miio_requests_total{device="127.0.0.1",method="get_prop"} 1' in exported
+    assert 'miio_timeouts_total{device="127.0.0.1"} 2' in exported
+    assert 'miio_bytes_sent_total{device="127.0.0.1"} 64' in exported
+    assert 'miio_rtt_seconds_bucket{device="127.0.0.1",le="0.01"} 0' in exported
+    assert 'miio_rtt_seconds_bucket{device="127.0.0.1",le="0.025"} 1' in exported
+    assert 'miio_rtt_seconds_bucket{device="127.0.0.1",le="+Inf"} 1' in exported
+    assert 'miio_rtt_seconds_count{device="127.0.0.1"} 1' in exported
+    assert 'device="strange\\"name"' in exported
+
+
+def test_device_name():
+    registry = MetricsRegistry()
+    MiIOProtocol("192.168.1.1", metrics=registry)
+    MiIOProtocol("192.168.1.1", metrics=registry, port=54322)
+
+    assert sorted(registry.devices) == ["192.168.1.1", "192.168.1.1:54322"]
+
+
+def test_device_metrics(dummy_udp_device, mocker):
+    registry = MetricsRegistry()
+    dev = device_for(dummy_udp_device, timeout=0.05, metrics=registry)
+    mocker.patch.object(dev._protocol, "send_handshake")
+
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    dev.send("get_prop", ["power"])
+    dev.send("get_prop", ["power"])
+
+    dummy_udp_device.handler = lambda payload: None
+    with pytest.raises(DeviceException):
+        dev.send("set_power", ["on"], retry_count=1)
+
+    dummy_udp_device.response_token = bytes.fromhex(32 * "f")
+    dummy_udp_device.handler = lambda payload: {"result": "ok"}
+    with pytest.raises(InvalidTokenException):
+        dev.send("info")
+
+    metrics = dev.metrics
+    assert metrics is registry.device("{}:{}".format(*dummy_udp_device.addr))
+    assert metrics.requests == {"get_prop": 2, "set_power": 2, "info": 1}
+    assert metrics.rtt.count == 2
+    assert metrics.timeouts == 2
+    assert metrics.retries == 1
+    assert metrics.checksum_errors == 1
+    assert metrics.bytes_sent > 0
+    assert metrics.bytes_received > 0
+
+    summary = registry.summary()["{}:{}".format(*dummy_udp_device.addr)]
+    assert summary["rtt"]["p99"] is not None
+
+
+def test_device_without_metrics():
+    assert Device("127.0.0.1", TOKEN).metrics is None
@@ -0,0 +1,292 @@
+import pytest
+
+from miio import DeviceError, DeviceException
+from miio.exceptions import PayloadDecodeException
+from miio.executor import SerialExecutor
+from miio.miioprotocol import AsyncMiIOProtocol
+from miio.response_cache import ResponseCache
+from miio.scheduler import RequestScheduler
+from miio.transport import SharedTransport
+
+from .conftest import device_for, protocol_for
+
+
+def _pipelined_device(dummy, max_in_flight=2, **kwargs):
+    dev = device_for(dummy, **kwargs)
+    dev.max_in_flight = dev._protocol.max_in_flight = max_in_flight
+    return dev
+
+
+def _reply_in_reverse(dummy, window):
+    """Return a handler answering to each window of requests in reverse order."""
+    held = []
+
+    def _handler(payload):
+        held.append((payload, dummy.last_addr))
+        if len(held) == window:
+            for req, addr in reversed(held):
+                dummy.respond(req, addr, {"result": req["params"]})
+            held.clear()
+        return None
+
+    return _handler
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_send_many_out_of_order(dummy_udp_device, shared):
+    transport = SharedTransport(("127.0.0.1", 0)) if shared else None
+    dummy_udp_device.handler = _reply_in_reverse(dummy_udp_device, 3)
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3, transport=transport
+    )
+
+    try:
+        res = proto.send_many([("echo", [idx]) for idx in range(6)])
+    finally:
+        if transport is not None:
+            transport.close()
+
+    assert res == [[idx] for idx in range(6)]
+    ids = [req["id"] for req in dummy_udp_device.requests]
+    assert len(set(ids)) == 6
+    assert proto.raw_id == max(ids)
+
+
+def test_send_many_retry(dummy_udp_device, mocker):
+    """Timed out requests are resent with new ids."""
+    dropped = set()
+
+    def _drop_first_try(payload):
+        if payload["params"] == [1] and not dropped:
+            dropped.add(payload["id"])
+            return None
+        return {"result": payload["params"]}
+
+    dummy_udp_device.handler = _drop_first_try
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3, timeout=0.1
+    )
+    handshake = mocker.patch.object(proto, "send_handshake")
+
+    assert proto.send_many([("echo", [idx]) for idx in range(3)]) == [[0], [1], [2]]
+    handshake.assert_called_once()
+    assert len(dummy_udp_device.requests) == 4
+
+
+def test_send_many_errors(dummy_udp_device):
+    def _fail_odd(payload):
+        if payload["params"][0] % 2:
+            return {"error": {"code": -1, "message": "odd"}}
+        return {"result": payload["params"]}
+
+    dummy_udp_device.handler = _fail_odd
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3)
+    requests = [("echo", [idx]) for idx in range(4)]
+
+    res = proto.send_many(requests, return_exceptions=True)
+    assert res[0::2] == [[0], [2]]
+    assert all(isinstance(ex, DeviceError) for ex in res[1::2])
+
+    with pytest.raises(DeviceError):
+        proto.send_many(requests)
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_send_many_undecodable(dummy_udp_device, shared):
+    """Undecodable responses fail the requests instead of the whole batch."""
+
+    def _handler(payload):
+        if payload["params"] == [2]:
+            dummy_udp_device.respond_raw(b'{"id": 1', dummy_udp_device.last_addr)
+            return None
+        return {"result": payload["params"]}
+
+    transport = SharedTransport(("127.0.0.1", 0)) if shared else None
+    dummy_udp_device.handler = _handler
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3, transport=transport
+    )
+
+    try:
+        res = proto.send_many(
+            [("echo", [idx]) for idx in range(3)], return_exceptions=True
+        )
+    finally:
+        if transport is not None:
+            transport.close()
+
+    assert res[:2] == [[0], [1]]
+    assert isinstance(res[2], PayloadDecodeException)
+
+
+def test_send_many_undecodable_in_flight(dummy_udp_device):
+    """Undecodable responses fail the oldest request with several in flight."""
+    held = []
+
+    def _handler(payload):
+        held.append((payload, dummy_udp_device.last_addr))
+        if len(held) == 3:
+            first, *rest = held
+            dummy_udp_device.respond_raw(b'{"id": 1', first[1])
+            for req, addr in rest:
+                dummy_udp_device.respond(req, addr, {"result": req["params"]})
+        return None
+
+    transport = SharedTransport(("127.0.0.1", 0))
+    dummy_udp_device.handler = _handler
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3, transport=transport
+    )
+
+    try:
+        res = proto.send_many(
+            [("echo", [idx]) for idx in range(3)], return_exceptions=True
+        )
+    finally:
+        transport.close()
+
+    assert isinstance(res[0], PayloadDecodeException)
+    assert res[1:] == [[1], [2]]
+    assert len(dummy_udp_device.requests) == 3
+
+
+def test_send_many_no_response(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3, timeout=0.05
+    )
+    mocker.patch.object(proto, "send_handshake")
+
+    with pytest.raises(DeviceException, match="No response"):
+        proto.send_many([("echo", [0]), ("echo", [1])], retry_count=1)
+
+    assert len(dummy_udp_device.requests) == 4
+
+
+def test_send_many_window_of_one(dummy_udp_device, mocker):
+    """The default window sends the requests one by one."""
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, max_in_flight=1)
+    send = mocker.spy(proto, "send")
+
+    assert proto.send_many([("echo", [0]), ("echo", [1])]) == [[0], [1]]
+    assert send.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_async_send_many(dummy_udp_device):
+    dummy_udp_device.handler = _reply_in_reverse(dummy_udp_device, 2)
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, max_in_flight=2)
+
+    res = await proto.async_send_many([("echo", [idx]) for idx in range(4)])
+    assert res == [[idx] for idx in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_async_send_many_unexpected_error(dummy_udp_device, mocker):
+    """Only device errors are returned in place of the results."""
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, max_in_flight=3)
+    mocker.patch.object(
+        proto, "async_send", side_effect=[[0], DeviceError({}), ValueError("bug")]
+    )
+    requests = [("echo", [idx]) for idx in range(3)]
+
+    with pytest.raises(ValueError, match="bug"):
+        await proto.async_send_many(requests, return_exceptions=True)
+
+
+def test_device_get_properties_pipelined(dummy_udp_device, mocker):
+    dummy_udp_device.handler = _reply_in_reverse(dummy_udp_device, 2)
+    dev = _pipelined_device(dummy_udp_device, max_in_flight=2)
+    send = mocker.spy(dev, "send")
+
+    props = list(range(8))
+    assert dev.get_properties(props, max_properties=2) == props
+    send.assert_not_called()
+
+
+def test_device_get_properties_failed_slice(dummy_udp_device, mocker):
+    """Slices are sent at once and the failed ones are reported separately."""
+
+    def _handler(payload):
+        if payload["params"] == [2, 3]:
+            return {"error": {"code": -1, "message": "failed"}}
+        return {"result": payload["params"]}
+
+    dummy_udp_device.handler = _handler
+    dev = _pipelined_device(dummy_udp_device, max_in_flight=3)
+
+    values = dev.get_properties(list(range(6)), max_properties=2)
+    assert values == [0, 1, None, None, 4, 5]
+
+    dummy_udp_device.handler = lambda payload: {"error": {"code": -1, "message": ""}}
+    with pytest.raises(DeviceError):
+        dev.get_properties(list(range(6)), max_properties=2)
+
+
+@pytest.mark.asyncio
+async def test_device_async_get_properties_concurrent(dummy_udp_device):
+    dummy_udp_device.handler = _reply_in_reverse(dummy_udp_device, 3)
+    dev = _pipelined_device(dummy_udp_device, max_in_flight=3)
+
+    props = list(range(6))
+    assert await dev.async_get_properties(props, max_properties=2) == props
+
+
+def test_device_get_properties_pipelined_cached(dummy_udp_device):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    dev = _pipelined_device(
+        dummy_udp_device, response_cache=ResponseCache({"get_prop": 10})
+    )
+
+    assert dev.get_properties([0, 1, 2, 3], max_properties=2) == [0, 1, 2, 3]
+    assert dev.get_properties([0, 1, 4, 5], max_properties=2) == [0, 1, 4, 5]
+    assert [req["params"] for req in dummy_udp_device.requests] == [
+        [0, 1],
+        [2, 3],
+        [4, 5],
+    ]
+
+
+def test_device_get_properties_pipelined_scheduled(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    scheduler = RequestScheduler()
+    run = mocker.spy(scheduler, "run")
+    dev = _pipelined_device(dummy_udp_device, scheduler=scheduler)
+
+    assert dev.get_properties([0, 1, 2, 3], max_properties=2) == [0, 1, 2, 3]
+    run.assert_called_once()
+
+
+def test_device_get_properties_rate_limited(dummy_udp_device, mocker):
+    """Rate limited devices get the slices one by one."""
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    dev = _pipelined_device(dummy_udp_device, scheduler=RequestScheduler(rate=1000))
+    send_many = mocker.spy(dev._protocol, "send_many")
+
+    assert dev.get_properties([0, 1, 2, 3], max_properties=2) == [0, 1, 2, 3]
+    send_many.assert_not_called()
+
+
+def test_device_get_properties_pipelined_executor(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    with SerialExecutor() as executor:
+        dev = _pipelined_device(dummy_udp_device, executor=executor)
+        submit = mocker.spy(executor, "submit")
+
+        assert dev.get_properties([0, 1, 2, 3], max_properties=2) == [0, 1, 2, 3]
+
+    submit.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_device_async_get_properties_cached(dummy_udp_device):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    dev = _pipelined_device(
+        dummy_udp_device, response_cache=ResponseCache({"get_prop": 10})
+    )
+
+    props = [0, 1, 2, 3]
+    assert await dev.async_get_properties(props, max_properties=2) == props
+    assert await dev.async_get_properties(props, max_properties=2) == props
+    assert len(dummy_udp_device.requests) == 2
@@ -169,3 +169,28 @@ def test_decode_json_raises_for_invalid_json(token):
     serialized_msg = build_msg(b'{"id": 123456,,"otu_stat":0', token)
     with pytest.raises(PayloadDecodeException):
         Message.parse(serialized_msg, **ctx)
+
+
+def test_cipher_cache(token, mocker):
+    """Make sure the key derivation is done only once per token."""
+    Utils.cipher.cache_clear()
+    key_iv = mocker.spy(Utils, "key_iv")
+    payload = b"hello world"
+
+    for _ in range(3):
+        assert Utils.decrypt(Utils.encrypt(payload, token), token) == payload
+
+    key_iv.assert_called_once_with(token)
+    assert Utils.cipher.cache_info().hits == 5
+
+    other_token = bytes.fromhex(32 * "f")
+    Utils.encrypt(payload, other_token)
+    assert key_iv.call_count == 2
+
+
+def test_cipher_cache_invalid_token_not_cached():
+    Utils.cipher.cache_clear()
+    with pytest.raises(ValueError):
+        Utils.encrypt(b"hello world", bytes.fromhex(16 * "0"))
+
+    assert Utils.cipher.cache_info().currsize == 0
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from miio import Device, DeviceError, DeviceException
+from miio.miioprotocol import ReplayProtocol
+from miio.recording import Exchange, Recorder, Replay, load_exchanges
+
+from .conftest import TOKEN, device_for, protocol_for
+
+
+def _handler(payload):
+    if payload["method"] == "fail":
+        return {"error": {"code": -5001, "message": "failed"}}
+    return {"result": payload["params"]}
+
+
+@pytest.mark.parametrize("filename", ["recording.jsonl", "recording.jsonl.gz"])
+def test_record(dummy_udp_device, tmp_path, filename):
+    dummy_udp_device.handler = _handler
+    path = tmp_path / filename
+
+    with Recorder(path) as recorder:
+        proto = protocol_for(dummy_udp_device, recorder=recorder)
+        assert proto.send("echo", [1]) == [1]
+        with pytest.raises(DeviceError):
+            proto.send("fail", extra_parameters={"sid": "1"})
+
+    echo, fail = load_exchanges(path)
+    assert (echo.method, echo.params, echo.result) == ("echo", [1], [1])
+    assert echo.error is None
+    assert echo.elapsed > 0
+    assert fail.offset >= echo.offset
+    assert fail.extra == {"sid": "1"}
+    assert fail.error == {"code": -5001, "message": "failed"}
+
+
+def test_record_pipelined(dummy_udp_device, tmp_path):
+    dummy_udp_device.handler = _handler
+    path = tmp_path / "recording.jsonl"
+
+    with Recorder(path) as recorder:
+        proto = protocol_for(dummy_udp_device, recorder=recorder, max_in_flight=2)
+        results = proto.send_many(
+            [("echo", [1]), ("fail", []), ("echo", [2])], return_exceptions=True
+        )
+
+    assert isinstance(results[1], DeviceError)
+    recorded = sorted((e.method, e.params, e.result) for e in load_exchanges(path))
+    assert recorded == [("echo", [1], [1]), ("echo", [2], [2]), ("fail", [], None)]
+
+
+def test_replay():
+    replay = Replay(
+        [
+            Exchange("get_prop", ["power"], result=["on"]),
+            Exchange("get_prop", ["power"], result=["off"]),
+            Exchange("fail", error={"code": -1, "message": "error"}),
+            Exchange("timeout", error={"message": "No response from the device"}),
+        ],
+        time_scale=0,
+    )
+    proto = ReplayProtocol(replay)
+
+    assert proto.send("get_prop", ["power"]) == ["on"]
+    assert proto.send("get_prop", ["power"]) == ["off"]
+    assert proto.send("get_prop", ["power"]) == ["on"]
+
+    with pytest.raises(DeviceError):
+        proto.send("fail")
+    with pytest.raises(DeviceException, match="No response"):
+        proto.send("timeout")
+    with pytest.raises(DeviceException, match="No recorded response"):
+        proto.send("get_prop", ["mode"])
+
+
+def test_replay_no_loop():
+    replay = Replay([Exchange("info", result="ok")], time_scale=0, loop=False)
+    proto = ReplayProtocol(replay)
+
+    assert proto.send("info") == "ok"
+    with pytest.raises(DeviceException):
+        proto.send("info")
+
+
+@pytest.mark.parametrize(("time_scale", "expected"), [(0, 0), (0.5, 0.05), (1, 0.1)])
+def test_replay_timing(time_scale, expected):
+    replay = Replay([Exchange("info", result="ok", elapsed=0.1)], time_scale=time_scale)
+    assert replay.delay(replay.next("info")) == pytest.approx(expected)
+
+    start = time.monotonic()
+    assert ReplayProtocol(replay).send("info") == "ok"
+    assert time.monotonic() - start >= expected
+
+
+@pytest.mark.asyncio
+async def test_replay_async():
+    replay = Replay([Exchange("get_prop", ["a"], result=[1])], time_scale=0)
+    proto = ReplayProtocol(replay)
+    assert await proto.async_send("get_prop", ["a"]) == [1]
+
+
+def test_device_record_and_replay(dummy_udp_device, tmp_path):
+    dummy_udp_device.handler = _handler
+    ip, _ = dummy_udp_device.addr
+    path = tmp_path / "recording.jsonl.gz"
+
+    with Recorder(path) as recorder:
+        dev = device_for(dummy_udp_device, recorder=recorder)
+        assert dev.get_properties(["a", "b", "c"], max_properties=2) == ["a", "b", "c"]
+
+    dummy_udp_device.stop()
+    dev = Device(ip, TOKEN, replay=Replay.from_file(path, time_scale=0))
+    assert isinstance(dev._protocol, ReplayProtocol)
+    assert dev.get_properties(["a", "b", "c"], max_properties=2) == ["a", "b", "c"]
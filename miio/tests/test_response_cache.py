@@ -0,0 +1,125 @@
+import pytest
+
+from miio import DeviceException
+from miio.response_cache import MISSING, ResponseCache
+
+from .conftest import TOKEN, device_for
+from .dummies import DummyUDPDevice
+
+
+@pytest.fixture
+def monotonic(mocker):
+    return mocker.patch("miio.response_cache.monotonic", return_value=0)
+
+
+def test_get_put(monotonic):
+    cache = ResponseCache({"get_prop": 1})
+
+    assert cache.get("get_prop", ["power"]) is MISSING
+    cache.put("get_prop", ["power"], None, ["on"])
+    assert cache.get("get_prop", ["power"]) == ["on"]
+    assert cache.get("get_prop", ["mode"]) is MISSING
+    assert cache.get("get_prop", ["power"], {"sid": "1"}) is MISSING
+
+    monotonic.return_value = 1
+    assert cache.get("get_prop", ["power"]) is MISSING
+    assert not len(cache)
+
+
+def test_not_cacheable(monotonic):
+    cache = ResponseCache({"get_prop": 1})
+
+    cache.put("set_power", ["on"], None, ["ok"])
+    assert cache.get("set_power", ["on"]) is MISSING
+    assert not len(cache)
+
+
+def test_returns_copy(monotonic):
+    cache = ResponseCache({"get_prop": 1})
+    result = [{"value": 1}]
+    cache.put("get_prop", None, None, result)
+    result[0]["value"] = 2
+
+    cached = cache.get("get_prop")
+    assert cached == [{"value": 1}]
+    cached.append("modified")
+    assert cache.get("get_prop") == [{"value": 1}]
+
+
+def test_lru(monotonic):
+    cache = ResponseCache({"get_prop": 1}, maxsize=2)
+    cache.put("get_prop", ["a"], None, "a")
+    cache.put("get_prop", ["b"], None, "b")
+    cache.get("get_prop", ["a"])
+    cache.put("get_prop", ["c"], None, "c")
+
+    assert len(cache) == 2
+    assert cache.get("get_prop", ["b"]) is MISSING
+    assert cache.get("get_prop", ["a"]) == "a"
+
+
+def test_invalidate(monotonic):
+    cache = ResponseCache({"get_prop": 1, "miIO.info": 1})
+    cache.put("get_prop", None, None, 1)
+    cache.put("miIO.info", None, None, 2)
+
+    cache.invalidate("get_prop")
+    assert cache.get("get_prop") is MISSING
+    assert cache.get("miIO.info") == 2
+
+    cache.invalidate()
+    assert not len(cache)
+
+
+@pytest.fixture
+def device():
+    dummy = DummyUDPDevice(token=TOKEN)
+    dummy.handler = lambda payload: (
+        None if payload["method"] == "drop" else {"result": payload["params"]}
+    )
+    dummy.start()
+    dev = device_for(dummy, timeout=0.1, response_cache=ResponseCache())
+    yield dev, dummy
+    dummy.stop()
+
+
+def test_device_send_cached(device):
+    dev, dummy = device
+
+    assert dev.send("get_prop", ["power"]) == ["power"]
+    assert dev.send("get_prop", ["power"]) == ["power"]
+    assert len(dummy.requests) == 1
+
+    # writes clear the cache
+    dev.send("set_power", ["on"])
+    assert dev.send("get_prop", ["power"]) == ["power"]
+    assert [req["method"] for req in dummy.requests] == [
+        "get_prop",
+        "set_power",
+        "get_prop",
+    ]
+
+
+def test_device_send_failed_write_invalidates(device, mocker):
+    dev, dummy = device
+    mocker.patch.object(dev._protocol, "send_handshake")
+
+    dev.send("get_prop", ["power"])
+    with pytest.raises(DeviceException):
+        dev.send("drop", retry_count=0)
+
+    dev.send("get_prop", ["power"])
+    assert [req["method"] for req in dummy.requests] == ["get_prop", "drop", "get_prop"]
+
+
+@pytest.mark.asyncio
+async def test_device_async_send_cached(device):
+    dev, dummy = device
+
+    assert await dev.async_send("get_prop", ["power"]) == ["power"]
+    assert await dev.async_send("get_prop", ["power"]) == ["power"]
+    assert len(dummy.requests) == 1
+
+    await dev.async_send("set_power", ["on"])
+    await dev.async_send("get_prop", ["power"])
+    assert len(dummy.requests) == 3
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from miio import DeviceException
+from miio.metrics import MetricsRegistry
+from miio.miioprotocol import AsyncMiIOProtocol
+from miio.rtt import RTTEstimator
+
+from .conftest import protocol_for
+
+
+def _drop_nth(n):
+    """Return a handler echoing the params, except for the nth request."""
+    seen = []
+
+    def _handler(payload):
+        seen.append(payload)
+        if len(seen) == n:
+            return None
+        return {"result": payload["params"]}
+
+    return _handler
+
+
+def test_initial_timeout():
+    rtt = RTTEstimator(5)
+    assert rtt.rto == 5
+    assert rtt.timeout(3) == 5
+
+
+def test_update():
+    rtt = RTTEstimator(5)
+    rtt.update(0.1)
+    assert rtt.srtt == 0.1
+    assert rtt.rttvar == 0.05
+    assert rtt.rto == pytest.approx(0.3)
+
+    rtt.update(0.1)
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.0375)
+
+    rtt.reset()
+    assert rtt.rto == 5
+
+
+def test_clamping():
+    rtt = RTTEstimator(5, min_timeout=0.2)
+    rtt.update(0.001)
+    assert rtt.rto == 0.2
+
+    rtt.update(60)
+    assert rtt.rto == 5
+
+
+def test_backoff():
+    rtt = RTTEstimator(5)
+    rtt.update(0.1)
+    for attempt in range(1, 4):
+        expected = rtt.rto * 2**attempt
+        timeout = rtt.timeout(attempt)
+        assert expected * (1 - rtt.JITTER) <= timeout <= expected * (1 + rtt.JITTER)
+
+    assert rtt.timeout(10) == 5
+
+
+def test_adaptive_retry(dummy_udp_device, mocker):
+    """A single lost packet costs about the estimated timeout, not the maximum."""
+    dummy_udp_device.handler = _drop_nth(2)
+    proto = protocol_for(dummy_udp_device, timeout=5, adaptive_timeout=True)
+    handshake = mocker.patch.object(proto, "send_handshake")
+
+    assert proto.send("echo", [1]) == [1]
+    assert proto._rtt.srtt is not None
+
+    start = time.monotonic()
+    assert proto.send("echo", [2]) == [2]
+    assert time.monotonic() - start < 1
+
+    # the first retry does not require a new handshake
+    handshake.assert_not_called()
+    assert len(dummy_udp_device.requests) == 3
+
+
+def test_adaptive_no_response(dummy_udp_device, mocker):
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(dummy_udp_device, timeout=0.05, adaptive_timeout=True)
+    handshake = mocker.patch.object(proto, "send_handshake")
+
+    with pytest.raises(DeviceException, match="No response"):
+        proto.send("nothing", retry_count=2)
+
+    assert len(dummy_udp_device.requests) == 3
+    assert handshake.call_count == 1
+
+
+def test_pipelined_rtt(dummy_udp_device, mocker):
+    """Retransmitted requests are not sampled (Karn's rule)."""
+    dummy_udp_device.handler = _drop_nth(2)
+    registry = MetricsRegistry()
+    proto = protocol_for(
+        dummy_udp_device, timeout=0.1, metrics=registry, max_in_flight=2
+    )
+    mocker.patch.object(proto, "send_handshake")
+
+    requests = [("echo", [i]) for i in range(3)]
+    assert proto.send_many(requests, retry_count=1) == [[0], [1], [2]]
+
+    assert len(dummy_udp_device.requests) == 4
+    assert proto.metrics.rtt.count == 2
+
+
+@pytest.mark.asyncio
+async def test_async_adaptive_retry(dummy_udp_device, mocker):
+    dummy_udp_device.handler = _drop_nth(2)
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, timeout=5, adaptive_timeout=True
+    )
+    handshake = mocker.patch.object(proto, "async_send_handshake")
+
+    assert await proto.async_send("echo", [1]) == [1]
+
+    start = time.monotonic()
+    assert await proto.async_send("echo", [2]) == [2]
+    assert time.monotonic() - start < 1
+    handshake.assert_not_called()
@@ -0,0 +1,295 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from miio import RequestCancelledException
+from miio.scheduler import Priority, RequestScheduler, TokenBucket, request_priority
+
+from .conftest import TOKEN, device_for
+from .dummies import DummyUDPDevice
+
+
+def _wait_pending(scheduler, count):
+    deadline = time.monotonic() + 1
+    while scheduler.pending < count:
+        assert time.monotonic() < deadline, "requests were not queued"
+        time.sleep(0.001)
+
+
+def _start(scheduler, fn, *args, priority=Priority.Interactive, supersede=None):
+    """Run the function through the scheduler in a thread, returning the outcome."""
+    outcome = {}
+
+    def _run():
+        with request_priority(priority, supersede=supersede):
+            try:
+                outcome["result"] = scheduler.run(fn, *args)
+            except Exception as ex:
+                outcome["error"] = ex
+
+    thread = threading.Thread(target=_run)
+    thread.start()
+    return thread, outcome
+
+
+@pytest.fixture
+def blocked():
+    """Return a scheduler busy with a request until the event is set."""
+    scheduler = RequestScheduler()
+    release = threading.Event()
+    thread, _ = _start(scheduler, release.wait, 1)
+    deadline = time.monotonic() + 1
+    while not scheduler._busy:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+    yield scheduler, release
+    release.set()
+    thread.join()
+
+
+def test_run():
+    scheduler = RequestScheduler()
+    assert scheduler.run(lambda x, y=0: x + y, 1, y=2) == 3
+    assert scheduler.pending == 0
+
+
+def test_run_exception():
+    scheduler = RequestScheduler()
+
+    def _fail():
+        raise ValueError("fail")
+
+    with pytest.raises(ValueError):
+        scheduler.run(_fail)
+
+    # the scheduler keeps working after a failure
+    assert scheduler.run(lambda: 1) == 1
+
+
+def test_priority_order(blocked):
+    scheduler, release = blocked
+    order = []
+
+    threads = []
+    for name, priority in [
+        ("bulk", Priority.Bulk),
+        ("poll", Priority.Polling),
+        ("user", Priority.Interactive),
+        ("poll2", Priority.Polling),
+    ]:
+        thread, _ = _start(scheduler, order.append, name, priority=priority)
+        threads.append(thread)
+        _wait_pending(scheduler, len(threads))
+
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert order == ["user", "poll", "poll2", "bulk"]
+
+
+def test_supersede(blocked):
+    scheduler, release = blocked
+    order = []
+
+    old, old_outcome = _start(
+        scheduler, order.append, "old", priority=Priority.Polling, supersede="status"
+    )
+    _wait_pending(scheduler, 1)
+    other, _ = _start(scheduler, order.append, "other", priority=Priority.Polling)
+    _wait_pending(scheduler, 2)
+    new, new_outcome = _start(
+        scheduler, order.append, "new", priority=Priority.Polling, supersede="status"
+    )
+
+    old.join(1)
+    assert isinstance(old_outcome["error"], RequestCancelledException)
+    assert scheduler.pending == 2
+
+    release.set()
+    for thread in (other, new):
+        thread.join()
+
+    assert order == ["other", "new"]
+    assert "error" not in new_outcome
+
+
+def test_supersede_operation_in_progress():
+    """The newer operation cancels the remaining requests of the older one."""
+    scheduler = RequestScheduler()
+
+    with request_priority(Priority.Polling, supersede="status"):
+        # requests of the same operation do not cancel each other
+        assert scheduler.run(lambda: "old") == "old"
+        assert scheduler.run(lambda: "old") == "old"
+
+        new, new_outcome = _start(
+            scheduler,
+            lambda: "new",
+            priority=Priority.Polling,
+            supersede="status",
+        )
+        new.join()
+        assert new_outcome == {"result": "new"}
+
+        with pytest.raises(RequestCancelledException):
+            scheduler.run(lambda: "old")
+
+    assert scheduler.pending == 0
+
+
+def test_token_bucket(mocker):
+    monotonic = mocker.patch("miio.scheduler.monotonic", return_value=0)
+    bucket = TokenBucket(rate=2, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1)
+
+    monotonic.return_value = 10
+    assert bucket.reserve() == 0
+
+
+def test_rate_limit(mocker):
+    sleep = mocker.patch("miio.scheduler.sleep")
+    scheduler = RequestScheduler(rate=10, burst=1)
+
+    scheduler.run(lambda: None)
+    sleep.assert_not_called()
+
+    scheduler.run(lambda: None)
+    sleep.assert_called_once()
+    assert 0 < sleep.call_args.args[0] <= 0.1
+
+
+def test_device_send():
+    dummy = DummyUDPDevice(token=TOKEN).start()
+    try:
+        dummy.handler = lambda payload: {"result": payload["params"]}
+        scheduler = RequestScheduler()
+        dev = device_for(dummy, scheduler=scheduler)
+
+        with request_priority(Priority.Polling):
+            assert dev.send("echo", [1]) == [1]
+        assert scheduler.pending == 0
+    finally:
+        dummy.stop()
+
+
+@pytest.mark.asyncio
+async def test_async_run(blocked):
+    scheduler, release = blocked
+    order = []
+
+    async def _append(name):
+        order.append(name)
+
+    async def _run(name, priority):
+        with request_priority(priority):
+            await scheduler.async_run(_append, name)
+
+    tasks = []
+    for name, priority in [("bulk", Priority.Bulk), ("user", Priority.Interactive)]:
+        tasks.append(asyncio.create_task(_run(name, priority)))
+        while scheduler.pending < len(tasks):
+            await asyncio.sleep(0.001)
+
+    # the waiting tasks do not block the event loop
+    await asyncio.sleep(0.01)
+    assert order == []
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+    assert order == ["user", "bulk"]
+
+
+@pytest.mark.asyncio
+async def test_async_run_cancelled(blocked):
+    scheduler, release = blocked
+
+    task = asyncio.create_task(scheduler.async_run(asyncio.sleep, 0))
+    while scheduler.pending < 1:
+        await asyncio.sleep(0.001)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert scheduler.pending == 0
+
+    release.set()
+    assert await asyncio.wait_for(scheduler.async_run(asyncio.sleep, 0, 1), 1) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_rate_limit(mocker):
+    sleep = mocker.patch("miio.scheduler.asyncio.sleep")
+    scheduler = RequestScheduler(rate=10, burst=1)
+
+    async def _noop():
+        pass
+
+    await scheduler.async_run(_noop)
+    sleep.assert_not_called()
+
+    await scheduler.async_run(_noop)
+    sleep.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_device_async_send(mocker):
+    dummy = DummyUDPDevice(token=TOKEN).start()
+    try:
+        dummy.handler = lambda payload: {"result": payload["params"]}
+        scheduler = RequestScheduler()
+        async_run = mocker.spy(scheduler, "async_run")
+        dev = device_for(dummy, scheduler=scheduler)
+
+        assert await dev.async_send("echo", [1]) == [1]
+        async_run.assert_called_once()
+    finally:
+        dummy.stop()
+
+
+def test_supersede_get_properties():
+    dummy = DummyUDPDevice(token=TOKEN).start()
+    first_slice = threading.Event()
+    proceed = threading.Event()
+
+    def _handler(payload):
+        if payload["params"] == [0, 1] and not first_slice.is_set():
+            first_slice.set()
+            proceed.wait(1)
+        return {"result": payload["params"]}
+
+    try:
+        dummy.handler = _handler
+        dev = device_for(dummy, scheduler=RequestScheduler())
+        outcomes = {}
+
+        def _poll(name):
+            with request_priority(Priority.Polling, supersede="status"):
+                try:
+                    outcomes[name] = dev.get_properties(
+                        list(range(6)), max_properties=2
+                    )
+                except RequestCancelledException as ex:
+                    outcomes[name] = ex
+
+        old = threading.Thread(target=_poll, args=("old",))
+        old.start()
+        assert first_slice.wait(1)
+        new = threading.Thread(target=_poll, args=("new",))
+        new.start()
+        _wait_pending(dev._scheduler, 1)
+        proceed.set()
+        old.join()
+        new.join()
+    finally:
+        dummy.stop()
+
+    assert isinstance(outcomes["old"], RequestCancelledException)
+    assert outcomes["new"] == list(range(6))
@@ -0,0 +1,78 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from yaml import safe_load
+
+from miio import Device
+from miio.devtools.simulators.farm import SimulatorFarm, miio_setup
+from miio.devtools.simulators.miiosimulator import SimulatedMiio
+from miio.miioprotocol import AsyncMiIOProtocol
+
+from .conftest import TOKEN
+
+pytestmark = pytest.mark.asyncio
+
+
+def _echo(server, index):
+    server.add_method("echo", lambda payload: {"result": [index, *payload["params"]]})
+
+
+async def test_farm():
+    async with SimulatorFarm(5, _echo) as farm:
+        devices = farm.devices
+        assert len({device.port for device in devices}) == 5
+        assert len({device.device_id for device in devices}) == 5
+
+        protos = [
+            AsyncMiIOProtocol(device.ip, TOKEN, timeout=1, port=device.port)
+            for device in devices
+        ]
+        results = await asyncio.gather(
+            *(proto.async_send("echo", ["ping"]) for proto in protos)
+        )
+
+    assert results == [[idx, "ping"] for idx in range(5)]
+    assert not farm.devices
+
+
+async def test_farm_blocking_device():
+    """Blocking devices can handshake with simulated devices on any port."""
+    async with SimulatorFarm(2, model="zhimi.fan.v2") as farm:
+        device = farm.devices[1]
+        dev = Device(device.ip, TOKEN, timeout=1, port=device.port)
+        info = await asyncio.get_running_loop().run_in_executor(None, dev.info)
+
+    assert info.model == "zhimi.fan.v2"
+    assert dev._protocol._device_id == device.device_id.to_bytes(4, "big")
+
+
+async def test_farm_unique_addresses():
+    farm = SimulatorFarm(2, _echo, unique_addresses=True)
+    try:
+        await farm.start()
+    except OSError as ex:
+        pytest.skip(f"Unable to bind to the loopback addresses: {ex}")
+
+    try:
+        assert [device.ip for device in farm.devices] == ["127.0.0.2", "127.0.0.3"]
+        proto = AsyncMiIOProtocol("127.0.0.3", TOKEN, timeout=1)
+        assert await proto.async_send("echo", []) == [1]
+    finally:
+        await farm.stop()
+
+
+async def test_farm_miio_setup():
+    description = Path(__file__).parents[1] / "integrations/zhimi/fan/zhimi_fan.yaml"
+    dev = SimulatedMiio.parse_obj(safe_load(description.read_text()))
+    dev._model = dev.models[0].model
+
+    async with SimulatorFarm(2, miio_setup(dev), model=dev._model) as farm:
+        first, second = (
+            AsyncMiIOProtocol(device.ip, TOKEN, timeout=1, port=device.port)
+            for device in farm.devices
+        )
+        await first.async_send("set_power", ["off"])
+
+        assert await first.async_send("get_prop", ["power"]) == ["off"]
+        assert await second.async_send("get_prop", ["power"]) != ["off"]
@@ -0,0 +1,188 @@
+import threading
+
+import pytest
+
+from miio import DeviceException, InvalidTokenException
+from miio.miioprotocol import AsyncMiIOProtocol, MiIOProtocol
+from miio.transport import SharedTransport, get_shared_transport
+
+from .conftest import TOKEN, protocol_for
+
+
+@pytest.fixture
+def transport():
+    transport = SharedTransport(("127.0.0.1", 0))
+    yield transport
+    transport.close()
+
+
+def test_get_shared_transport():
+    assert get_shared_transport() is get_shared_transport()
+
+
+def test_send_shared_socket(dummy_udp_device, transport, mocker):
+    """All protocols sharing the transport use a single socket."""
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    protos = [protocol_for(dummy_udp_device, transport=transport) for _ in range(3)]
+    transport.start()
+    create_socket = mocker.patch("miio.miioprotocol.socket.socket")
+
+    for idx, proto in enumerate(protos):
+        assert proto.send("echo", [idx]) == [idx]
+
+    create_socket.assert_not_called()
+    assert not transport._pending
+
+
+def test_send_concurrent_routing(dummy_udp_device, transport):
+    """Out-of-order responses are routed to the right caller based on the id."""
+    barrier = threading.Barrier(2)
+
+    def _reply_in_reverse(payload):
+        if len(dummy_udp_device.requests) < 2:
+            return None
+        first, second = dummy_udp_device.requests
+        addr = dummy_udp_device.last_addr
+        dummy_udp_device.respond(second, addr, {"result": second["method"]})
+        dummy_udp_device.respond(first, addr, {"result": first["method"]})
+        return None
+
+    dummy_udp_device.handler = _reply_in_reverse
+    proto = protocol_for(dummy_udp_device, transport=transport)
+    results = {}
+
+    def _send(name):
+        barrier.wait()
+        results[name] = proto.send(name)
+
+    threads = [threading.Thread(target=_send, args=(n,)) for n in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": "a", "b": "b"}
+
+
+def test_late_response_dropped(dummy_udp_device, transport, mocker):
+    """Responses to timed out requests do not end up to the next request."""
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(dummy_udp_device, timeout=0.05, transport=transport)
+    mocker.patch.object(proto, "send_handshake")
+
+    with pytest.raises(DeviceException):
+        proto.send("timeout", retry_count=0)
+
+    assert not transport._pending
+    late = dummy_udp_device.requests[0]
+    dummy_udp_device.respond(late, dummy_udp_device.last_addr, {"result": "late"})
+
+    dummy_udp_device.handler = lambda payload: {"result": "current"}
+    assert proto.send("current") == "current"
+
+
+def test_send_invalid_token(dummy_udp_device, transport):
+    dummy_udp_device.response_token = bytes.fromhex(32 * "f")
+    proto = protocol_for(dummy_udp_device, transport=transport)
+
+    with pytest.raises(InvalidTokenException):
+        proto.send("info")
+
+
+def test_send_hostname(dummy_udp_device, transport):
+    _, port = dummy_udp_device.addr
+    proto = MiIOProtocol("localhost", TOKEN, timeout=1, transport=transport, port=port)
+    proto._discovered = True
+    proto._device_id = dummy_udp_device.DEVICE_ID
+
+    assert proto.send("info") == ["ok"]
+
+
+def test_closing_fails_pending(transport):
+    future = transport.register(("127.0.0.1", 1), msg_id=1, token=None)
+    transport.close()
+
+    with pytest.raises(OSError, match="closed"):
+        future.result(0)
+
+
+def test_concurrent_handshakes(dummy_udp_device, transport):
+    """All handshakes waiting for the same device get the response."""
+    dummy_udp_device.handler = lambda payload: None
+    first = MiIOProtocol._request_handshake(transport, *dummy_udp_device.addr)
+    second = MiIOProtocol._request_handshake(transport, *dummy_udp_device.addr)
+
+    assert first.result(1)[0].header.value.device_id == dummy_udp_device.DEVICE_ID
+    assert second.result(1)[0].header.value.device_id == dummy_udp_device.DEVICE_ID
+    assert not transport._pending
+
+
+def test_unregister_own_request(transport):
+    addr = ("127.0.0.1", 1)
+    first = transport.register(addr, msg_id=None, token=None)
+    second = transport.register(addr, msg_id=None, token=None)
+
+    transport.unregister(addr, None, first)
+    transport.close()
+
+    assert not first.done()
+    with pytest.raises(OSError, match="closed"):
+        second.result(0)
+
+
+def test_unparseable_response_oldest(dummy_udp_device, transport):
+    """Unparseable responses fail the oldest request waiting for the address."""
+    dummy_udp_device.handler = lambda payload: None
+    addr = transport.resolve(dummy_udp_device.addr)
+    token = bytes.fromhex(TOKEN)
+    first = transport.register(addr, msg_id=2, token=token)
+    second = transport.register(addr, msg_id=1, token=token)
+    third = transport.register(addr, msg_id=2, token=token)
+
+    transport._dispatch(b"garbage", addr)
+
+    assert first.exception(0) is not None
+    assert not second.done()
+    assert not third.done()
+
+    transport._dispatch(b"garbage", addr)
+    transport._dispatch(b"garbage", addr)
+
+    assert second.exception(0) is not None
+    assert third.exception(0) is not None
+    assert not transport._pending
+
+
+@pytest.mark.asyncio
+async def test_async_timeout_unregisters(dummy_udp_device, transport, mocker):
+    """Timed out requests do not stay registered to the transport."""
+    dummy_udp_device.handler = lambda payload: None
+    proto = protocol_for(
+        dummy_udp_device, AsyncMiIOProtocol, timeout=0.05, transport=transport
+    )
+    mocker.patch.object(proto, "send_handshake")
+
+    with pytest.raises(DeviceException):
+        await proto.async_send("timeout", retry_count=2)
+
+    assert len(dummy_udp_device.requests) == 3
+    assert not transport._pending
+
+
+@pytest.mark.asyncio
+async def test_async_send_shared(dummy_udp_device, transport):
+    dummy_udp_device.handler = lambda payload: {"result": payload["params"]}
+    proto = protocol_for(dummy_udp_device, AsyncMiIOProtocol, transport=transport)
+
+    assert await proto.async_send("echo", [1]) == [1]
+    assert not transport._pending
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_send_large_response(dummy_udp_device, transport, shared):
+    """Responses larger than a page are received in full."""
+    rooms = [[idx, f"room {idx}" * 10] for idx in range(200)]
+    dummy_udp_device.handler = lambda payload: {"result": rooms}
+    proto = protocol_for(dummy_udp_device, transport=transport if shared else None)
+
+    assert proto.send("get_room_mapping") == rooms
@@ -0,0 +1,332 @@
+"""Shared UDP transport for miIO protocol.
+
+By default, :class:`miio.miioprotocol.MiIOProtocol` creates a new socket for every
+request. When communicating with a large number of devices, the socket setup and the
+file descriptor churn become a measurable cost, and the responses arriving after the
+socket has been closed get lost.
+
+:class:`SharedTransport` owns a single UDP socket that is shared between all protocol
+instances using it. A background thread reads the incoming datagrams and routes them
+to the waiting requests based on the source address and the message id.
+"""
+
+import itertools
+import logging
+import socket
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Any
+
+import attr
+
+from .protocol import MessageCodec
+
+_LOGGER = logging.getLogger(__name__)
+
+Address = tuple[str, int]
+
+
+@attr.s(auto_attribs=True)
+class PendingRequest:
+    """Request waiting for a response."""
+
+    msg_id: int | None
+    token: bytes | None
+    tolerant: bool = False
+    #: Registration order, used to find the oldest request
+    seq: int = 0
+    future: Future = attr.ib(factory=Future)
+
+    def fail(self, ex: BaseException) -> None:
+        """Fail the request unless it is already done."""
+        try:
+            self.future.set_exception(ex)
+        except InvalidStateError:
+            pass
+
+
+class SharedTransport:
+    """UDP transport multiplexing requests over a single socket.
+
+    Requests are registered using the target address and the message id, the id being
+    None for handshakes. The responses are parsed in the reader thread and handed back
+    using :class:`concurrent.futures.Future`, which makes it usable for both blocking
+    and asyncio code. A handshake response is handed to all waiting handshakes, while
+    a response with an id is handed to the oldest request waiting for it. A response
+    that cannot be parsed fails the oldest request waiting for the address, as the
+    devices answer the requests in order.
+
+    Use :func:`get_shared_transport` to access the process-wide instance::
+
+        dev = Device(ip, token, transport=get_shared_transport())
+    """
+
+    READ_TIMEOUT = 0.5
+
+    def __init__(self, bind_addr: Address = ("0.0.0.0", 0)) -> None:  # noqa: S104
+        self._bind_addr = bind_addr
+        self._sock: socket.socket | None = None
+        self._reader: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._pending: dict[Address, dict[int | None, list[PendingRequest]]] = {}
+        self._resolved: dict[str, str] = {}
+        self._counter = itertools.count()
+
+    def start(self) -> None:
+        """Create the socket and start the reader thread."""
+        with self._lock:
+            if self._sock is not None:
+                return
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(self._bind_addr)
+            sock.settimeout(self.READ_TIMEOUT)
+            self._sock = sock
+            self._reader = threading.Thread(
+                target=self._read_loop,
+                args=(sock,),
+                name="miio-shared-transport",
+                daemon=True,
+            )
+            self._reader.start()
+            _LOGGER.debug("Started shared transport on %s", sock.getsockname())
+
+    def close(self) -> None:
+        """Close the socket and fail all pending requests."""
+        with self._lock:
+            sock, self._sock = self._sock, None
+            reader, self._reader = self._reader, None
+            pending, self._pending = self._pending, {}
+
+        if sock is None:
+            return
+
+        if reader is not None:
+            # wake up the reader blocking on recvfrom
+            try:
+                sock.sendto(b"", ("127.0.0.1", sock.getsockname()[1]))
+            except OSError:
+                pass
+            reader.join()
+        sock.close()
+
+        for requests in pending.values():
+            for waiting in requests.values():
+                for req in waiting:
+                    req.fail(OSError("Transport closed"))
+
+    @property
+    def is_running(self) -> bool:
+        """Return True if the transport has been started."""
+        return self._sock is not None
+
+    def resolve(self, addr: Address) -> Address:
+        """Return the address using IP instead of hostname for routing."""
+        host, port = addr
+        if host not in self._resolved:
+            self._resolved[host] = socket.gethostbyname(host)
+
+        return self._resolved[host], port
+
+    def register(
+        self,
+        addr: Address,
+        *,
+        msg_id: int | None,
+        token: bytes | None,
+        tolerant: bool = False,
+    ) -> Future:
+        """Register a request waiting for a response from the given address.
+
+        The returned future resolves to a tuple of the parsed message and the source
+        address.
+        """
+        self.start()
+        req = PendingRequest(
+            msg_id=msg_id, token=token, tolerant=tolerant, seq=next(self._counter)
+        )
+        with self._lock:
+            requests = self._pending.setdefault(self.resolve(addr), {})
+            requests.setdefault(msg_id, []).append(req)
+
+        return req.future
+
+    def unregister(
+        self, addr: Address, msg_id: int | None, future: Future | None = None
+    ) -> None:
+        """Remove the pending request, e.g., after a timeout.
+
+        :param future: Future returned by :func:`register`, or None to remove all
+            requests waiting for the given id
+        """
+        addr = self.resolve(addr)
+        with self._lock:
+            requests = self._pending.get(addr)
+            if requests is None or msg_id not in requests:
+                return
+
+            if future is not None:
+                requests[msg_id] = [
+                    r for r in requests[msg_id] if r.future is not future
+                ]
+            if future is None or not requests[msg_id]:
+                del requests[msg_id]
+            if not requests:
+                del self._pending[addr]
+
+    def sendto(self, data: bytes, addr: Address) -> None:
+        """Send the datagram to the given address.
+
+        :raises OSError: if the transport is not running or sending fails.
+        """
+        sock = self._sock
+        if sock is None:
+            raise OSError("Transport is not running")
+
+        sock.sendto(data, self.resolve(addr))
+
+    def request(
+        self,
+        addr: Address,
+        data: bytes,
+        *,
+        msg_id: int | None,
+        token: bytes | None,
+        tolerant: bool = False,
+    ) -> Future:
+        """Register a request and send it to the given address."""
+        future = self.register(addr, msg_id=msg_id, token=token, tolerant=tolerant)
+        try:
+            self.sendto(data, addr)
+        except OSError:
+            self.unregister(addr, msg_id, future)
+            raise
+
+        return future
+
+    def _read_loop(self, sock: socket.socket) -> None:
+        """Read datagrams until the transport is closed."""
+        # the messages are parsed before receiving the next one, so a single buffer
+        # fitting the longest possible message can be reused
+        buffer = bytearray(MessageCodec.MAX_LENGTH)
+        while self._sock is sock:
+            try:
+                size, addr = sock.recvfrom_into(buffer)
+            except TimeoutError:
+                continue
+            except OSError as ex:
+                if self._sock is sock:
+                    _LOGGER.warning("Error while reading from shared socket: %s", ex)
+                continue
+
+            if self._sock is not sock:
+                break
+
+            try:
+                self._dispatch(memoryview(buffer)[:size], addr[:2])
+            except Exception:
+                _LOGGER.exception("Unable to dispatch datagram from %s", addr)
+
+    def _pop_requests(self, addr: Address, msg_id: Any) -> list[PendingRequest]:
+        """Remove and return the requests the response with the given id is for.
+
+        All waiting handshakes share the response, while only the oldest request
+        is answered for other ids.
+        """
+        with self._lock:
+            requests = self._pending.get(addr)
+            if not requests or msg_id not in requests:
+                return []
+
+            waiting = requests[msg_id]
+            if msg_id is None or len(waiting) == 1:
+                del requests[msg_id]
+            else:
+                waiting = [waiting.pop(0)]
+            if not requests:
+                del self._pending[addr]
+
+            return waiting
+
+    def _pop_oldest_request(self, addr: Address) -> PendingRequest | None:
+        """Remove and return the oldest request waiting for the address."""
+        with self._lock:
+            requests = self._pending.get(addr)
+            if not requests:
+                return None
+
+            oldest = min(
+                (req for waiting in requests.values() for req in waiting),
+                key=lambda req: req.seq,
+            )
+            waiting = requests[oldest.msg_id]
+            waiting.remove(oldest)
+            if not waiting:
+                del requests[oldest.msg_id]
+            if not requests:
+                del self._pending[addr]
+
+            return oldest
+
+    def _dispatch(self, data: bytes | memoryview, addr: Address) -> None:
+        """Parse the response and hand it to the matching requests."""
+        with self._lock:
+            waiting = [
+                req
+                for requests in self._pending.get(addr, {}).values()
+                for req in requests
+            ]
+
+        if not waiting:
+            _LOGGER.debug("Dropping unexpected datagram from %s", addr)
+            return
+
+        token = next((r.token for r in waiting if r.token is not None), None)
+        tolerant = any(r.tolerant for r in waiting)
+        try:
+            m = MessageCodec.parse(data, token=token, tolerant=tolerant)
+        except Exception as ex:
+            # the id is not known, so the error is reported to the oldest request
+            # instead of leaving it to time out
+            oldest = self._pop_oldest_request(addr)
+            if oldest is None:
+                _LOGGER.debug("Dropping unparseable response from %s: %s", addr, ex)
+            else:
+                _LOGGER.debug(
+                    "Unable to parse response from %s (id: %s): %s",
+                    addr,
+                    oldest.msg_id,
+                    ex,
+                )
+                oldest.fail(ex)
+            return
+
+        msg_id = None
+        if m.data.length:
+            payload = m.data.value
+            msg_id = payload.get("id") if isinstance(payload, dict) else None
+
+        requests = self._pop_requests(addr, msg_id)
+        if not requests:
+            _LOGGER.debug("Dropping late response (id: %s) from %s", msg_id, addr)
+            return
+
+        for req in requests:
+            try:
+                req.future.set_result((m, addr))
+            except InvalidStateError:
+                _LOGGER.debug("Request for %s was cancelled", addr)
+
+
+_SHARED_TRANSPORT: SharedTransport | None = None
+_SHARED_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_shared_transport() -> SharedTransport:
+    """Return the process-wide shared transport, creating it if needed."""
+    global _SHARED_TRANSPORT
+    with _SHARED_TRANSPORT_LOCK:
+        if _SHARED_TRANSPORT is None:
+            _SHARED_TRANSPORT = SharedTransport()
+
+        return _SHARED_TRANSPORT